@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+
+from indexes import day_window, read_only
+
+
+def _cumulative(dense):
+    """Prefix sums along time with a leading zero row, so window sums are `c[b] - c[a]`"""
+    out = np.zeros((dense.shape[0] + 1,) + dense.shape[1:], dtype=dense.dtype)
+    np.cumsum(dense, axis=0, out=out[1:])
+    return read_only(out)
+
+
+# Timeline resolutions, finest first, with their (average) length in days
+BUCKETS = {"day": 1, "week": 7, "month": 30.44}
+
+
+def bucket_edges(first_day, stop_day, bucket):
+    """Day numbers of the day/week/month boundaries covering `[first_day, stop_day)`.
+
+    The first edge is on or before `first_day` and the last on or after
+    `stop_day`; weeks start on Monday and months on the 1st.
+    """
+    if bucket == "day":
+        return np.arange(first_day, stop_day + 1, dtype=np.int64)
+    if bucket == "week":
+        # Day 0 (1970-01-01) was a Thursday
+        monday = first_day - (first_day + 3) % 7
+        return np.arange(monday, stop_day + 7, 7, dtype=np.int64)
+    if bucket == "month":
+        first_month = np.datetime64(first_day, "D").astype("datetime64[M]")
+        last_month = np.datetime64(stop_day - 1, "D").astype("datetime64[M]")
+        months = np.arange(first_month, last_month + 2)
+        return months.astype("datetime64[D]").astype(np.int64)
+    raise ValueError(f"Unknown bucket: {bucket}")
+
+
+def choose_bucket(start, end, max_buckets=600):
+    """The finest bucket that keeps an inclusive date window within `max_buckets` bars"""
+    n_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    for bucket, days in BUCKETS.items():
+        if n_days / days <= max_buckets:
+            return bucket
+    return bucket
+
+
+class DailyCube:
+    """Dense day x category totals of one value column, stored as cumulative sums.
+
+    Built once from a `DateIndex`; the total of any inclusive date window, per
+    category or per day, is a difference of two prefix-sum rows.
+    """
+
+    def __init__(self, date_index, category_column, value_column):
+        self.date_column = date_index.date_column
+        self.category_column = category_column
+        self.value_column = value_column
+        self.first_day = date_index.first_day
+
+        frame = date_index.frame.iloc[: date_index.n_valid]
+        n_days = len(date_index.offsets) - 1
+        day = np.repeat(np.arange(n_days), np.diff(date_index.offsets))
+
+        categorical = pd.Categorical(frame[category_column])
+        self.categories = categorical.categories
+        n_cats = len(self.categories)
+        codes = categorical.codes.astype(np.int64)
+
+        values = frame[value_column].to_numpy(dtype=np.float64, na_value=0.0)
+        integral = bool(np.all(values == np.round(values))) and values.sum() < np.iinfo(np.int32).max
+        dtype = np.int32 if integral else np.float64
+
+        # Rows without a category still count towards the daily totals, as in groupby("date")
+        has_cat = codes >= 0
+        cell = day[has_cat] * n_cats + codes[has_cat]
+        size = n_days * n_cats
+        dense_values = np.bincount(cell, weights=values[has_cat], minlength=size).reshape(n_days, n_cats)
+        dense_counts = np.bincount(cell, minlength=size).reshape(n_days, n_cats)
+
+        self.cumulative_values = _cumulative(dense_values.astype(dtype))
+        self.cumulative_counts = _cumulative(dense_counts.astype(np.int32))
+        self.cumulative_total = _cumulative(np.bincount(day, weights=values, minlength=n_days).astype(dtype))
+        self.cumulative_rows = _cumulative(np.diff(date_index.offsets).astype(np.int32))
+
+    @property
+    def n_days(self):
+        return len(self.cumulative_total) - 1
+
+    def _window(self, start=None, end=None):
+        """Clip an inclusive date window to `[a, b)` day offsets into the cube"""
+        a = 0 if start is None else day_window(start, start)[0] - self.first_day
+        b = self.n_days if end is None else day_window(end, end)[1] - self.first_day
+        a = int(min(max(a, 0), self.n_days))
+        b = int(min(max(b, a), self.n_days))
+        return a, b
+
+    def _category_positions(self, categories):
+        positions = self.categories.get_indexer(list(categories))
+        return positions[positions >= 0]
+
+    def totals(self, start=None, end=None, categories=None):
+        """Per-category totals over the window, for categories with at least one row"""
+        a, b = self._window(start, end)
+        values = self.cumulative_values[b] - self.cumulative_values[a]
+        counts = self.cumulative_counts[b] - self.cumulative_counts[a]
+        present = counts > 0
+        if categories is not None:
+            selected = np.zeros_like(present)
+            selected[self._category_positions(categories)] = True
+            present &= selected
+        return pd.Series(values[present], index=self.categories[present], name=self.value_column)
+
+    def top(self, start=None, end=None, n=20, ascending=False, categories=None):
+        """The `n` largest (or smallest) category totals over the window, as a frame"""
+        return top_totals(self.totals(start, end, categories), self.category_column, n, ascending)
+
+    def dense(self, first_day, stop_day, categories=None):
+        """Day x category totals for the day numbers `[first_day, stop_day)`, one row per day.
+
+        Days outside the cube are zero, so cubes with different spans line up on
+        the same rows. Columns follow `categories` (zeros for ones not in the cube),
+        or the cube's own order when None.
+        """
+        a = int(np.clip(first_day - self.first_day, 0, self.n_days))
+        b = int(np.clip(stop_day - self.first_day, a, self.n_days))
+        values = np.diff(self.cumulative_values[a : b + 1], axis=0)
+        if categories is None:
+            columns = np.arange(len(self.categories))
+        else:
+            columns = self.categories.get_indexer(list(categories))
+        out = np.zeros((max(stop_day - first_day, 0), len(columns)), dtype=values.dtype)
+        found = columns >= 0
+        row = a + self.first_day - first_day
+        out[row : row + (b - a), found] = values[:, columns[found]]
+        return out
+
+    def window_totals(self, first_days, stop_days):
+        """Overall totals of many `[first, stop)` day-number windows at once"""
+        a = np.clip(np.asarray(first_days, dtype=np.int64) - self.first_day, 0, self.n_days)
+        b = np.clip(np.asarray(stop_days, dtype=np.int64) - self.first_day, 0, self.n_days)
+        return self.cumulative_total[np.maximum(a, b)] - self.cumulative_total[a]
+
+    def daily(self, start=None, end=None):
+        """Daily totals over the window for days that have rows, like groupby(date).sum()"""
+        a, b = self._window(start, end)
+        values = np.diff(self.cumulative_total[a : b + 1])
+        present = np.diff(self.cumulative_rows[a : b + 1]) > 0
+        days = (np.arange(a, b) + self.first_day).astype("datetime64[D]").astype("datetime64[ns]")
+        return pd.DataFrame({
+            self.date_column: days[present],
+            self.value_column: values[present],
+        })
+
+    def bucketed(self, start=None, end=None, bucket="day"):
+        """Totals per day, week or month over the window, for buckets that have rows.
+
+        Each row carries its bucket's start and (exclusive) end date; buckets
+        cut by the window only count the days inside it.
+        """
+        a, b = self._window(start, end)
+        if a == b:
+            edges = np.zeros(1, dtype=np.int64)
+        else:
+            edges = bucket_edges(a + self.first_day, b + self.first_day, bucket)
+        cut = np.clip(edges - self.first_day, a, b)
+        values = np.diff(self.cumulative_total[cut])
+        present = np.diff(self.cumulative_rows[cut]) > 0
+        dates = edges.astype("datetime64[D]").astype("datetime64[ns]")
+        return pd.DataFrame({
+            self.date_column: dates[:-1][present],
+            f"{self.date_column}_end": dates[1:][present],
+            self.value_column: values[present],
+        })
+
+
+class Timeline:
+    """City-wide totals of one dataset per day, week or month, each bucket read from its own cube.
+
+    `cubes` maps each bucket to the cube answering it and that cube's temporal
+    level (see `dataset.load_timeline`). Rows of a week-level cube are dated on
+    their Monday, so windows read from one are widened to whole weeks: its first
+    and last buckets count the full week rather than only the days inside.
+    """
+
+    def __init__(self, cubes, date_column):
+        self.cubes = cubes
+        self.date_column = date_column
+
+    @property
+    def n_days(self):
+        return sum(cube.n_days for cube, _ in set(self.cubes.values()))
+
+    def bucketed(self, start=None, end=None, bucket="day"):
+        """Totals per bucket over the window, for buckets that have rows, as `DailyCube.bucketed`"""
+        cube, temporal = self.cubes[bucket]
+        if temporal == "week":
+            if start is not None:
+                start = pd.Timestamp(start).normalize()
+                start -= pd.Timedelta(days=start.dayofweek)
+            if end is not None:
+                end = pd.Timestamp(end).normalize()
+                end += pd.Timedelta(days=6 - end.dayofweek)
+        return cube.bucketed(start, end, bucket).rename(columns={
+            cube.date_column: self.date_column,
+            f"{cube.date_column}_end": f"{self.date_column}_end",
+        })
+
+
+def top_totals(totals, category_column, n=20, ascending=False):
+    """The `n` largest (or smallest) entries of a category totals Series, as a frame"""
+    values = totals.to_numpy()
+    keys = values if ascending else -values
+    if n < len(keys):
+        # Partial selection, then order only the chosen few (ties by category name)
+        chosen = np.argpartition(keys, n - 1)[:n]
+        chosen = chosen[np.lexsort((chosen, keys[chosen]))]
+    else:
+        chosen = np.lexsort((np.arange(len(keys)), keys))
+    return pd.DataFrame({
+        category_column: totals.index[chosen],
+        totals.name: values[chosen],
+    })
+
+
+def spray_effect_table(cases_cube, spraying_cube, days=7):
+    """Case totals in the `days` before and after every spray date, in one vectorized pass.
+
+    Windows match the per-date analysis: before is [date - days, date - 1] and after
+    is [date, date + days - 1]. Spray dates and counts are the days and totals of
+    `spraying_cube`, so it must count spray events per day, as the spraying rollups do.
+    """
+    spraying = spraying_cube.daily()
+    spray_days = spraying[spraying_cube.date_column].to_numpy().astype("datetime64[D]").astype(np.int64)
+    before = cases_cube.window_totals(spray_days - days, spray_days)
+    after = cases_cube.window_totals(spray_days, spray_days + days)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change_pct = np.where(before != 0, (after - before) / before * 100, 0.0)
+    return pd.DataFrame({
+        "spray_date": spraying[spraying_cube.date_column].to_numpy(),
+        "spray_count": spraying[spraying_cube.value_column].to_numpy(),
+        "cases_before": before,
+        "cases_after": after,
+        "change": before - after,
+        "change_pct": change_pct,
+    })
+
+
+def lagged_correlations(leading, following, max_lag):
+    """Pearson cross-correlations of matching columns of two day x category matrices.
+
+    Row `max_lag + k` of the result correlates `following[t + k]` with `leading[t]`,
+    for lags `k` from -max_lag to max_lag. All columns are transformed at once
+    with one zero-padded FFT per matrix; as in the usual sample cross-correlation,
+    each lag is scaled by the full-length variances. Columns that never vary are NaN.
+    """
+    n_days = len(leading)
+    max_lag = min(max_lag, n_days - 1)
+    x = leading - leading.mean(axis=0)
+    y = following - following.mean(axis=0)
+    scale = np.sqrt((x ** 2).sum(axis=0) * (y ** 2).sum(axis=0))
+
+    # Padding to twice the length keeps the circular correlation from wrapping around
+    size = 1 << (2 * n_days - 1).bit_length()
+    spectrum = np.conj(np.fft.rfft(x, size, axis=0)) * np.fft.rfft(y, size, axis=0)
+    circular = np.fft.irfft(spectrum, size, axis=0)
+    lags = np.arange(-max_lag, max_lag + 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = circular[lags % size] / scale
+    correlations[:, scale == 0] = np.nan
+    return lags, correlations
+
+
+def spray_case_correlations(cases_cube, spraying_cube, start=None, end=None, max_lag=28):
+    """Lagged correlation of daily spray counts with daily cases, per neighborhood.
+
+    `spraying_cube` must count spray events per day (the spraying rollups do);
+    a table crediting a site's all-time count to one of its dates would skew
+    both the timing and the size of every series.
+    Returns the correlation curves (lags x neighborhoods) and a ranking of the
+    neighborhoods sprayed and with cases in the window, most negative response
+    first: the lowest correlation of cases 1 to `max_lag` days after spraying.
+    `lead_lag` is where the correlation peaks over all lags; a negative lag
+    means cases led the spraying.
+    """
+    first_day = min(cases_cube.first_day, spraying_cube.first_day) if start is None else day_window(start, start)[0]
+    stop_day = (
+        max(cases_cube.first_day + cases_cube.n_days, spraying_cube.first_day + spraying_cube.n_days)
+        if end is None else day_window(end, end)[1]
+    )
+    names = cases_cube.categories.intersection(spraying_cube.categories)
+    cases = cases_cube.dense(first_day, stop_day, names).astype(np.float64)
+    spraying = spraying_cube.dense(first_day, stop_day, names).astype(np.float64)
+    active = (cases.sum(axis=0) > 0) & (spraying.sum(axis=0) > 0)
+    names, cases, spraying = names[active], cases[:, active], spraying[:, active]
+
+    columns = {"neighborhood": names}
+    if len(cases) < 2 or not len(names):
+        curves = pd.DataFrame(index=pd.Index([], name="lag"), columns=names, dtype=np.float64)
+    else:
+        lags, correlations = lagged_correlations(spraying, cases, max_lag)
+        curves = pd.DataFrame(correlations, index=pd.Index(lags, name="lag"), columns=names)
+        after = correlations[lags > 0]
+        if len(after):
+            # All-NaN columns (a single spray day spread evenly) cannot respond
+            filled = np.where(np.isnan(after), np.inf, after)
+            response = filled.argmin(axis=0)
+            columns["response_lag"] = lags[lags > 0][response]
+            columns["response_corr"] = after[response, np.arange(len(names))]
+        peak = np.where(np.isnan(correlations), -np.inf, correlations).argmax(axis=0)
+        columns["lead_lag"] = lags[peak]
+        columns["lead_corr"] = correlations[peak, np.arange(len(names))]
+    columns["spray_count"] = spraying.sum(axis=0)
+    columns["cases"] = cases.sum(axis=0)
+    ranking = pd.DataFrame(columns)
+    if "response_corr" in ranking:
+        ranking = ranking.sort_values(["response_corr", "neighborhood"], na_position="last", kind="mergesort")
+    return curves, ranking.reset_index(drop=True)
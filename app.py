@@ -1,20 +1,41 @@
+import functools
+import os
+import uuid
+
 import streamlit as st
 import pandas as pd
-import folium
-from folium.plugins import HeatMap
-import altair as alt
-from streamlit_folium import st_folium
 from datetime import datetime
-from folium import plugins
+
+from dataset import load_cases as read_cases, load_mosquito as read_mosquito
+from indexes import to_day
+from aggregates import bucket_edges, choose_bucket, spray_case_correlations, spray_effect_table
+from spatial import CaseLocationTree, heatmap_frames
+from caching import LRUCache
+from maps import (
+    DEFAULT_CENTER, DEFAULT_ZOOM, MAP_SYNC_GROUP, create_heatmap_map, create_tile_map, create_timelapse_map, render_map,
+    show_rendered_map,
+)
+from utils import bounds_box, recenter_bounds, update_heatmap_data
+from query import FilterSpec, RawCaseIndex
+from joins import NeighborhoodJoin
+from filters import clip_to_year, drop_incomplete
+from charts import density_overlay_chart, lag_correlation_chart, neighborhood_bar_chart, timeline_chart
+from profiling import RerunProfiler
+from snapshot import SnapshotStore
+from tiles import EMPTY_TILE, TILES_URL, load_manifest as read_tile_manifest, tile_period, tile_url
 
 # ========================================== Session State Initialization ==========================================
 # Initialize session state for map synchronization
 if "map_center" not in st.session_state:
-    st.session_state.map_center = [23.12303, 119.9416977]  # Default center coordinates
+    st.session_state.map_center = list(DEFAULT_CENTER)  # Default center coordinates
 if "map_zoom" not in st.session_state:
-    st.session_state.map_zoom = 10  # Default zoom level
+    st.session_state.map_zoom = DEFAULT_ZOOM  # Default zoom level
 if "last_map" not in st.session_state:
     st.session_state.last_map = None  # To track which map was last updated
+if "map_views" not in st.session_state:
+    st.session_state.map_views = {}  # Last center/zoom/bounds reported by each map
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # Tags this session's lines in the timing log
 
 # Initialize session state for date selection mode and selected dates
 if "date_filter_mode" not in st.session_state:
@@ -35,20 +56,86 @@ if 'spraying_selected_specific_date' not in st.session_state:
 # ========================================== Page Configuration ==========================================
 st.set_page_config(layout="wide")
 
+# ========================================== Profiling ==========================================
+# Times each stage of this rerun; set DASHBOARD_PROFILE_LOG to append every rerun as a JSON line
+def new_profiler(scope="app"):
+    return RerunProfiler(
+        session_id=st.session_state.session_id,
+        log_path=os.environ.get("DASHBOARD_PROFILE_LOG"),
+        measure_payloads=st.session_state.get("show_rerun_timings", False),
+        scope=scope,
+    )
+
+profiler = new_profiler()
+
 # ========================================== Data Loading ==========================================
 @st.cache_resource
-def load_data():
-    data = pd.read_csv("data/dengue_fever_cases_by_area.csv")
-    dengue_spraying = pd.read_csv("data/dengue_spray_count_by_area.csv")
-    
-    # Convert latitude and longitude to float
-    for df in [data, dengue_spraying]:
-        df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
-        df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
+def get_snapshot_store():
+    # One prepared, read-only snapshot for every session; a watcher thread swaps in a new one when data/ changes
+    return SnapshotStore().start()
 
-    return data, dengue_spraying
-
-data, dengue_spraying = load_data()
+@st.cache_resource
+def get_map_cache():
+    # Shared by every session: rendered maps are keyed on everything that shapes them
+    return LRUCache(max_entries=64, max_bytes=256 * 1024 * 1024, ttl=30 * 60, sizeof=lambda r: r.nbytes)
+
+# Lazily built parts of a snapshot are cached per data version; the underscored
+# snapshot argument is not hashed, the version stands in for it
+@st.cache_resource(max_entries=2)
+def load_raw_cases(version, data_dir):
+    # Only loaded once a session switches the cases heatmap to individual cases
+    return RawCaseIndex(read_cases(data_dir))
+
+@st.cache_resource(max_entries=2)
+def load_neighborhood_join(version, _snapshot):
+    # Mosquito surveys joined with the snapshot's cases and spraying; None until the ETL has written them
+    mosquito = read_mosquito(_snapshot.data_dir)
+    return None if mosquito is None else NeighborhoodJoin(mosquito, _snapshot.cases, _snapshot.spraying)
+
+@st.cache_resource(max_entries=2)
+def load_case_location_tree(version, _snapshot):
+    return CaseLocationTree(_snapshot.cases, "cases")
+
+@st.cache_data(max_entries=32, ttl=3600)
+def load_timelapse_frames(version, _snapshot, spec, bucket, zoom):
+    """Grid-aggregated cases heatmap frames for a filter spec, built on first request"""
+    cases = _snapshot.queries.run(spec).cases
+    start, end = clip_to_year(spec.start, spec.end, spec.selected_year)
+    edges = bucket_edges(to_day(start), to_day(end) + 1, bucket)
+    labels = [str(day) for day in edges[:-1].astype("datetime64[D]")]
+    return heatmap_frames(cases, "cases", "diagnosis_date", edges, zoom), labels
+
+@st.cache_data(ttl=60)
+def load_tile_manifest():
+    # Re-read every minute, so tiles rendered while the app runs are picked up
+    return read_tile_manifest()
+
+@st.cache_data(max_entries=2)
+def load_spray_effect_table(version, _snapshot):
+    return spray_effect_table(_snapshot.cases_cube, _snapshot.spraying_cube)
+
+@st.cache_data(max_entries=32, ttl=3600)
+def load_spray_correlations(version, _snapshot, start, end, max_lag):
+    """Lagged spray/case correlations of every neighborhood over one date window"""
+    return spray_case_correlations(_snapshot.cases_cube, _snapshot.spraying_cube, start, end, max_lag)
+
+with profiler.stage("load_data") as stage:
+    # Read once: this whole rerun, fragment reruns included, uses the same snapshot
+    snapshot = get_snapshot_store().current
+    data, dengue_spraying = snapshot.cases, snapshot.spraying
+    cases_index, spraying_index = snapshot.cases_index, snapshot.spraying_index
+    cases_cube, spraying_cube = snapshot.cases_cube, snapshot.spraying_cube
+    cases_timeline, spraying_timeline = snapshot.cases_timeline, snapshot.spraying_timeline
+    cases_spatial_index, spraying_spatial_index = snapshot.cases_spatial_index, snapshot.spraying_spatial_index
+    stage.rows_out = len(data) + len(dengue_spraying)
+    stage.details["version"] = snapshot.version
+
+def clamp_date(value, low, high):
+    """A picked date moved into [low, high], keeping its type"""
+    if value is None or pd.isnull(low) or pd.isnull(high):
+        return value
+    clamped = min(max(pd.Timestamp(value), low), high)
+    return clamped.to_pydatetime() if isinstance(value, datetime) else clamped.date()
 
 # ========================================== Sidebar ==========================================
 st.sidebar.title("Taiwan City Dengue Fever Cases Filter")
@@ -56,6 +143,14 @@ st.sidebar.markdown("Use the filters below to customize the dengue fever cases a
 
 # Checkbox to enable map synchronization
 enable_sync = st.sidebar.checkbox("Enable Map Synchronization", value=True)
+sync_mode = st.sidebar.radio(
+    "Synchronize Maps In", ("Browser", "Server"), index=0, horizontal=True, key="map_sync_mode",
+    disabled=not enable_sync,
+    help="Browser: maps follow each other instantly without a rerun, and their heatmaps keep the detail "
+    "of the view they were built for. Server: every move reruns the maps, which re-bins them for the new view.",
+)
+# Browser-synced maps report nothing back, so panning them costs no server work
+browser_sync = enable_sync and sync_mode == "Browser"
 
 # Year filter
 years = ["Total"] + sorted(data["year"].dropna().unique())
@@ -64,6 +159,20 @@ selected_year = st.sidebar.selectbox("Select Year", years)
 # Heatmap radius selector
 radius = st.sidebar.slider("Select Heatmap Radius", min_value=1, max_value=50, value=25)
 
+# Cases heatmap source: the daily location rollup, or every case aggregated per request
+case_source = st.sidebar.radio(
+    "Cases Heatmap Source", ("Daily Rollup", "Individual Cases"), index=0, key="case_source",
+    help="Individual Cases bins each reported case at its own coordinates on every request.",
+)
+
+# Pre-rendered heatmap tiles, offered once tiles.py has been run
+tile_manifest = load_tile_manifest()
+use_heatmap_tiles = tile_manifest is not None and st.sidebar.checkbox(
+    "Use Pre-rendered Heatmap Tiles", value=True, key="use_heatmap_tiles",
+    help="Whole-history, whole-year and whole-month windows are drawn from the tiles rendered by tiles.py. "
+    "Other windows, neighborhood filters and individual cases use live heatmaps.",
+)
+
 # Neighborhood filter
 neighborhoods = ["All"] + sorted(data["neighborhood"].dropna().unique())
 selected_neighborhoods = st.sidebar.multiselect("Select Neighborhoods", neighborhoods, default=["All"])
@@ -87,21 +196,30 @@ num_neighborhoods = st.sidebar.number_input(
 date_filter_mode = st.sidebar.radio("Filter Dengue Cases by Date", ("Date Range", "Specific Date", "7-Day Window"), index=0)
 
 # Date filter mode selector for dengue spraying
-spraying_date_filter_mode = st.sidebar.radio("Filter Dengue Spraying by Date", ("Date Range", "Specific Date"), index=0)
-
-# Convert date columns to datetime
-data["diagnosis_date"] = pd.to_datetime(data["diagnosis_date"], errors="coerce")
-dengue_spraying["date"] = pd.to_datetime(dengue_spraying["date"], errors="coerce")
+spraying_date_filter_mode = st.sidebar.radio(
+    "Filter Dengue Spraying by Date", ("Date Range", "Specific Date"), index=0, key="spraying_date_filter_mode"
+)
 
 # Determine min and max dates for date picker
-min_date_cases = data["diagnosis_date"].min()
-max_date_cases = data["diagnosis_date"].max()
-min_date_spraying = dengue_spraying["date"].min()
-max_date_spraying = dengue_spraying["date"].max()
+min_date_cases = cases_index.min_date
+max_date_cases = cases_index.max_date
+min_date_spraying = spraying_index.min_date
+max_date_spraying = spraying_index.max_date
 
 min_date = min(min_date_cases, min_date_spraying)
 max_date = max(max_date_cases, max_date_spraying)
 
+# A reloaded dataset may span other dates: keep this session's picks inside the new ranges
+if st.session_state.get("dataset_version", snapshot.version) != snapshot.version:
+    ss = st.session_state
+    ss.selected_date_range = [clamp_date(d, min_date, max_date) for d in ss.selected_date_range]
+    ss.selected_specific_date = clamp_date(ss.selected_specific_date, min_date, max_date)
+    ss.spraying_selected_date_range = [
+        clamp_date(d, min_date_spraying, max_date_spraying) for d in ss.spraying_selected_date_range
+    ]
+    ss.spraying_selected_specific_date = clamp_date(ss.spraying_selected_specific_date, min_date_spraying, max_date_spraying)
+st.session_state.dataset_version = snapshot.version
+
 # Handle date selection based on filter mode for dengue cases
 if date_filter_mode == "Date Range":
     if not st.session_state.selected_date_range:
@@ -236,109 +354,138 @@ if date_filter_mode == "7-Day Window":
     specific_date = None
 
 # ========================================== Helper Functions ==========================================
-def create_spraying_markers(data):
-    """Create markers for spraying locations with custom icons"""
-    markers = []
-    for _, row in data.iterrows():
-        try:
-            lat = float(row['latitude'])
-            lon = float(row['longitude'])
-            if pd.notnull(lat) and pd.notnull(lon):
-                popup_text = f"Spraying Count: {row['spray_count']}<br>Date: {row['date']}"
-                icon = folium.Icon(color='blue', icon='tint', prefix='fa')
-                marker = folium.Marker(
-                    location=[lat, lon],
-                    popup=popup_text,
-                    icon=icon
-                )
-                markers.append(marker)
-        except (ValueError, TypeError):
-            continue
-    return markers
-
-def create_heatmap_map(data, map_type="cases", radius=25, include_spray_markers=False, spray_data=None, is_effect_analysis=False):
-    m = folium.Map(
-        location=st.session_state.map_center,
-        zoom_start=st.session_state.map_zoom,
-        control_scale=True,
+def map_view(map_id):
+    """Center and zoom a map is rendered with: the shared view when synced, else its own last view"""
+    view = st.session_state.map_views.get(map_id)
+    if enable_sync or view is None:
+        return st.session_state.map_center, st.session_state.map_zoom
+    return view["center"], view["zoom"]
+
+def visible_bounds(map_id, center, zoom):
+    """The map's last reported viewport, moved to where it is about to be rendered.
+
+    None when the map is synced in the browser, as its viewport is never reported.
+    """
+    view = st.session_state.map_views.get(map_id)
+    if browser_sync or not view or not view.get("bounds"):
+        return None
+    bounds = view["bounds"]
+    if None in (bounds["_southWest"]["lat"], bounds["_northEast"]["lat"]):
+        return None
+    return recenter_bounds(bounds, view["zoom"], center, zoom)
+
+def date_key(value):
+    return None if value is None else pd.Timestamp(value).date().isoformat()
+
+def bounds_key(bounds):
+    if bounds is None:
+        return None
+    return tuple(round(bounds[corner][axis], 4) for corner in ("_southWest", "_northEast") for axis in ("lat", "lng"))
+
+def create_culled_map(map_id, data, spatial_index, spray_data=None, filter_key=None, **kwargs):
+    """Get a heatmap map fed only with the rows inside that map's viewport plus a margin.
+
+    Maps come from the shared map cache; `filter_key` must identify the filters
+    that produced `data` and `spray_data`.
+    """
+    center, zoom = map_view(map_id)
+    bounds = visible_bounds(map_id, center, zoom)
+    if browser_sync:
+        kwargs["sync_group"] = MAP_SYNC_GROUP
+    key = (
+        snapshot.version,
+        kwargs.get("map_type", "cases"),
+        filter_key,
+        kwargs.get("radius"),
+        kwargs.get("is_effect_analysis", False),
+        kwargs.get("include_spray_markers", False),
+        kwargs.get("sync_group"),
+        tuple(round(c, 5) for c in center),
+        zoom,
+        bounds_key(bounds),
     )
 
-    if map_type == "cases":
-        if spraying_date_filter_mode == "Specific Date" and is_effect_analysis:
-            # Two colors: one for first 3 days, one for next 4 days
-            first_color = '#ff0000'  # Red for first 3 days
-            second_color = '#0000ff'  # Blue for next 4 days
-            
-            dates = sorted(data["diagnosis_date"].dt.date.unique())
-            mid_point = dates[3] if len(dates) > 3 else dates[-1]
-            
-            # First 3 days
-            first_period = data[data["diagnosis_date"].dt.date < mid_point]
-            if not first_period.empty:
-                heat_data = first_period[["latitude", "longitude", "cases"]].dropna().values.tolist()
-                rgb = tuple(int(first_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-                HeatMap(
-                    heat_data,
-                    radius=radius,
-                    gradient={
-                        0.4: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.2)", 
-                        0.65: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.5)", 
-                        0.9: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.8)"
-                    },
-                    min_opacity=0.2,
-                    max_opacity=0.8,
-                    name="First 3 Days"
-                ).add_to(m)
-            
-            # Next 4 days
-            second_period = data[data["diagnosis_date"].dt.date >= mid_point]
-            if not second_period.empty:
-                heat_data = second_period[["latitude", "longitude", "cases"]].dropna().values.tolist()
-                rgb = tuple(int(second_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-                HeatMap(
-                    heat_data,
-                    radius=radius,
-                    gradient={
-                        0.4: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.2)", 
-                        0.65: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.5)", 
-                        0.9: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.8)"
-                    },
-                    min_opacity=0.2,
-                    max_opacity=0.8,
-                    name="Next 4 Days"
-                ).add_to(m)
-            
-            folium.LayerControl().add_to(m)
-        else:
-            # Single color (blue) heatmap with proper gradient for density
-            heat_data = data[["latitude", "longitude", "cases"]].dropna().values.tolist()
-            HeatMap(
-                heat_data,
-                radius=radius,
-                gradient={0.4: "rgba(0,0,255,0.2)", 0.65: "rgba(0,0,255,0.5)", 0.9: "rgba(0,0,255,0.8)"},
-                min_opacity=0.2,
-                max_opacity=0.8,
-            ).add_to(m)
-
-    elif map_type == "spraying":
-        # Single color (blue) heatmap for spraying data with proper gradient
-        heat_data = data[["latitude", "longitude", "spray_count"]].dropna().values.tolist()
-        HeatMap(
-            heat_data,
-            radius=radius,
-            gradient={0.4: "rgba(0,0,255,0.2)", 0.65: "rgba(0,0,255,0.5)", 0.9: "rgba(0,0,255,0.8)"},
-            min_opacity=0.2,
-            max_opacity=0.8,
-        ).add_to(m)
-
-    if include_spray_markers and spray_data is not None:
-        for marker in create_spraying_markers(spray_data):
-            marker.add_to(m)
+    with profiler.stage(f"{map_id}.build", rows_in=len(data)) as stage:
+        stage.details["cache"] = "hit"
 
+        def build():
+            visible = update_heatmap_data(data, bounds, spatial_index)
+            visible_spray = None
+            if spray_data is not None:
+                visible_spray = update_heatmap_data(spray_data, bounds, spraying_spatial_index)
+            stage.rows_out = len(visible)
+            stage.details["cache"] = "miss"
+            return render_map(create_heatmap_map(visible, spray_data=visible_spray, location=center, zoom=zoom, **kwargs))
+
+        m = get_map_cache().get_or_create(key, build)
+        stage.payload(get_map_cache().size_of(key))
     return m
 
+def create_tiled_map(map_id, layer, start=None, end=None):
+    """A map of the pre-rendered tiles showing exactly the date window, with its caption; None without tiles"""
+    if not use_heatmap_tiles:
+        return None
+    period = tile_period(tile_manifest["layers"].get(layer), start, end)
+    if period is None:
+        return None
+    with profiler.stage(f"{map_id}.tiles"):
+        url, tile_radius = tile_url(tile_manifest, layer, period, radius)
+        center, zoom = map_view(map_id)
+        m = render_map(create_tile_map(
+            url, tile_manifest["zooms"], tile_manifest["layers"][layer]["bounds"], f"{TILES_URL}/{EMPTY_TILE}",
+            location=center, zoom=zoom, sync_group=MAP_SYNC_GROUP if browser_sync else None,
+        ))
+    return m, f"Pre-rendered tiles for {period} at radius {tile_radius}"
+
+def show_map(m, map_id, **kwargs):
+    """Display a rendered map; a cache hit sends its stored script as is, with no folium work or lock"""
+    if browser_sync:
+        # The maps follow each other in the browser; reading their view back would only cause reruns
+        kwargs["returned_objects"] = []
+    with profiler.stage(f"{map_id}.st_folium"):
+        return show_rendered_map(m, **kwargs)
+
+def open_spray_date():
+    """Show the before/after maps for the spray date clicked in the batch table"""
+    selection = st.session_state.spray_effect_table.selection
+    if selection.rows:
+        spray_date = load_spray_effect_table(snapshot.version, snapshot)["spray_date"].iloc[selection.rows[0]]
+        st.session_state.spraying_date_filter_mode = "Specific Date"
+        st.session_state.spraying_selected_specific_date = spray_date.date()
+        # The table sits in a fragment; the sidebar it just changed needs a full rerun
+        st.session_state.spray_date_opened = True
+
+def section(name):
+    """Run a main-panel section as an `st.fragment`, so its own widgets rerun only that section.
+
+    The sidebar filters feed every section, so changing them still reruns the
+    whole script. A fragment-only rerun is timed in a record of its own.
+    """
+    def decorate(render):
+        @st.fragment
+        @functools.wraps(render)
+        def fragment(*args, **kwargs):
+            global profiler
+            if not profiler.finished:
+                return render(*args, **kwargs)
+            profiler = new_profiler(scope=name)
+            try:
+                result = render(*args, **kwargs)
+            finally:
+                record = profiler.finish()
+            if st.session_state.get("show_rerun_timings"):
+                st.caption(f"Section rerun ({name}): {record['total_ms']:.0f} ms")
+            return result
+        return fragment
+    return decorate
+
 def handle_map_sync(map_output, current_map_id):
     if map_output and map_output.get("center") and map_output.get("zoom") is not None:
+        st.session_state.map_views[current_map_id] = {
+            "center": [map_output["center"]["lat"], map_output["center"]["lng"]],
+            "zoom": map_output["zoom"],
+            "bounds": map_output.get("bounds"),
+        }
         if enable_sync:
             if st.session_state.last_map != current_map_id:
                 st.session_state.map_center = [
@@ -348,272 +495,521 @@ def handle_map_sync(map_output, current_map_id):
                 st.session_state.map_zoom = map_output["zoom"]
                 st.session_state.last_map = current_map_id
 
+# The sidebar state, in the shape benchmark.py replays
+profiler.context = {
+    "year": selected_year if selected_year == "Total" else int(selected_year),
+    "date_filter_mode": date_filter_mode,
+    "start_date": date_key(start_date),
+    "end_date": date_key(end_date),
+    "spraying_date_filter_mode": spraying_date_filter_mode,
+    "spraying_start_date": date_key(spraying_start_date),
+    "spraying_end_date": date_key(spraying_end_date),
+    "neighborhoods": list(selected_neighborhoods),
+    "filter_heatmap_by_neighborhood": filter_heatmap_by_neighborhood,
+    "radius": radius,
+    "case_source": case_source,
+    "heatmap_tiles": use_heatmap_tiles,
+    "sync_mode": sync_mode if enable_sync else None,
+    "zoom": st.session_state.map_zoom,
+    "num_neighborhoods": int(num_neighborhoods),
+    "sort_order": sort_order,
+}
+
 # ========================================== Main Panel ==========================================
 st.title("Taiwan City Dengue Fever Cases and Spraying Heatmaps")
 
 if start_date and end_date:
-    # Filter dengue fever cases
-    if selected_year != "Total":
-        filtered_cases = data[data["year"] == selected_year]
-    else:
-        filtered_cases = data.copy()
-
-    if date_filter_mode in ["Date Range", "7-Day Window"]:
-        # Convert dates to Timestamp for comparison
-        start_date = pd.Timestamp(start_date)
-        end_date = pd.Timestamp(end_date)
-        filtered_cases = filtered_cases[
-            (filtered_cases["diagnosis_date"] >= start_date) & 
-            (filtered_cases["diagnosis_date"] <= end_date)
-        ]
-    else:
-        filtered_cases = filtered_cases[filtered_cases["diagnosis_date"].dt.date == start_date]
+    filter_spec = FilterSpec.from_sidebar(
+        selected_year, date_filter_mode, start_date, end_date,
+        spraying_date_filter_mode, spraying_start_date, spraying_end_date,
+        selected_neighborhoods, filter_heatmap_by_neighborhood,
+    )
+    with profiler.stage("filter", rows_in=len(data) + len(dengue_spraying)) as stage:
+        query_result = snapshot.queries.run(filter_spec)
+        filtered_cases, filtered_spraying = query_result.cases, query_result.spraying
+        stage.rows_out = len(filtered_cases) + len(filtered_spraying)
 
-    if "All" not in selected_neighborhoods and filter_heatmap_by_neighborhood:
-        filtered_cases = filtered_cases[filtered_cases["neighborhood"].isin(selected_neighborhoods)]
+    # The normalized filters identify each map's inputs in the map cache
+    cases_filter_key = (filter_spec.year, filter_spec.start, filter_spec.end, filter_spec.neighborhoods)
+    spraying_filter_key = (filter_spec.spraying_start, filter_spec.spraying_end, filter_spec.neighborhoods)
 
-    # Filter dengue spraying data based on spraying date filters
-    if spraying_start_date and spraying_end_date:
-        if spraying_date_filter_mode == "Date Range":
-            filtered_spraying = dengue_spraying[
-                (dengue_spraying["date"] >= spraying_start_date) & (dengue_spraying["date"] <= spraying_end_date)
-            ]
-        else:
-            filtered_spraying = dengue_spraying[dengue_spraying["date"].dt.date == spraying_start_date]
-    else:
-        # Default to original spraying data if no dates are selected
-        filtered_spraying = dengue_spraying.copy()
-
-    # Apply other filters to dengue spraying data
-    if "All" not in selected_neighborhoods and filter_heatmap_by_neighborhood:
-        filtered_spraying = filtered_spraying[filtered_spraying["neighborhood"].isin(selected_neighborhoods)]
-
-    # Create columns for side-by-side heatmaps
-    col1, col2 = st.columns(2)
-
-    # Dengue Fever Cases Heatmap
-    with col1:
-        st.subheader("Dengue Fever Cases Heatmap")
-        if not filtered_cases.empty:
-            filtered_cases = filtered_cases.dropna(subset=["latitude", "longitude", "cases"])
-            if not filtered_cases.empty:
-                m1 = create_heatmap_map(filtered_cases, map_type="cases", radius=radius)
-                map1 = st_folium(m1, width=800, height=600)
+    @section("maps")
+    def heatmap_section():
+        # Create columns for side-by-side heatmaps
+        col1, col2 = st.columns(2)
+
+        # Dengue Fever Cases Heatmap
+        with col1:
+            st.subheader("Dengue Fever Cases Heatmap")
+            cases_tiles = None
+            if case_source == "Daily Rollup" and filter_spec.neighborhoods is None:
+                cases_tiles = create_tiled_map(
+                    "map1", "cases", *clip_to_year(filter_spec.start, filter_spec.end, filter_spec.selected_year)
+                )
+            if cases_tiles is not None:
+                m1, tiles_caption = cases_tiles
+                map1 = show_map(m1, "map1", width=800, height=600)
                 handle_map_sync(map1, "map1")
+                st.caption(tiles_caption)
+            elif case_source == "Individual Cases":
+                raw_cases = load_raw_cases(snapshot.version, snapshot.data_dir)
+                with profiler.stage("raw_cases.aggregate", rows_in=len(raw_cases)) as stage:
+                    # Only the cells in and around the viewport are counted
+                    raw_center, raw_zoom = map_view("map1")
+                    raw_bounds = visible_bounds("map1", raw_center, raw_zoom)
+                    case_cells = raw_cases.heatmap(
+                        filter_spec, raw_zoom, None if raw_bounds is None else bounds_box(raw_bounds, 0.5)
+                    )
+                    stage.rows_out = len(case_cells)
+                if not case_cells.empty:
+                    m1 = create_culled_map(
+                        "map1", case_cells, None,
+                        filter_key=("raw",) + cases_filter_key, map_type="cases", radius=radius,
+                    )
+                    map1 = show_map(m1, "map1", width=800, height=600)
+                    handle_map_sync(map1, "map1")
+                else:
+                    st.warning("No dengue cases data available for the selected filters.")
+            elif not filtered_cases.empty:
+                cases = drop_incomplete(filtered_cases, ["latitude", "longitude", "cases"])
+                if not cases.empty:
+                    m1 = create_culled_map(
+                        "map1", cases, cases_spatial_index,
+                        filter_key=cases_filter_key, map_type="cases", radius=radius,
+                    )
+                    map1 = show_map(m1, "map1", width=800, height=600)
+                    handle_map_sync(map1, "map1")
+                else:
+                    st.warning("No valid dengue cases data available after removing rows with missing location or case values.")
             else:
-                st.warning("No valid dengue cases data available after removing rows with missing location or case values.")
-        else:
-            st.warning("No dengue cases data available for the selected filters.")
+                st.warning("No dengue cases data available for the selected filters.")
 
-    # Dengue Spraying Heatmap
-    with col2:
-        st.subheader("Dengue Spraying Heatmap")
-        if not filtered_spraying.empty:
-            filtered_spraying = filtered_spraying.dropna(subset=["latitude", "longitude", "spray_count"])
-            if not filtered_spraying.empty:
-                m2 = create_heatmap_map(filtered_spraying, map_type="spraying", radius=radius)
-                map2 = st_folium(m2, width=800, height=600)
+        # Dengue Spraying Heatmap
+        with col2:
+            st.subheader("Dengue Spraying Heatmap")
+            spraying_tiles = None
+            if filter_spec.neighborhoods is None:
+                spraying_tiles = create_tiled_map("map2", "spraying", filter_spec.spraying_start, filter_spec.spraying_end)
+            if spraying_tiles is not None:
+                m2, tiles_caption = spraying_tiles
+                map2 = show_map(m2, "map2", width=800, height=600)
                 handle_map_sync(map2, "map2")
+                st.caption(tiles_caption)
+            elif not filtered_spraying.empty:
+                spraying = drop_incomplete(filtered_spraying, ["latitude", "longitude", "spray_count"])
+                if not spraying.empty:
+                    m2 = create_culled_map(
+                        "map2", spraying, spraying_spatial_index,
+                        filter_key=spraying_filter_key, map_type="spraying", radius=radius,
+                    )
+                    map2 = show_map(m2, "map2", width=800, height=600)
+                    handle_map_sync(map2, "map2")
+                else:
+                    st.warning("No valid dengue spraying data available after removing rows with missing location or spray count values.")
             else:
-                st.warning("No valid dengue spraying data available after removing rows with missing location or spray count values.")
-        else:
-            st.warning("No dengue spraying data available for the selected filters.")
-
-    # Dengue Fever Cases by Neighborhood
-    st.subheader("Dengue Fever Cases by Neighborhood")
-    city_cases = filtered_cases.groupby("neighborhood")["cases"].sum().reset_index()
-    city_cases = city_cases.sort_values(by="cases", ascending=(sort_order == "Ascending")).head(num_neighborhoods)
-
-    bar_chart = (
-        alt.Chart(city_cases)
-        .mark_bar()
-        .encode(
-            x=alt.X("neighborhood", sort=None, title="Neighborhood"),
-            y=alt.Y("cases", title="Cases"),
-            color=alt.Color("cases", scale=alt.Scale(scheme="blues")),
+                st.warning("No dengue spraying data available for the selected filters.")
+
+    heatmap_section()
+
+    @section("timelapse")
+    def timelapse_section():
+        # Dengue Fever Cases Time-Lapse: every frame ships in one payload and plays without reruns
+        st.subheader("Dengue Fever Cases Time-Lapse")
+        if st.checkbox(
+            "Show Time-Lapse", key="show_timelapse",
+            help="Play the cases heatmap over the selected date window in the browser.",
+        ):
+            lapse_step = st.selectbox("Time-Lapse Step", ["Auto", "Day", "Week", "Month"], key="timelapse_step")
+            lapse_start, lapse_end = clip_to_year(filter_spec.start, filter_spec.end, filter_spec.selected_year)
+            if lapse_start > lapse_end or filtered_cases.empty:
+                st.warning("No dengue cases data available for the selected filters.")
+            else:
+                lapse_bucket = (
+                    choose_bucket(lapse_start, lapse_end, max_buckets=120) if lapse_step == "Auto" else lapse_step.lower()
+                )
+                lapse_center, lapse_zoom = st.session_state.map_center, st.session_state.map_zoom
+                with profiler.stage("timelapse.build", rows_in=len(filtered_cases)) as stage:
+                    key = ("timelapse", snapshot.version, filter_spec, lapse_bucket, radius, tuple(round(c, 5) for c in lapse_center), lapse_zoom)
+
+                    def build_timelapse():
+                        frames, labels = load_timelapse_frames(snapshot.version, snapshot, filter_spec, lapse_bucket, lapse_zoom)
+                        stage.rows_out = sum(len(frame) for frame in frames)
+                        return render_map(
+                            create_timelapse_map(frames, labels, radius=radius, location=lapse_center, zoom=lapse_zoom)
+                        )
+
+                    m_lapse = get_map_cache().get_or_create(key, build_timelapse)
+                    stage.payload(get_map_cache().size_of(key))
+                    stage.details["bucket"] = lapse_bucket
+                st.caption(f"One frame per {lapse_bucket} from {lapse_start.date()} to {lapse_end.date()}")
+                with profiler.stage("timelapse.st_folium"):
+                    # Nothing is read back, so playing and panning never trigger a rerun
+                    show_rendered_map(m_lapse, returned_objects=[], width=1600, height=600, key="map_timelapse")
+
+    timelapse_section()
+
+    @section("charts")
+    def chart_section():
+        # Dengue Fever Cases by Neighborhood
+        st.subheader("Dengue Fever Cases by Neighborhood")
+        with profiler.stage("chart.neighborhoods", rows_in=len(cases_cube.categories)) as stage:
+            city_cases = query_result.top_neighborhoods(n=num_neighborhoods, ascending=(sort_order == "Ascending"))
+            bar_chart = neighborhood_bar_chart(city_cases)
+
+            st.altair_chart(bar_chart, use_container_width=True)
+            stage.rows_out = len(city_cases)
+            stage.payload(lambda: len(bar_chart.to_json()))
+
+        # Spraying Timeline Chart (Interactive, x-axis zoom only)
+        st.subheader("Spraying Timeline Chart")
+
+        # The charts get day, week or month totals, picked from the window so the spec stays small
+        timeline_col1, timeline_col2 = st.columns([3, 1])
+        with timeline_col1:
+            timeline_start, timeline_end = st.slider(
+                "Timeline Window",
+                min_value=min_date.date(),
+                max_value=max_date.date(),
+                value=(min_date.date(), max_date.date()),
+                format="YYYY-MM-DD",
+                key="timeline_window",
+            )
+        with timeline_col2:
+            timeline_resolution = st.selectbox("Resolution", ["Auto", "Day", "Week", "Month"], key="timeline_resolution")
+        bucket = choose_bucket(timeline_start, timeline_end) if timeline_resolution == "Auto" else timeline_resolution.lower()
+
+        with profiler.stage("chart.timeline", rows_in=spraying_timeline.n_days + cases_timeline.n_days) as stage:
+            # Week buckets come from the week rollups, so they always cover whole weeks
+            spraying_timeline_data = spraying_timeline.bucketed(timeline_start, timeline_end, bucket)
+
+            # Dengue Fever Timeline Chart (Interactive, x-axis zoom only)
+            st.subheader("Dengue Fever Cases Timeline Chart")
+            st.caption(f"{bucket.capitalize()} totals from {timeline_start} to {timeline_end}")
+
+            dengue_timeline_data = cases_timeline.bucketed(timeline_start, timeline_end, bucket)
+            combined_chart = timeline_chart(spraying_timeline_data, dengue_timeline_data, bucket)
+            stage.details["bucket"] = bucket
+
+            st.altair_chart(combined_chart, use_container_width=True)
+            stage.rows_out = len(spraying_timeline_data) + len(dengue_timeline_data)
+            stage.payload(lambda: len(combined_chart.to_json()))
+
+    chart_section()
+
+    @section("correlation")
+    def correlation_section():
+        st.subheader("Spraying and Cases Cross-Correlation")
+        corr_start, corr_end = clip_to_year(filter_spec.start, filter_spec.end, filter_spec.selected_year)
+        corr_col1, corr_col2 = st.columns([3, 1])
+        with corr_col1:
+            max_lag = st.slider("Maximum Lag (days)", min_value=7, max_value=90, value=28, key="correlation_max_lag")
+        with corr_col2:
+            corr_top = st.number_input("Neighborhoods to Plot", min_value=1, max_value=20, value=5, key="correlation_top")
+        if corr_start > corr_end:
+            st.warning("No dengue cases data available for the selected filters.")
+            return
+
+        with profiler.stage("correlation", rows_in=cases_cube.n_days + spraying_cube.n_days) as stage:
+            # Every neighborhood at once, cached per window and lag, so only the first request pays for the FFTs
+            curves, ranking = load_spray_correlations(
+                snapshot.version, snapshot, corr_start.date(), corr_end.date(), max_lag
+            )
+            if filter_spec.neighborhoods is not None:
+                ranking = ranking[ranking["neighborhood"].isin(filter_spec.neighborhoods)]
+            stage.rows_out = len(ranking)
+
+        n_days = (corr_end - corr_start).days + 1
+        threshold = 2 / n_days ** 0.5
+        st.caption(
+            f"Daily spray counts against daily cases from {corr_start.date()} to {corr_end.date()}, per neighborhood "
+            f"sprayed and with cases in the window. Neighborhoods are ranked by their most negative correlation "
+            f"1 to {max_lag} days after spraying; correlations within ±{threshold:.3f} are indistinguishable from noise."
         )
-        .properties(width=800, height=400)
-        .configure_axisX(labelAngle=-45)
-        .interactive()
-    )
-
-    st.altair_chart(bar_chart, use_container_width=True)
-
-    # Spraying Timeline Chart (Interactive, x-axis zoom only)
-    st.subheader("Spraying Timeline Chart")
-
-    spraying_timeline_data = dengue_spraying.groupby("date")["spray_count"].sum().reset_index()
-    
-    # Create x-axis zoom selection
-    zoom = alt.selection_interval(
-        bind='scales',
-        encodings=['x']  # Only allow zooming on x-axis
-    )
-
-    timeline_chart = (
-        alt.Chart(spraying_timeline_data)
-        .mark_bar()
-        .encode(
-            x=alt.X("date:T", title="Date"),
-            y=alt.Y("spray_count:Q", title="Total Spray Count"),
-            tooltip=["date:T", "spray_count:Q"],
+        if ranking.empty:
+            st.warning("No neighborhood was both sprayed and had cases in the selected window.")
+            return
+        st.dataframe(
+            ranking,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "neighborhood": st.column_config.TextColumn("Neighborhood"),
+                "response_lag": st.column_config.NumberColumn("Response Lag (days)"),
+                "response_corr": st.column_config.NumberColumn("Response Correlation", format="%.3f"),
+                "lead_lag": st.column_config.NumberColumn("Peak Lag (days)"),
+                "lead_corr": st.column_config.NumberColumn("Peak Correlation", format="%.3f"),
+                "spray_count": st.column_config.NumberColumn("Spray Count"),
+                "cases": st.column_config.NumberColumn("Cases"),
+            },
         )
-        .properties(width=800, height=400)
-        .add_params(zoom)  # Add zoom selection
-    )
-
-    # Dengue Fever Timeline Chart (Interactive, x-axis zoom only)
-    st.subheader("Dengue Fever Cases Timeline Chart")
-
-    dengue_timeline_data = data.groupby("diagnosis_date")["cases"].sum().reset_index()
-
-    dengue_timeline_chart = (
-        alt.Chart(dengue_timeline_data)
-        .mark_bar(color="orange")
-        .encode(
-            x=alt.X("diagnosis_date:T", title="Date"),
-            y=alt.Y("cases:Q", title="Total Cases"),
-            tooltip=["diagnosis_date:T", "cases:Q"],
+        st.altair_chart(
+            lag_correlation_chart(curves[ranking["neighborhood"].head(int(corr_top))], threshold),
+            use_container_width=True,
         )
-        .properties(width=800, height=400)
-        .add_params(zoom)  # Share the same zoom selection
-    )
-
-    # Combine charts with shared x-axis scale
-    combined_chart = alt.vconcat(timeline_chart, dengue_timeline_chart).resolve_scale(x='shared')
-
-    st.altair_chart(combined_chart, use_container_width=True)
-
-    # Add new section for before/after comparison
-    st.header("Spraying Effect Analysis")
-    st.markdown("Compare dengue cases distribution before and after spraying")
 
-    if spraying_date_filter_mode == "Specific Date":
-        effect_col1, effect_col2 = st.columns(2)
-        
-        # Convert specific date to timestamp for calculations
-        spray_date = pd.Timestamp(spraying_specific_date)
+    correlation_section()
+
+    @section("mosquito")
+    def mosquito_section():
+        st.subheader("Mosquito Density (Breteau Index)")
+        density_join = load_neighborhood_join(snapshot.version, snapshot)
+        if density_join is None:
+            st.info(
+                "No mosquito density data: run `python etl.py --dataset mosquito` to write "
+                "`data/mosquito_densities.csv`; the dashboard picks it up without a restart."
+            )
+            return
+        density_step = st.selectbox("Resolution", ["Week", "Day"], key="density_resolution")
+        density_start, density_end = clip_to_year(filter_spec.start, filter_spec.end, filter_spec.selected_year)
+        if density_start > density_end:
+            st.warning("No mosquito surveys for the selected filters.")
+            return
+        with profiler.stage("mosquito.join", rows_in=sum(len(t) for t in density_join.tables.values())) as stage:
+            density_series = density_join.series(filter_spec, density_step.lower())
+            density_table = density_join.neighborhoods(filter_spec)
+            stage.rows_out = len(density_series) + len(density_table)
+        if density_table.empty:
+            st.warning("No mosquito surveys for the selected filters.")
+            return
+        st.caption(
+            f"Surveys, cases and spraying from {density_start.date()} to {density_end.date()}, matched on "
+            "administrative area and neighborhood; the Breteau index is the mean over the surveys of each "
+            f"{density_step.lower()}."
+        )
+        st.altair_chart(density_overlay_chart(density_series, density_step.lower()), use_container_width=True)
+        st.dataframe(
+            density_table,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "administrative_area_code": st.column_config.TextColumn("Area Code"),
+                "neighborhood": st.column_config.TextColumn("Neighborhood"),
+                "surveys": st.column_config.NumberColumn("Surveys"),
+                "breteau_index": st.column_config.NumberColumn("Mean Breteau Index", format="%.1f"),
+                "container_index": st.column_config.NumberColumn("Mean Container Index", format="%.1f"),
+                "cases": st.column_config.NumberColumn("Cases"),
+                "spray_count": st.column_config.NumberColumn("Spray Count"),
+            },
+        )
 
-        with effect_col1:
-            st.subheader("7 Days Before Spraying")
-            before_end = spray_date - pd.Timedelta(days=1)
-            before_start = before_end - pd.Timedelta(days=6)
-            
-            before_cases = data[
-                (data["diagnosis_date"] >= before_start) &
-                (data["diagnosis_date"] <= before_end)
-            ]
+    mosquito_section()
+
+    @section("effect")
+    def effect_section():
+        # Opening a spray date from the table changes the sidebar, which every section reads
+        if st.session_state.pop("spray_date_opened", False):
+            # st.rerun() ends this run before the end of the script, where its timings are logged
+            profiler.finish()
+            st.rerun()
+        spray_sites = drop_incomplete(filtered_spraying, ["latitude", "longitude", "spray_count"])
+
+        # Add new section for before/after comparison
+        st.header("Spraying Effect Analysis")
+        st.markdown("Compare dengue cases distribution before and after spraying")
+
+        st.subheader("All Spray Dates")
+        st.caption("Cases in the 7 days before and after every spray date. Sort by any column; select a row to open its maps below.")
+        with profiler.stage("effect.table") as stage:
+            spray_effects = load_spray_effect_table(snapshot.version, snapshot)
+            st.dataframe(
+                spray_effects,
+                key="spray_effect_table",
+                on_select=open_spray_date,
+                selection_mode="single-row",
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "spray_date": st.column_config.DateColumn("Spray Date", format="YYYY-MM-DD"),
+                    "spray_count": st.column_config.NumberColumn("Spray Count"),
+                    "cases_before": st.column_config.NumberColumn("Cases (7 days before)"),
+                    "cases_after": st.column_config.NumberColumn("Cases (7 days after)"),
+                    "change": st.column_config.NumberColumn("Change in Cases"),
+                    "change_pct": st.column_config.NumberColumn("Change (%)", format="%.1f%%"),
+                },
+            )
+            stage.rows_out = len(spray_effects)
+
+        if spraying_date_filter_mode == "Specific Date":
+            effect_scope = st.radio(
+                "Effect Scope", ("City-wide", "Near spray sites"), horizontal=True,
+                help="Count every case in the city, or only cases within a radius of the day's spray sites.",
+            )
+            if effect_scope == "Near spray sites":
+                effect_radius = st.slider("Radius Around Spray Sites (m)", min_value=100, max_value=3000, value=500, step=100)
+
+            effect_col1, effect_col2 = st.columns(2)
             
-            if not before_cases.empty:
-                m_before = create_heatmap_map(
-                    before_cases, 
-                    map_type="cases", 
-                    radius=radius,
-                    is_effect_analysis=True,
-                    include_spray_markers=True,
-                    spray_data=filtered_spraying
-                )
-                map_before = st_folium(m_before, width=800, height=600, key="map_before")
-                handle_map_sync(map_before, "map_before")
-                
-                # Simplified legend with just two colors
-                st.markdown("---")
-                st.markdown("### Color Legend - Days Before Spraying")
-                legend_cols = st.columns(2)
+            # Convert specific date to timestamp for calculations
+            spray_date = pd.Timestamp(spraying_specific_date)
+
+            with effect_col1:
+                st.subheader("7 Days Before Spraying")
+                before_end = spray_date - pd.Timedelta(days=1)
+                before_start = before_end - pd.Timedelta(days=6)
                 
-                with legend_cols[0]:
-                    st.markdown(
-                        '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
-                        '<div style="width: 20px; height: 20px; background-color: #ff0000; '
-                        'margin-right: 10px; border-radius: 3px;"></div>'
-                        '<div>First 3 Days</div>'
-                        '</div>',
-                        unsafe_allow_html=True
-                    )
+                before_cases = cases_index.slice(before_start, before_end)
                 
-                with legend_cols[1]:
-                    st.markdown(
-                        '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
-                        '<div style="width: 20px; height: 20px; background-color: #0000ff; '
-                        'margin-right: 10px; border-radius: 3px;"></div>'
-                        '<div>Next 4 Days</div>'
-                        '</div>',
-                        unsafe_allow_html=True
+                if not before_cases.empty:
+                    m_before = create_culled_map(
+                        "map_before",
+                        before_cases,
+                        cases_spatial_index,
+                        filter_key=(date_key(before_start), date_key(before_end), spraying_filter_key),
+                        map_type="cases", 
+                        radius=radius,
+                        is_effect_analysis=True,
+                        include_spray_markers=True,
+                        spray_data=spray_sites
                     )
+                    map_before = show_map(m_before, "map_before", width=800, height=600, key="map_before")
+                    handle_map_sync(map_before, "map_before")
+                    
+                    # Simplified legend with just two colors
+                    st.markdown("---")
+                    st.markdown("### Color Legend - Days Before Spraying")
+                    legend_cols = st.columns(2)
+                    
+                    with legend_cols[0]:
+                        st.markdown(
+                            '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
+                            '<div style="width: 20px; height: 20px; background-color: #ff0000; '
+                            'margin-right: 10px; border-radius: 3px;"></div>'
+                            '<div>First 3 Days</div>'
+                            '</div>',
+                            unsafe_allow_html=True
+                        )
+                    
+                    with legend_cols[1]:
+                        st.markdown(
+                            '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
+                            '<div style="width: 20px; height: 20px; background-color: #0000ff; '
+                            'margin-right: 10px; border-radius: 3px;"></div>'
+                            '<div>Next 4 Days</div>'
+                            '</div>',
+                            unsafe_allow_html=True
+                        )
+                    
+                    st.info(f"Showing cases from {before_start.date()} to {before_end.date()}")
+                else:
+                    st.warning("No cases data available for the period before spraying.")
+                    
+            with effect_col2:
+                st.subheader("7 Days After Spraying")
+                after_start = spray_date
+                after_end = after_start + pd.Timedelta(days=6)
                 
-                st.info(f"Showing cases from {before_start.date()} to {before_end.date()}")
-            else:
-                st.warning("No cases data available for the period before spraying.")
+                after_cases = cases_index.slice(after_start, after_end)
                 
-        with effect_col2:
-            st.subheader("7 Days After Spraying")
-            after_start = spray_date
-            after_end = after_start + pd.Timedelta(days=6)
-            
-            after_cases = data[
-                (data["diagnosis_date"] >= after_start) &
-                (data["diagnosis_date"] <= after_end)
-            ]
-            
-            if not after_cases.empty:
-                m_after = create_heatmap_map(
-                    after_cases, 
-                    map_type="cases", 
-                    radius=radius,
-                    is_effect_analysis=True,
-                    include_spray_markers=True,  # Add this parameter
-                    spray_data=filtered_spraying  # Add this parameter
-                )
-                map_after = st_folium(m_after, width=800, height=600, key="map_after")
-                handle_map_sync(map_after, "map_after")
-                
-                # Add legend below the map
-                st.markdown("---")
-                st.markdown("### Color Legend - Days After Spraying")
-                legend_cols = st.columns(2)
-                
-                with legend_cols[0]:
-                    st.markdown(
-                        '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
-                        '<div style="width: 20px; height: 20px; background-color: #ff0000; '
-                        'margin-right: 10px; border-radius: 3px;"></div>'
-                        '<div>First 3 Days</div>'
-                        '</div>',
-                        unsafe_allow_html=True
+                if not after_cases.empty:
+                    m_after = create_culled_map(
+                        "map_after",
+                        after_cases,
+                        cases_spatial_index,
+                        filter_key=(date_key(after_start), date_key(after_end), spraying_filter_key),
+                        map_type="cases", 
+                        radius=radius,
+                        is_effect_analysis=True,
+                        include_spray_markers=True,  # Add this parameter
+                        spray_data=spray_sites  # Add this parameter
                     )
-                
-                with legend_cols[1]:
-                    st.markdown(
-                        '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
-                        '<div style="width: 20px; height: 20px; background-color: #0000ff; '
-                        'margin-right: 10px; border-radius: 3px;"></div>'
-                        '<div>Next 4 Days</div>'
-                        '</div>',
-                        unsafe_allow_html=True
+                    map_after = show_map(m_after, "map_after", width=800, height=600, key="map_after")
+                    handle_map_sync(map_after, "map_after")
+                    
+                    # Add legend below the map
+                    st.markdown("---")
+                    st.markdown("### Color Legend - Days After Spraying")
+                    legend_cols = st.columns(2)
+                    
+                    with legend_cols[0]:
+                        st.markdown(
+                            '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
+                            '<div style="width: 20px; height: 20px; background-color: #ff0000; '
+                            'margin-right: 10px; border-radius: 3px;"></div>'
+                            '<div>First 3 Days</div>'
+                            '</div>',
+                            unsafe_allow_html=True
+                        )
+                    
+                    with legend_cols[1]:
+                        st.markdown(
+                            '<div style="display: flex; align-items: center; margin-bottom: 5px;">'
+                            '<div style="width: 20px; height: 20px; background-color: #0000ff; '
+                            'margin-right: 10px; border-radius: 3px;"></div>'
+                            '<div>Next 4 Days</div>'
+                            '</div>',
+                            unsafe_allow_html=True
+                        )
+                    
+                    st.info(f"Showing cases from {after_start.date()} to {after_end.date()}")
+                else:
+                    st.warning("No cases data available for the period after spraying.")
+
+            # Add statistics about the effect
+            st.subheader("Effect Statistics")
+            with profiler.stage("effect.statistics", rows_in=len(spray_sites)):
+                if effect_scope == "Near spray sites":
+                    # One batched BallTree query for all of the day's sites, then window totals per location
+                    case_tree = load_case_location_tree(snapshot.version, snapshot)
+                    neighbors = case_tree.neighbors(
+                        spray_sites["latitude"].to_numpy(), spray_sites["longitude"].to_numpy(), effect_radius
                     )
+                    site_before, before_count = case_tree.totals_near(neighbors, *cases_index.positions(before_start, before_end))
+                    site_after, after_count = case_tree.totals_near(neighbors, *cases_index.positions(after_start, after_end))
+                    before_count, after_count = int(before_count), int(after_count)
+                    scope_label = f" within {effect_radius} m"
+                else:
+                    before_count = before_cases['cases'].sum()
+                    after_count = after_cases['cases'].sum()
+                    scope_label = ""
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.metric(f"Total Cases{scope_label} (7 days before)", before_count)
+            
+            with col2:
+                st.metric(f"Total Cases{scope_label} (7 days after)", after_count)
                 
-                st.info(f"Showing cases from {after_start.date()} to {after_end.date()}")
-            else:
-                st.warning("No cases data available for the period after spraying.")
+            with col3:
+                effect = before_count - after_count
+                delta_percentage = ((after_count - before_count) / before_count * 100) if before_count != 0 else 0
+                st.metric("Change in Cases", effect, f"{delta_percentage:.1f}%")
+
+            if effect_scope == "Near spray sites" and not spray_sites.empty:
+                st.markdown(f"**Cases within {effect_radius} m of each spray site**")
+                st.dataframe(
+                    pd.DataFrame({
+                        "neighborhood": spray_sites["neighborhood"].to_numpy(),
+                        "meeting_location": spray_sites["meeting_location"].to_numpy(),
+                        "spray_count": spray_sites["spray_count"].to_numpy(),
+                        "cases_before": site_before.astype(int),
+                        "cases_after": site_after.astype(int),
+                    }),
+                    hide_index=True,
+                    use_container_width=True,
+                )
+        else:
+            st.warning("Please select a specific date for spraying to view the before/after analysis.")
+
+    effect_section()
 
-        # Add statistics about the effect
-        st.subheader("Effect Statistics")
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            before_count = before_cases['cases'].sum()
-            st.metric("Total Cases (7 days before)", before_count)
-        
-        with col2:
-            after_count = after_cases['cases'].sum()
-            st.metric("Total Cases (7 days after)", after_count)
-            
-        with col3:
-            effect = before_count - after_count
-            delta_percentage = ((after_count - before_count) / before_count * 100) if before_count != 0 else 0
-            st.metric("Change in Cases", effect, f"{delta_percentage:.1f}%")
-    else:
-        st.warning("Please select a specific date for spraying to view the before/after analysis.")
 
 else:
     st.warning("Please select a valid date filter.")
+
+# ========================================== Diagnostics ==========================================
+with st.sidebar.expander("Cache Statistics"):
+    st.json({
+        "dataset": get_snapshot_store().stats(),
+        "maps": get_map_cache().stats(),
+        "queries": snapshot.queries.cache.stats(),
+    })
+
+st.sidebar.checkbox(
+    "Show Rerun Timings", key="show_rerun_timings",
+    help="Time each stage of the rerun, including the size of what is sent to the browser.",
+)
+record = profiler.finish()
+if st.session_state.show_rerun_timings:
+    with st.sidebar.expander("Rerun Timings", expanded=True):
+        st.caption(f"Total: {record['total_ms']:.0f} ms")
+        st.dataframe(pd.DataFrame(record["stages"]), hide_index=True, use_container_width=True)
@@ -0,0 +1,407 @@
+"""Benchmark the dashboard's data path without a Streamlit session.
+
+Recorded sidebar interactions are replayed against the real CSVs and against
+synthetic datasets scaled up from them. Every stage the app runs on a rerun
+(loading, filtering, building the heatmaps and markers, the chart
+aggregations) is timed, its peak traced memory measured, and the size of what
+it would send to the browser recorded. Results are written as JSON so two runs
+can be compared:
+
+    python benchmark.py --scales 1 10 100 --output before.json
+    python benchmark.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import folium
+import numpy as np
+import pandas as pd
+
+from aggregates import DailyCube, choose_bucket, spray_case_correlations
+from charts import neighborhood_bar_chart, timeline_chart
+from dataset import CASES_FILE, DATA_DIR, MOSQUITO_FILE, load_cases, load_data, load_mosquito, load_rollup, load_timeline
+from filters import clip_to_year, drop_incomplete
+from indexes import DateIndex
+from joins import NeighborhoodJoin
+from query import FilterSpec, RawCaseIndex, run_query
+from maps import DEFAULT_CENTER, DEFAULT_ZOOM, create_heatmap_map, create_spraying_markers, render_map, rendered_size
+from rollups import ROLLUPS, select_rollup
+from spatial import GridIndex
+
+INTERACTIONS_PATH = os.path.join("benchmarks", "interactions.json")
+PERCENTILES = [50, 90, 95, 99]
+
+# ~200 m of jitter, so scaled copies of a location spread over neighbouring grid cells
+SYNTHETIC_JITTER = 0.002
+
+
+# ========================================== Synthetic Data ==========================================
+def scale_frame(df, scale, rng, jitter=SYNTHETIC_JITTER):
+    """`scale` copies of every row; copies after the first get jittered coordinates"""
+    scaled = df.loc[df.index.repeat(scale)].reset_index(drop=True)
+    if scale > 1 and "latitude" in scaled.columns:
+        copy = np.tile(np.arange(scale), len(df))
+        moved = copy > 0
+        for col in ["latitude", "longitude"]:
+            values = pd.to_numeric(scaled[col], errors="coerce").to_numpy()
+            values[moved] += rng.normal(0.0, jitter, moved.sum())
+            scaled[col] = values.round(6)
+    return scaled
+
+
+def write_synthetic_data(data_dir, output_dir, scale, seed=0):
+    """Write every CSV the dashboard reads, scaled `scale` times, into `output_dir`"""
+    rng = np.random.default_rng(seed)
+    files = [ROLLUPS[name]["file"] for name in ROLLUPS] + [CASES_FILE]
+    if os.path.exists(os.path.join(data_dir, MOSQUITO_FILE)):
+        files.append(MOSQUITO_FILE)
+    for name in files:
+        df = pd.read_csv(os.path.join(data_dir, name))
+        scale_frame(df, scale, rng).to_csv(os.path.join(output_dir, name), index=False, encoding="utf-8")
+
+
+# ========================================== Measurement ==========================================
+class StageRecorder:
+    """Collects latency, peak memory, payload size and row counts per stage"""
+
+    def __init__(self, repeats=5, trace_memory=True):
+        self.repeats = repeats
+        self.trace_memory = trace_memory
+        self.samples = {}
+
+    def measure(self, stage, fn, payload=None, rows=None):
+        """Run `fn` `repeats` times untraced, then once under tracemalloc; return its result.
+
+        `payload` and `rows` map the result to the bytes sent to the browser and
+        the number of rows it holds.
+        """
+        sample = self.samples.setdefault(stage, {"latency": [], "peak": [], "payload": [], "rows": []})
+        for _ in range(self.repeats):
+            started = time.perf_counter()
+            result = fn()
+            sample["latency"].append(time.perf_counter() - started)
+        if self.trace_memory:
+            tracemalloc.start()
+            try:
+                fn()
+                sample["peak"].append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        if payload is not None:
+            sample["payload"].append(payload(result))
+        if rows is not None:
+            sample["rows"].append(rows(result))
+        return result
+
+    def summary(self):
+        out = {}
+        for stage, sample in self.samples.items():
+            latency_ms = np.array(sample["latency"]) * 1000
+            summary = {
+                "calls": len(latency_ms),
+                "latency_ms": {
+                    **{f"p{p}": float(np.percentile(latency_ms, p)) for p in PERCENTILES},
+                    "mean": float(latency_ms.mean()),
+                    "max": float(latency_ms.max()),
+                },
+            }
+            if sample["peak"]:
+                summary["peak_memory_bytes"] = int(max(sample["peak"]))
+            for key, label in [("payload", "payload_bytes"), ("rows", "rows_out")]:
+                if sample[key]:
+                    summary[label] = {
+                        "mean": float(np.mean(sample[key])),
+                        "max": int(max(sample[key])),
+                    }
+            out[stage] = summary
+        return out
+
+
+def _json_size(chart):
+    return len(chart.to_json().encode("utf-8"))
+
+
+def _markers_size(markers):
+    m = folium.Map(location=DEFAULT_CENTER, zoom_start=DEFAULT_ZOOM)
+    markers.add_to(m)
+    return rendered_size(m)
+
+
+# ========================================== Replay ==========================================
+def resolve_dates(interaction):
+    """Sidebar dates for an interaction, with the 7-day window derived as the app does"""
+    spraying_start = pd.Timestamp(interaction["spraying_start_date"])
+    spraying_end = pd.Timestamp(interaction["spraying_end_date"])
+    if interaction["spraying_date_filter_mode"] == "Specific Date":
+        spraying_end = spraying_start
+    if interaction["date_filter_mode"] == "7-Day Window":
+        end = spraying_end
+        start = end - pd.Timedelta(days=6)
+    else:
+        start = pd.Timestamp(interaction["start_date"])
+        end = pd.Timestamp(interaction["end_date"])
+    return start, end, spraying_start, spraying_end
+
+
+def replay(recorder, interaction, cases_index, spraying_index, cases_cube, spraying_cube, raw_cases, timelines, density_join=None):
+    """Run one rerun's worth of filtering, map and chart work"""
+    start, end, spraying_start, spraying_end = resolve_dates(interaction)
+    spec = FilterSpec.from_sidebar(
+        interaction["year"], interaction["date_filter_mode"], start, end,
+        interaction["spraying_date_filter_mode"], spraying_start, spraying_end,
+        interaction["neighborhoods"], interaction["filter_heatmap_by_neighborhood"],
+    )
+
+    # Uncached, so this is the cost of a miss in the app's query cache
+    result = recorder.measure(
+        "filter",
+        lambda: run_query(spec, cases_index, spraying_index, cases_cube),
+        rows=lambda r: len(r.cases) + len(r.spraying),
+    )
+    filtered_cases, filtered_spraying = result.cases, result.spraying
+
+    # The individual-cases heatmap aggregates on every request, with no cache in front
+    recorder.measure(
+        "aggregate[raw_cases]",
+        lambda: raw_cases.heatmap(spec, interaction["zoom"]),
+        rows=len,
+    )
+
+    # Only when the mosquito surveys exist; every lookup goes through the prebuilt key indexes
+    if density_join is not None:
+        recorder.measure(
+            "join[mosquito]",
+            lambda: (density_join.series(spec), density_join.neighborhoods(spec)),
+            rows=lambda r: len(r[0]) + len(r[1]),
+        )
+
+    # Built and rendered, as the app does on a map cache miss; the payload is what it sends
+    map_options = {"radius": interaction["radius"], "zoom": interaction["zoom"]}
+    cases = drop_incomplete(filtered_cases, ["latitude", "longitude", "cases"])
+    if not cases.empty:
+        recorder.measure(
+            "create_heatmap_map[cases]",
+            lambda: render_map(create_heatmap_map(cases, map_type="cases", **map_options)),
+            payload=lambda r: r.nbytes,
+            rows=lambda _: len(cases),
+        )
+    spraying = drop_incomplete(filtered_spraying, ["latitude", "longitude", "spray_count"])
+    if not spraying.empty:
+        recorder.measure(
+            "create_heatmap_map[spraying]",
+            lambda: render_map(create_heatmap_map(spraying, map_type="spraying", **map_options)),
+            payload=lambda r: r.nbytes,
+            rows=lambda _: len(spraying),
+        )
+        recorder.measure(
+            "create_spraying_markers",
+            lambda: create_spraying_markers(spraying),
+            payload=_markers_size,
+            rows=lambda _: len(spraying),
+        )
+
+    recorder.measure(
+        "chart[neighborhoods]",
+        lambda: neighborhood_bar_chart(result.top_neighborhoods(
+            n=interaction["num_neighborhoods"],
+            ascending=(interaction["sort_order"] == "Ascending"),
+        )),
+        payload=_json_size,
+    )
+    # Uncached, so this is the cost of a new window in the app's correlation cache
+    recorder.measure(
+        "analysis[correlation]",
+        lambda: spray_case_correlations(cases_cube, spraying_cube, *clip_to_year(spec.start, spec.end, spec.selected_year)),
+        rows=lambda r: r[0].size,
+    )
+    timeline_bucket = choose_bucket(
+        min(cases_index.min_date, spraying_index.min_date), max(cases_index.max_date, spraying_index.max_date)
+    )
+    cases_timeline, spraying_timeline = timelines
+    recorder.measure(
+        "chart[timeline]",
+        lambda: timeline_chart(
+            spraying_timeline.bucketed(bucket=timeline_bucket), cases_timeline.bucketed(bucket=timeline_bucket),
+            timeline_bucket,
+        ),
+        payload=_json_size,
+    )
+
+
+def benchmark_dataset(data_dir, interactions, repeats, trace_memory):
+    """Load, precompute and replay every interaction against the CSVs in `data_dir`"""
+    recorder = StageRecorder(repeats, trace_memory)
+
+    # Cold loads parse the CSVs and write snapshots into a throwaway cache
+    cold_dirs = []
+
+    def cold_load():
+        cold_dirs.append(tempfile.TemporaryDirectory())
+        return load_data(data_dir, cold_dirs[-1].name)
+
+    try:
+        recorder.measure("load_data[cold]", cold_load, rows=lambda frames: sum(len(f) for f in frames))
+    finally:
+        for d in cold_dirs:
+            d.cleanup()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        load_data(data_dir, cache_dir)
+        data, dengue_spraying = recorder.measure(
+            "load_data[warm]", lambda: load_data(data_dir, cache_dir), rows=lambda frames: sum(len(f) for f in frames)
+        )
+        neighborhood_cases = load_rollup(select_rollup("neighborhood", "day"), data_dir, cache_dir)
+        neighborhood_spraying = load_rollup(select_rollup("neighborhood", "day", "spraying"), data_dir, cache_dir)
+        raw_cases = load_cases(data_dir, cache_dir)
+        mosquito = load_mosquito(data_dir, cache_dir)
+        timelines = recorder.measure(
+            "precompute[timeline]",
+            lambda: (load_timeline("cases", data_dir, cache_dir), load_timeline("spraying", data_dir, cache_dir)),
+        )
+
+    def precompute():
+        cases_index, spraying_index = DateIndex(data, "diagnosis_date"), DateIndex(dengue_spraying, "date")
+        return (
+            cases_index,
+            spraying_index,
+            DailyCube(DateIndex(neighborhood_cases, "diagnosis_date"), "neighborhood", "cases"),
+            DailyCube(DateIndex(neighborhood_spraying, "date"), "neighborhood", "spray_count"),
+            GridIndex(data),
+            GridIndex(dengue_spraying),
+        )
+
+    cases_index, spraying_index, cases_cube, spraying_cube, _, _ = recorder.measure("precompute", precompute)
+    raw_index = recorder.measure("precompute[raw_cases]", lambda: RawCaseIndex(raw_cases))
+    density_join = None
+    if mosquito is not None:
+        density_join = recorder.measure("precompute[join]", lambda: NeighborhoodJoin(mosquito, data, dengue_spraying))
+
+    for interaction in interactions:
+        replay(
+            recorder, interaction, cases_index, spraying_index, cases_cube, spraying_cube, raw_index, timelines, density_join
+        )
+
+    return {
+        "rows": {
+            "cases": len(data),
+            "spraying": len(dengue_spraying),
+            "neighborhood_cases": len(neighborhood_cases),
+            "raw_cases": len(raw_cases),
+            "mosquito": 0 if mosquito is None else len(mosquito),
+        },
+        "stages": recorder.summary(),
+    }
+
+
+# ========================================== Comparison ==========================================
+def compare(baseline_path, current_path, threshold=1.2, percentile="p95"):
+    """Print per-stage latency ratios of two result files; True if none regressed past `threshold`"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)
+
+    ok = True
+    print(f"{'dataset':<14}{'stage':<32}{'base ms':>10}{'new ms':>10}{'ratio':>8}")
+    for name, result in current["datasets"].items():
+        base_stages = baseline["datasets"].get(name, {}).get("stages", {})
+        for stage, summary in result["stages"].items():
+            if stage not in base_stages:
+                continue
+            before = base_stages[stage]["latency_ms"][percentile]
+            after = summary["latency_ms"][percentile]
+            ratio = after / before if before else float("inf")
+            flag = "  REGRESSION" if ratio > threshold else ""
+            ok &= ratio <= threshold
+            print(f"{name:<14}{stage:<32}{before:>10.2f}{after:>10.2f}{ratio:>8.2f}{flag}")
+    return ok
+
+
+# ========================================== Entry Point ==========================================
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_interactions(path):
+    """Sidebar states from a JSON list, or from the rerun log the app writes (JSON lines)"""
+    with open(path, encoding="utf-8") as f:
+        if not path.endswith(".jsonl"):
+            return json.load(f)
+        records = [json.loads(line) for line in f if line.strip()]
+    return [
+        {"name": f"{r['session']}@{r['time']}", **r["context"]}
+        for r in records
+        if r.get("context", {}).get("start_date")
+    ]
+
+
+def run(data_dir=DATA_DIR, interactions_path=INTERACTIONS_PATH, scales=(1, 10, 100), repeats=5, trace_memory=True, seed=0):
+    interactions = load_interactions(interactions_path)
+
+    results = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeats": repeats,
+            "interactions": [i["name"] for i in interactions],
+        },
+        "datasets": {},
+    }
+    for scale in scales:
+        name = "real" if scale == 1 else f"synthetic_x{scale}"
+        print(f"Benchmarking {name}", file=sys.stderr)
+        if scale == 1:
+            result = benchmark_dataset(data_dir, interactions, repeats, trace_memory)
+        else:
+            with tempfile.TemporaryDirectory() as synthetic_dir:
+                write_synthetic_data(data_dir, synthetic_dir, scale, seed)
+                result = benchmark_dataset(synthetic_dir, interactions, repeats, trace_memory)
+        results["datasets"][name] = {"scale": scale, **result}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=DATA_DIR, help="directory holding the dashboard CSVs")
+    parser.add_argument("--interactions", default=INTERACTIONS_PATH, help="JSON list of sidebar states, or a rerun log (.jsonl)")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="dataset scales; 1 is the real data")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per stage and interaction")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic coordinate jitter")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.2, help="p95 slowdown ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 0 if compare(*args.compare, threshold=args.threshold) else 1
+
+    results = run(args.data, args.interactions, args.scales, args.repeats, not args.no_memory, args.seed)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import altair as alt
+import pandas as pd
+
+
+def neighborhood_bar_chart(city_cases):
+    """Bar chart of case totals per neighborhood, in the frame's order"""
+    return (
+        alt.Chart(city_cases)
+        .mark_bar()
+        .encode(
+            x=alt.X("neighborhood", sort=None, title="Neighborhood"),
+            y=alt.Y("cases", title="Cases"),
+            color=alt.Color("cases", scale=alt.Scale(scheme="blues")),
+        )
+        .properties(width=800, height=400)
+        .configure_axisX(labelAngle=-45)
+        .interactive()
+    )
+
+
+def timeline_chart(spraying_timeline_data, dengue_timeline_data, bucket="day"):
+    """Spray counts above cases per day, week or month, sharing one x-axis zoom.
+
+    The frames come from `DailyCube.bucketed`; each bar spans its bucket.
+    """
+    per = "" if bucket == "day" else f" per {bucket.capitalize()}"
+
+    # Create x-axis zoom selection
+    zoom = alt.selection_interval(
+        bind='scales',
+        encodings=['x']  # Only allow zooming on x-axis
+    )
+
+    spraying_chart = (
+        alt.Chart(spraying_timeline_data)
+        .mark_bar()
+        .encode(
+            x=alt.X("date:T", title="Date"),
+            x2="date_end:T",
+            y=alt.Y("spray_count:Q", title=f"Total Spray Count{per}"),
+            tooltip=["date:T", "spray_count:Q"],
+        )
+        .properties(width=800, height=400)
+        .add_params(zoom)  # Add zoom selection
+    )
+
+    dengue_timeline_chart = (
+        alt.Chart(dengue_timeline_data)
+        .mark_bar(color="orange")
+        .encode(
+            x=alt.X("diagnosis_date:T", title="Date"),
+            x2="diagnosis_date_end:T",
+            y=alt.Y("cases:Q", title=f"Total Cases{per}"),
+            tooltip=["diagnosis_date:T", "cases:Q"],
+        )
+        .properties(width=800, height=400)
+        .add_params(zoom)  # Share the same zoom selection
+    )
+
+    # Combine charts with shared x-axis scale
+    return alt.vconcat(spraying_chart, dengue_timeline_chart).resolve_scale(x='shared')
+
+
+def lag_correlation_chart(curves, threshold=None):
+    """Correlation of cases with spraying at each lag, one line per neighborhood.
+
+    `curves` is a lag x neighborhood frame (see `spray_case_correlations`);
+    `threshold` draws the +/- band inside which correlations are noise.
+    """
+    data = curves.reset_index().melt("lag", var_name="neighborhood", value_name="correlation")
+    lines = (
+        alt.Chart(data)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("lag:Q", title="Lag (days; cases after spraying when positive)"),
+            y=alt.Y("correlation:Q", title="Correlation"),
+            color=alt.Color("neighborhood:N", title="Neighborhood"),
+            tooltip=["neighborhood:N", "lag:Q", alt.Tooltip("correlation:Q", format=".3f")],
+        )
+    )
+    layers = [lines, alt.Chart(pd.DataFrame({"y": [0.0]})).mark_rule(color="gray").encode(y="y:Q")]
+    if threshold is not None:
+        band = pd.DataFrame({"y": [-threshold, threshold]})
+        layers.append(alt.Chart(band).mark_rule(color="gray", strokeDash=[4, 4]).encode(y="y:Q"))
+    return alt.layer(*layers).properties(width=800, height=400).interactive()
+
+
+def density_overlay_chart(series, bucket="week"):
+    """Mean Breteau index, cases and spray counts per day or week, stacked on one x-axis zoom.
+
+    `series` comes from `NeighborhoodJoin.series`; buckets without surveys have
+    no Breteau index and leave a gap in its line.
+    """
+    per = "" if bucket == "day" else f" per {bucket.capitalize()}"
+    zoom = alt.selection_interval(bind="scales", encodings=["x"])
+    base = alt.Chart(series).encode(x=alt.X("date:T", title="Date")).properties(width=800, height=200)
+    breteau = base.mark_line(point=True, color="green").encode(
+        y=alt.Y("breteau_index:Q", title="Mean Breteau Index"),
+        tooltip=["date:T", alt.Tooltip("breteau_index:Q", format=".1f"), "surveys:Q"],
+    ).add_params(zoom)
+    cases = base.mark_bar(color="orange").encode(
+        x2="date_end:T",
+        y=alt.Y("cases:Q", title=f"Cases{per}"),
+        tooltip=["date:T", "cases:Q"],
+    ).add_params(zoom)
+    spraying = base.mark_bar().encode(
+        x2="date_end:T",
+        y=alt.Y("spray_count:Q", title=f"Spray Count{per}"),
+        tooltip=["date:T", "spray_count:Q"],
+    ).add_params(zoom)
+    return alt.vconcat(breteau, cases, spraying).resolve_scale(x="shared")
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+CACHE_DIR = os.path.join("data", ".cache")
+
+# Bump when the way snapshots are built changes so old ones are rebuilt
+SNAPSHOT_VERSION = 2
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_paths(csv_path, cache_dir, schema):
+    # Each projection of a CSV gets its own snapshot, so callers reading different columns don't evict each other;
+    # the absolute path is part of the key so same-named CSVs in different directories don't share one
+    key = {"source": os.path.abspath(csv_path), "schema": schema}
+    key_id = hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    name = f"{os.path.splitext(os.path.basename(csv_path))[0]}-{key_id}"
+    return (
+        os.path.join(cache_dir, f"{name}.parquet"),
+        os.path.join(cache_dir, f"{name}.json"),
+    )
+
+
+def _parse_csv(csv_path, date_columns, numeric_columns, usecols, dtypes):
+    # Types are inferred over whole columns; per-chunk inference can mix str and int
+    # in one column of a large file, which its categorical then cannot store
+    df = pd.read_csv(csv_path, usecols=usecols, low_memory=False)
+    if usecols is not None:
+        df = df[list(usecols)]
+    for col in numeric_columns:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    for col in date_columns:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col, dtype in dtypes.items():
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def read_csv_snapshot(csv_path, date_columns=(), numeric_columns=(), usecols=None, dtypes=None, cache_dir=CACHE_DIR):
+    """Read a CSV through a Parquet snapshot with dates parsed and dtypes fixed.
+
+    Only `usecols` are kept (all columns when None), in that order, and
+    `dtypes` maps columns to compact dtypes such as "category" or "float32";
+    both are part of the snapshot's schema. The snapshot is rebuilt when the
+    source file's content changes. The mtime and size are checked first; the
+    file is only hashed when they differ from the ones recorded at build time.
+    """
+    schema = {
+        "version": SNAPSHOT_VERSION,
+        "usecols": None if usecols is None else list(usecols),
+        "date_columns": list(date_columns),
+        "numeric_columns": list(numeric_columns),
+        "dtypes": {col: str(dtype) for col, dtype in (dtypes or {}).items()},
+    }
+    parquet_path, meta_path = _snapshot_paths(csv_path, cache_dir, schema)
+    stat = os.stat(csv_path)
+
+    meta = None
+    if os.path.exists(parquet_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("schema") != schema:
+            meta = None
+
+    if meta is not None:
+        if meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+            return pd.read_parquet(parquet_path)
+        digest = file_digest(csv_path)
+        if meta["sha256"] == digest:
+            # Only the timestamp moved (e.g. a fresh checkout), keep the snapshot
+            meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            _write_meta(meta_path, meta)
+            return pd.read_parquet(parquet_path)
+    else:
+        digest = file_digest(csv_path)
+
+    df = _parse_csv(csv_path, date_columns, numeric_columns, usecols, schema["dtypes"])
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_atomically(parquet_path, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+        _write_meta(meta_path, {
+            "schema": schema,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": digest,
+        })
+    except OSError:
+        # Read-only deployments still work, they just parse the CSV each start
+        pass
+    return df
+
+
+def _write_meta(meta_path, meta):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    _write_atomically(meta_path, write)
+
+
+def _write_atomically(path, write):
+    """Call `write` on a temporary file of its own beside `path`, then move it into place.
+
+    Each writer gets a unique name, so processes rebuilding the same snapshot
+    never write into one another's temporary file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
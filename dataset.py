@@ -0,0 +1,116 @@
+import os
+
+from aggregates import BUCKETS, DailyCube, Timeline
+from data_cache import CACHE_DIR, read_csv_snapshot
+from indexes import DateIndex, sort_by_date
+from rollups import ROLLUP_SOURCES, ROLLUPS, select_rollup
+
+DATA_DIR = "data"
+CASES_FILE = "dengue_fever_cases.csv"
+MOSQUITO_FILE = "mosquito_densities.csv"
+
+# Only the columns the dashboard reads are loaded, in compact dtypes: repeated
+# names as categoricals, coordinates as float32 (~1 m) and small integer counts
+COLUMN_DTYPES = {
+    "administrative_area_code": "category",
+    "neighborhood": "category",
+    "latitude": "float32",
+    "longitude": "float32",
+    "cases": "int32",
+    "spray_count": "int32",
+    "breteau_index": "float32",
+    "container_index": "float32",
+    "year": "int16",
+}
+CASE_COLUMNS = ["administrative_area_code", "neighborhood", "diagnosis_date", "latitude", "longitude", "year"]
+MOSQUITO_COLUMNS = ["administrative_area_code", "neighborhood", "date", "breteau_index", "container_index"]
+
+
+def compact_dtypes(columns):
+    return {col: COLUMN_DTYPES[col] for col in columns if col in COLUMN_DTYPES}
+
+
+def load_rollup(name, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """One of the ETL's case or spraying rollups, sorted by its date column"""
+    spec = ROLLUPS[name]
+    columns = spec["keys"] + [spec["value_column"], "year"]
+    frame = read_csv_snapshot(
+        os.path.join(data_dir, spec["file"]),
+        date_columns=[spec["date_column"]],
+        numeric_columns=spec["numeric_columns"],
+        usecols=columns,
+        dtypes=compact_dtypes(columns),
+        cache_dir=cache_dir,
+    )
+    return sort_by_date(frame, spec["date_column"])
+
+
+def load_cube(spatial, temporal="day", dataset="cases", data_dir=DATA_DIR, cache_dir=CACHE_DIR, cubes=None):
+    """Day x category cube of the coarsest `dataset` rollup resolving `spatial` x `temporal`.
+
+    `cubes` maps rollup names to cubes already built; it is read and filled in,
+    so callers asking for several levels build each rollup's cube once.
+    """
+    name = select_rollup(spatial, temporal, dataset)
+    if cubes is not None and name in cubes:
+        return cubes[name]
+    spec = ROLLUPS[name]
+    frame = load_rollup(name, data_dir, cache_dir)
+    cube = DailyCube(DateIndex(frame, spec["date_column"]), spec["category_column"], spec["value_column"])
+    if cubes is not None:
+        cubes[name] = cube
+    return cube
+
+
+def load_timeline(dataset="cases", data_dir=DATA_DIR, cache_dir=CACHE_DIR, cubes=None):
+    """City-wide totals of `dataset` per day, week or month, each from the coarsest rollup resolving it"""
+    cubes = {} if cubes is None else cubes
+    levels = {}
+    for bucket in BUCKETS:
+        cube = load_cube("city", bucket, dataset, data_dir, cache_dir, cubes)
+        levels[bucket] = (cube, ROLLUPS[select_rollup("city", bucket, dataset)]["temporal"])
+    return Timeline(levels, ROLLUP_SOURCES[dataset]["date_column"])
+
+
+def load_cases(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """One row per reported case, sorted by diagnosis date"""
+    cases = read_csv_snapshot(
+        os.path.join(data_dir, CASES_FILE),
+        date_columns=["diagnosis_date"],
+        numeric_columns=["latitude", "longitude"],
+        usecols=CASE_COLUMNS,
+        dtypes=compact_dtypes(CASE_COLUMNS),
+        cache_dir=cache_dir,
+    )
+    return sort_by_date(cases, "diagnosis_date")
+
+
+def load_spraying(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Spray counts per site and day, sorted by date"""
+    return load_rollup(select_rollup("location", "day", "spraying"), data_dir, cache_dir)
+
+
+def load_mosquito(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """Mosquito density surveys sorted by date, or None until the ETL has written them"""
+    path = os.path.join(data_dir, MOSQUITO_FILE)
+    if not os.path.exists(path):
+        return None
+    surveys = read_csv_snapshot(
+        path,
+        date_columns=["date"],
+        numeric_columns=["breteau_index", "container_index"],
+        usecols=MOSQUITO_COLUMNS,
+        dtypes=compact_dtypes(MOSQUITO_COLUMNS),
+        cache_dir=cache_dir,
+    )
+    return sort_by_date(surveys, "date")
+
+
+def load_data(data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+    """The frames behind the maps: cases per location and day, and sprays per site and day.
+
+    Both are read through the columnar snapshot so dates and coordinates arrive
+    already typed, and kept sorted by date so date filters become contiguous slices.
+    """
+    data = load_rollup(select_rollup("location", "day"), data_dir, cache_dir)
+    return data, load_spraying(data_dir, cache_dir)
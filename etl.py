@@ -0,0 +1,336 @@
+"""Build the CSVs under data/ from the yearly Tainan open-data exports.
+
+Each source file holds one ROC year of one dataset. Files are read one at a
+time, renamed to English columns, their dates parsed with vectorized string
+ops, and written to a per-year partition. A manifest of source-file hashes
+means only years whose files changed are re-extracted on later runs; the
+combined CSVs are then rebuilt by streaming the partitions, and the derived
+rollups by recounting only the changed years and adding up every year's counts.
+
+    python etl.py --source datasets --output data
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+
+import pandas as pd
+
+from data_cache import file_digest
+from rollups import ROLLUP_SOURCES, ROLLUPS, merge_rollups, read_rollups, save_rollups, write_rollups
+
+CASES_COLUMNS_MAP = {
+    '確診日': 'diagnosis_date',
+    '行政區域代碼': 'administrative_area_code',
+    '里別': 'neighborhood',
+    '道路名稱': 'road_name',
+    '經度座標': 'longitude',
+    '經度': 'longitude',
+    '緯度座標': 'latitude',
+    '緯度': 'latitude'
+}
+
+MOSQUITO_COLUMNS_MAP = {
+    '日期': 'date',
+    '縣市別代碼': 'city_code',
+    '行政區域代碼': 'administrative_area_code',
+    '里別': 'neighborhood',
+    '調查種類': 'survey_type',
+    '調查戶數': 'surveyed_households',
+    '陽性戶數': 'positive_households',
+    '調查容器戶內': 'surveyed_containers_indoor',
+    '調查容器戶外': 'surveyed_containers_outdoor',
+    '調查容器合計': 'surveyed_containers_total',
+    '陽性容器戶內': 'positive_containers_indoor',
+    '陽性容器戶外': 'positive_containers_outdoor',
+    '陽性容器合計': 'positive_containers_total',
+    '布氏指數': 'breteau_index',
+    '布氏級數': 'breteau_grade',
+    '容器指數': 'container_index',
+    '容器級數': 'container_grade',
+    '經度': 'longitude',
+    '緯度': 'latitude'
+}
+
+SPRAYING_COLUMNS_MAP = {
+    '日期': 'date',
+    '行政區域代碼': 'administrative_area_code',
+    '里別': 'neighborhood',
+    '道路名稱': 'road_name',
+    '經度座標': 'longitude',
+    '經度': 'longitude',
+    '緯度座標': 'latitude',
+    '緯度': 'latitude',
+    '星期': 'day_of_week',
+    '集合時間': 'meeting_time',
+    '集合地點': 'meeting_location',
+    '鎖匠': 'locksmith',
+    '警員': 'police_officer',
+    '刑警': 'detective',
+    '噴工數': 'sprayer',
+    '支援人力': 'supporting_staff',
+    '警員刑警': 'detective',
+}
+
+# Source directory, column mapping, output column order and date layout per dataset
+DATASETS = {
+    "cases": {
+        "directory": "Dengue Fever Cases",
+        "columns_map": CASES_COLUMNS_MAP,
+        "columns": ["road_name", "neighborhood", "diagnosis_date", "latitude", "longitude",
+                    "administrative_area_code"],
+        "date_column": "diagnosis_date",
+        "date_layout": "yyyymmdd",
+        "output": "dengue_fever_cases.csv",
+    },
+    "mosquito": {
+        "directory": "Year DF Mosquito Density",
+        "columns_map": MOSQUITO_COLUMNS_MAP,
+        "columns": list(dict.fromkeys(MOSQUITO_COLUMNS_MAP.values())),
+        "date_column": "date",
+        "date_layout": "yyyymmdd",
+        "output": "mosquito_densities.csv",
+    },
+    "spraying": {
+        "directory": "Dengue fever Spraying Manpower and Frequency",
+        "columns_map": SPRAYING_COLUMNS_MAP,
+        "columns": ["administrative_area_code", "longitude", "road_name", "date", "sprayer",
+                    "supporting_staff", "detective", "day_of_week", "meeting_location", "locksmith",
+                    "neighborhood", "latitude", "police_officer", "meeting_time"],
+        "date_column": "date",
+        "date_layout": "mmdd",
+        "output": "dengue_spraying.csv",
+    },
+}
+
+MANIFEST_NAME = "manifest.json"
+
+
+# ========================================== Extraction ==========================================
+def roc_year_from_filename(file_name):
+    """ROC year (e.g. '113') embedded in a source file name"""
+    match = re.search(r"1\d{2}", file_name)
+    if match is None:
+        raise ValueError(f"No ROC year in file name: {file_name}")
+    return match.group(0)
+
+
+def parse_yyyymmdd(dates):
+    """'20150813' -> '2015/08/13' for a whole Series"""
+    dates = dates.astype(str).str.strip().str.replace(r"\D", "", regex=True)
+    return dates.str[:4] + "/" + dates.str[4:6] + "/" + dates.str[6:8]
+
+
+def parse_mmdd(dates, roc_year):
+    """'0121' in ROC year 104 -> '2015/01/21' for a whole Series"""
+    year = str(int(roc_year) + 1911)
+    dates = dates.astype(str).str.strip().str.replace(r"\D", "", regex=True).str.zfill(4)
+    return year + "/" + dates.str[:2] + "/" + dates.str[2:4]
+
+
+def _coalesce_duplicate_columns(df):
+    """Merge columns that were renamed to the same name, keeping the first non-null value"""
+    if not df.columns.duplicated().any():
+        return df
+    merged = {}
+    for name in dict.fromkeys(df.columns):
+        block = df.loc[:, df.columns == name]
+        merged[name] = block.iloc[:, 0] if block.shape[1] == 1 else block.bfill(axis=1).iloc[:, 0]
+    return pd.DataFrame(merged)
+
+
+def extract_file(path, spec):
+    """Read one yearly source file into the dataset's English-column layout"""
+    roc_year = roc_year_from_filename(os.path.basename(path))
+    date_source = [k for k, v in spec["columns_map"].items() if v == spec["date_column"]]
+    df = pd.read_csv(path, encoding="utf-8-sig", dtype={k: str for k in date_source})
+    df = _coalesce_duplicate_columns(df.rename(columns=spec["columns_map"]))
+    df = df.reindex(columns=spec["columns"])
+
+    if spec["date_layout"] == "mmdd":
+        df[spec["date_column"]] = parse_mmdd(df[spec["date_column"]], roc_year)
+    else:
+        df[spec["date_column"]] = parse_yyyymmdd(df[spec["date_column"]])
+    df["year"] = int(roc_year)
+    return df
+
+
+# ========================================== Partitions ==========================================
+def _load_manifest(partition_root):
+    path = os.path.join(partition_root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(partition_root, manifest):
+    path = os.path.join(partition_root, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def partition_path(partition_dir, roc_year):
+    return os.path.join(partition_dir, f"year={roc_year}.csv")
+
+
+def update_partitions(source_dir, partition_dir, spec, previous, force=False):
+    """Re-extract the years whose source files changed.
+
+    `previous` maps source file name -> sha256 from the last run. Returns the
+    new mapping and the set of years whose partition was written or removed.
+    """
+    files = sorted(
+        f for f in os.listdir(source_dir)
+        if os.path.isfile(os.path.join(source_dir, f)) and f.lower().endswith(".csv")
+    )
+    digests = {f: file_digest(os.path.join(source_dir, f)) for f in files}
+
+    files_by_year = {}
+    for f in files:
+        files_by_year.setdefault(roc_year_from_filename(f), {})[f] = digests[f]
+    previous_by_year = {}
+    for f, digest in previous.items():
+        previous_by_year.setdefault(roc_year_from_filename(f), {})[f] = digest
+
+    os.makedirs(partition_dir, exist_ok=True)
+    changed = set()
+    for roc_year, year_files in sorted(files_by_year.items()):
+        target = partition_path(partition_dir, roc_year)
+        if not force and os.path.exists(target) and previous_by_year.get(roc_year) == year_files:
+            continue
+        print(f"Extracting {spec['directory']} {roc_year}: {', '.join(year_files)}")
+        tmp_path = target + ".tmp"
+        for i, f in enumerate(year_files):
+            df = extract_file(os.path.join(source_dir, f), spec)
+            df.to_csv(tmp_path, mode="w" if i == 0 else "a", header=(i == 0), index=False, encoding="utf-8")
+        os.replace(tmp_path, target)
+        changed.add(roc_year)
+
+    for roc_year in set(previous_by_year) - set(files_by_year):
+        stale = partition_path(partition_dir, roc_year)
+        if os.path.exists(stale):
+            os.remove(stale)
+            changed.add(roc_year)
+
+    return digests, changed
+
+
+def combine_partitions(partition_dir, output_path, chunk_size=100_000):
+    """Stream every year partition, in year order, into one CSV"""
+    partitions = sorted(
+        (f for f in os.listdir(partition_dir) if f.startswith("year=") and f.endswith(".csv")),
+        key=lambda f: int(f[len("year="):-len(".csv")]),
+    )
+    tmp_path = output_path + ".tmp"
+    header = True
+    with open(tmp_path, "w", encoding="utf-8", newline="") as out:
+        for f in partitions:
+            for chunk in pd.read_csv(os.path.join(partition_dir, f), dtype=str, chunksize=chunk_size):
+                chunk.to_csv(out, header=header, index=False)
+                header = False
+    os.replace(tmp_path, output_path)
+
+
+# ========================================== Derived Tables ==========================================
+def build_derived(output_dir):
+    """Rebuild the case and spraying rollups the dashboard reads from the combined CSVs"""
+    for name in ROLLUP_SOURCES:
+        path = os.path.join(output_dir, DATASETS[name]["output"])
+        if os.path.exists(path):
+            write_rollups(pd.read_csv(path), output_dir, name)
+
+
+def rollup_counts_dir(partition_dir, roc_year):
+    return os.path.join(partition_dir, "rollups", f"year={roc_year}")
+
+
+def update_rollups(partition_dir, output_dir, dataset, changed_years):
+    """Recount the rollups of `changed_years` and add up every year's counts into the output tables.
+
+    Each year's counts are kept beside its partition, so only the changed
+    years' rows are read again; years not counted yet are counted too.
+    Returns whether the output tables were rewritten.
+    """
+    years = {
+        f[len("year="):-len(".csv")] for f in os.listdir(partition_dir) if f.startswith("year=") and f.endswith(".csv")
+    }
+    if not years:
+        return False
+    counts_root = os.path.join(partition_dir, "rollups")
+    os.makedirs(counts_root, exist_ok=True)
+    counted = {d[len("year="):] for d in os.listdir(counts_root) if d.startswith("year=") and not d.endswith(".tmp")}
+    recount = {y for y in years if y in changed_years or y not in counted}
+    outputs = [os.path.join(output_dir, spec["file"]) for spec in ROLLUPS.values() if spec["dataset"] == dataset]
+    if not recount and counted == years and all(os.path.exists(path) for path in outputs):
+        return False
+
+    for roc_year in counted - years:
+        shutil.rmtree(rollup_counts_dir(partition_dir, roc_year))
+    for roc_year in sorted(recount):
+        print(f"Counting {dataset} rollups for {roc_year}")
+        target = rollup_counts_dir(partition_dir, roc_year)
+        tmp_path = target + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        write_rollups(pd.read_csv(partition_path(partition_dir, roc_year)), tmp_path, dataset)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_path, target)
+
+    parts = [read_rollups(rollup_counts_dir(partition_dir, y), dataset) for y in sorted(years, key=int)]
+    save_rollups(merge_rollups(parts, dataset), output_dir)
+    return True
+
+
+# ========================================== Entry Point ==========================================
+def run(source_root, output_dir, datasets=None, force=False, derive_only=False):
+    if derive_only:
+        build_derived(output_dir)
+        return True
+
+    partition_root = os.path.join(output_dir, "partitions")
+    os.makedirs(partition_root, exist_ok=True)
+    manifest = _load_manifest(partition_root)
+
+    any_changed = False
+    for name in datasets or DATASETS:
+        spec = DATASETS[name]
+        source_dir = os.path.join(source_root, spec["directory"])
+        if not os.path.isdir(source_dir):
+            print(f"Skipping {name}: {source_dir} not found")
+            continue
+        partition_dir = os.path.join(partition_root, name)
+        output_path = os.path.join(output_dir, spec["output"])
+        digests, changed = update_partitions(source_dir, partition_dir, spec, manifest.get(name, {}), force)
+        if changed or not os.path.exists(output_path):
+            combine_partitions(partition_dir, output_path)
+            any_changed = True
+        # Counted before the manifest is saved, so a failed count is retried with the years it missed
+        if name in ROLLUP_SOURCES and update_rollups(partition_dir, output_dir, name, changed):
+            any_changed = True
+        manifest[name] = digests
+        _save_manifest(partition_root, manifest)
+
+    if not any_changed:
+        print("All partitions up to date")
+    return any_changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default="datasets", help="directory holding the per-dataset source folders")
+    parser.add_argument("--output", default="data", help="directory for partitions and combined CSVs")
+    parser.add_argument("--dataset", action="append", choices=sorted(DATASETS), help="only process this dataset (repeatable)")
+    parser.add_argument("--force", action="store_true", help="re-extract every year even if unchanged")
+    parser.add_argument("--derive", action="store_true", help="only rebuild the derived tables from the combined CSVs")
+    args = parser.parse_args(argv)
+    run(args.source, args.output, args.dataset, args.force, args.derive)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
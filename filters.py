@@ -0,0 +1,66 @@
+import pandas as pd
+
+
+def year_window(year):
+    """Calendar span of an ROC year (e.g. 113 -> 2024)"""
+    first = pd.Timestamp(year=int(year) + 1911, month=1, day=1)
+    return first, first + pd.offsets.YearEnd()
+
+
+def selected_neighborhood_list(selected_neighborhoods, filter_by_neighborhood):
+    """Neighborhoods to restrict to, or None when the selection does not filter"""
+    if "All" in selected_neighborhoods or not filter_by_neighborhood:
+        return None
+    return list(selected_neighborhoods)
+
+
+def filter_cases(cases_index, selected_year, date_filter_mode, start_date, end_date, neighborhoods=None):
+    """Case rows for the sidebar's date mode, year and neighborhoods.
+
+    Without a neighborhood filter the result is a slice (a view) of the indexed frame.
+    """
+    start = pd.Timestamp(start_date)
+    end = start if date_filter_mode not in ["Date Range", "7-Day Window"] else pd.Timestamp(end_date)
+
+    # The ROC year follows from the date, so the year narrows the slice instead of masking it
+    filtered_cases = cases_index.slice(*clip_to_year(start, end, selected_year))
+
+    if selected_year != "Total":
+        other_year = filtered_cases["year"].to_numpy() != selected_year
+        if other_year.any():
+            filtered_cases = filtered_cases[~other_year]
+
+    if neighborhoods is not None:
+        filtered_cases = filtered_cases[filtered_cases["neighborhood"].isin(neighborhoods)]
+    return filtered_cases
+
+
+def filter_spraying(spraying_index, spraying_date_filter_mode, start_date, end_date, neighborhoods=None):
+    """Spraying rows for the spraying date mode and neighborhoods"""
+    if start_date and end_date:
+        if spraying_date_filter_mode == "Date Range":
+            filtered_spraying = spraying_index.slice(start_date, end_date)
+        else:
+            filtered_spraying = spraying_index.on(start_date)
+    else:
+        # No dates selected: every spraying row
+        filtered_spraying = spraying_index.frame
+
+    if neighborhoods is not None:
+        filtered_spraying = filtered_spraying[filtered_spraying["neighborhood"].isin(neighborhoods)]
+    return filtered_spraying
+
+
+def drop_incomplete(frame, columns):
+    """`frame` without rows missing any of `columns`; the frame itself when none are"""
+    missing = frame[columns].isna().to_numpy().any(axis=1)
+    return frame[~missing] if missing.any() else frame
+
+
+def clip_to_year(start_date, end_date, selected_year):
+    """A date window clipped to the selected year"""
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if selected_year != "Total":
+        year_start, year_end = year_window(selected_year)
+        start, end = max(start, year_start), min(end, year_end)
+    return start, end
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+
+def sort_by_date(df, date_column):
+    """Return the frame sorted by a date column (NaT last) with a fresh RangeIndex"""
+    if df[date_column].is_monotonic_increasing and df[date_column].notna().all():
+        return df.reset_index(drop=True)
+    return df.sort_values(date_column, kind="mergesort", na_position="last").reset_index(drop=True)
+
+
+def read_only(array):
+    """Mark an index array read-only in place and return it; shared indexes must not be written to"""
+    array.flags.writeable = False
+    return array
+
+
+def to_day(value):
+    """Day number (days since the epoch) of a date-like value"""
+    return int(pd.Timestamp(value).to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+def day_window(start, end):
+    """Map an inclusive [start, end] timestamp window to a `[first, stop)` day-number range"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    # A start part-way through a day excludes that day, as `>=` would
+    first = to_day(start) + int(start != start.normalize())
+    return first, to_day(end) + 1
+
+
+class DateIndex:
+    """Day -> row offset lookup over a frame sorted by a day-resolution date column.
+
+    `offsets[d]` is the first row whose date falls on or after day `first_day + d`,
+    so any inclusive day window maps to a contiguous `iloc` slice in O(1).
+    """
+
+    def __init__(self, frame, date_column):
+        self.frame = frame
+        self.date_column = date_column
+
+        dates = frame[date_column].to_numpy(dtype="datetime64[ns]")
+        valid = ~np.isnat(dates)
+        self.n_valid = int(valid.sum())
+        if not valid[: self.n_valid].all():
+            raise ValueError(f"Frame must be sorted by '{date_column}' with NaT last")
+
+        days = dates[: self.n_valid].astype("datetime64[D]").astype(np.int64)
+        if self.n_valid and np.any(np.diff(days) < 0):
+            raise ValueError(f"Frame must be sorted by '{date_column}'")
+
+        if self.n_valid:
+            self.first_day = int(days[0])
+            self.last_day = int(days[-1])
+            self.offsets = read_only(np.searchsorted(days, np.arange(self.first_day, self.last_day + 2)))
+        else:
+            self.first_day = self.last_day = 0
+            self.offsets = read_only(np.zeros(2, dtype=np.int64))
+
+    @property
+    def min_date(self):
+        return self.frame[self.date_column].iloc[0] if self.n_valid else pd.NaT
+
+    @property
+    def max_date(self):
+        return self.frame[self.date_column].iloc[self.n_valid - 1] if self.n_valid else pd.NaT
+
+    def day_offset(self, day):
+        """Row offset of the first row on or after `day` (a day number)"""
+        d = min(max(day - self.first_day, 0), len(self.offsets) - 1)
+        return int(self.offsets[d])
+
+    def positions(self, start, end):
+        """Return the `(lo, hi)` row range covering the inclusive window [start, end]"""
+        if not self.n_valid:
+            return 0, 0
+        first, stop = day_window(start, end)
+        lo = self.day_offset(first)
+        hi = self.day_offset(stop)
+        return lo, max(lo, hi)
+
+    def slice(self, start, end):
+        """Rows dated within the inclusive window [start, end]"""
+        lo, hi = self.positions(start, end)
+        return self.frame.iloc[lo:hi]
+
+    def on(self, day):
+        """Rows dated on a single day"""
+        return self.slice(day, day)
@@ -0,0 +1,206 @@
+"""Join mosquito surveys, cases and spraying on (area, neighborhood, day or week).
+
+`KeySpace` gives every (administrative area code, neighborhood) pair an
+integer id through one hash map shared by all datasets, so the same place
+has the same key in each. `KeyedDays` keeps one dataset's rows sorted by
+(key, day) with prefix sums of its value columns: the rows of any set of keys
+over a date range are found by one vectorized binary search, and their totals
+are differences of prefix sums. `NeighborhoodJoin` builds these once and
+answers a filter spec per neighborhood or per day/week bucket, without
+merging frames on each rerun.
+"""
+import numpy as np
+import pandas as pd
+
+from aggregates import bucket_edges
+from filters import clip_to_year
+from indexes import day_window, read_only
+
+# Days are stored as offsets below this under each key in the combined sort key
+KEY_STRIDE = 1 << 32
+
+# Date column and summed value columns of each joined dataset
+JOINED_DATASETS = {
+    "mosquito": ("date", ["breteau_index", "container_index"]),
+    "cases": ("diagnosis_date", ["cases"]),
+    "spraying": ("date", ["spray_count"]),
+}
+
+
+def _key_text(values):
+    """A key column as trimmed strings; codes read as 67000340, 67000340.0 or "67000340" all match"""
+    text = pd.Series(values).astype("string").str.strip()
+    return text.str.replace(r"\.0$", "", regex=True)
+
+
+def _prefix_sums(values):
+    """Cumulative sums with a leading zero, so a row range's total is `c[hi] - c[lo]`"""
+    out = np.zeros(len(values) + 1, dtype=values.dtype)
+    np.cumsum(values, out=out[1:])
+    return out
+
+
+def _positions(lo, hi):
+    """Concatenated `range(lo[i], hi[i])` of every i, without a Python loop"""
+    lengths = hi - lo
+    starts = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(lengths.sum(), dtype=np.int64) + starts
+
+
+class KeySpace:
+    """Integer ids of (area code, neighborhood) pairs, shared by every dataset of a join"""
+
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def encode(self, areas, neighborhoods):
+        """Id of each row's key, adding keys not seen yet; -1 where either part is missing"""
+        areas, neighborhoods = pd.Series(areas), pd.Series(neighborhoods)
+        valid = (areas.notna() & neighborhoods.notna()).to_numpy()
+        out = np.full(len(valid), -1, dtype=np.int64)
+        if not valid.any():
+            return out
+        # Distinct pairs first, so only those are normalized and hashed
+        codes, uniques = pd.MultiIndex.from_arrays([areas[valid], neighborhoods[valid]]).factorize()
+        unique_areas = _key_text(uniques.get_level_values(0)).to_numpy()
+        unique_names = _key_text(uniques.get_level_values(1)).to_numpy()
+        ids = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(zip(unique_areas, unique_names)):
+            if key not in self.ids:
+                self.ids[key] = len(self.keys)
+                self.keys.append(key)
+            ids[i] = self.ids[key]
+        out[valid] = ids[codes]
+        return out
+
+    def of_neighborhoods(self, names=None):
+        """Ids of the keys in the named neighborhoods (of any area), or every id when None"""
+        if names is None:
+            return np.arange(len(self.keys), dtype=np.int64)
+        names = set(names)
+        return np.array([i for i, (_, name) in enumerate(self.keys) if name in names], dtype=np.int64)
+
+
+class KeyedDays:
+    """Rows of one dataset sorted by (key, day), with prefix sums of its value columns.
+
+    Missing values are left out of both the sums and the counts, so a mean is
+    the ratio of the two.
+    """
+
+    def __init__(self, frame, date_column, key_ids, value_columns):
+        days = frame[date_column].to_numpy().astype("datetime64[D]")
+        valid = (key_ids >= 0) & ~np.isnat(days)
+        days = days[valid].astype(np.int64)
+        self.first_day = int(days.min()) if len(days) else 0
+        sort_key = key_ids[valid] * KEY_STRIDE + (days - self.first_day)
+        order = np.argsort(sort_key, kind="stable")
+        self.sort_key = read_only(sort_key[order])
+        self.days = read_only(days[order])
+
+        self.values, self.present, self.sums, self.counts = {}, {}, {}, {}
+        for col in value_columns:
+            values = frame[col].to_numpy(dtype=np.float64, na_value=np.nan)[valid][order]
+            self.present[col] = read_only(~np.isnan(values))
+            self.values[col] = read_only(np.where(self.present[col], values, 0.0))
+            self.sums[col] = read_only(_prefix_sums(self.values[col]))
+            self.counts[col] = read_only(_prefix_sums(self.present[col].astype(np.int64)))
+
+    def __len__(self):
+        return len(self.days)
+
+    def ranges(self, keys, first_day, stop_day):
+        """`(lo, hi)` row ranges of each key over the day numbers `[first_day, stop_day)`; empty if reversed"""
+        keys = np.asarray(keys, dtype=np.int64) * KEY_STRIDE
+        first = np.clip(first_day - self.first_day, 0, KEY_STRIDE - 1)
+        stop = np.clip(stop_day - self.first_day, first, KEY_STRIDE - 1)
+        return np.searchsorted(self.sort_key, keys + first), np.searchsorted(self.sort_key, keys + stop)
+
+    def totals(self, column, lo, hi):
+        """Sum and count of non-missing values over each row range"""
+        return self.sums[column][hi] - self.sums[column][lo], self.counts[column][hi] - self.counts[column][lo]
+
+    def bucketed(self, column, lo, hi, edges):
+        """Sum and count of non-missing values per `[edges[i], edges[i + 1])` day bucket over the row ranges"""
+        rows = _positions(lo, hi)
+        bucket = np.searchsorted(edges, self.days[rows], side="right") - 1
+        n = len(edges) - 1
+        return (
+            np.bincount(bucket, weights=self.values[column][rows], minlength=n),
+            np.bincount(bucket, weights=self.present[column][rows], minlength=n),
+        )
+
+
+class NeighborhoodJoin:
+    """Mosquito surveys, cases and spraying keyed on the same (area, neighborhood) ids.
+
+    All three datasets are read over the spec's case window (clipped to its
+    year) and, when it has one, restricted to its neighborhoods.
+    """
+
+    def __init__(self, mosquito, cases, spraying):
+        self.key_space = KeySpace()
+        self.tables = {}
+        for name, frame in [("mosquito", mosquito), ("cases", cases), ("spraying", spraying)]:
+            date_column, value_columns = JOINED_DATASETS[name]
+            ids = self.key_space.encode(frame["administrative_area_code"], frame["neighborhood"])
+            self.tables[name] = KeyedDays(frame, date_column, ids, value_columns)
+
+    def _window(self, spec):
+        return day_window(*clip_to_year(spec.start, spec.end, spec.selected_year))
+
+    def neighborhoods(self, spec):
+        """One row per surveyed (area, neighborhood) in the window, highest mean Breteau index first"""
+        keys = self.key_space.of_neighborhoods(spec.neighborhoods)
+        first, stop = self._window(spec)
+        columns = {}
+        mosquito = self.tables["mosquito"]
+        lo, hi = mosquito.ranges(keys, first, stop)
+        surveys = hi - lo
+        for col in ["breteau_index", "container_index"]:
+            total, count = mosquito.totals(col, lo, hi)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                columns[col] = np.where(count > 0, total / count, np.nan)
+        for name, col in [("cases", "cases"), ("spraying", "spray_count")]:
+            columns[col] = self.tables[name].totals(col, *self.tables[name].ranges(keys, first, stop))[0]
+
+        surveyed = surveys > 0
+        areas, names = zip(*[self.key_space.keys[k] for k in keys[surveyed]]) if surveyed.any() else ((), ())
+        table = pd.DataFrame({
+            "administrative_area_code": list(areas),
+            "neighborhood": list(names),
+            "surveys": surveys[surveyed],
+            **{col: values[surveyed] for col, values in columns.items()},
+        })
+        return table.sort_values(
+            ["breteau_index", "neighborhood"], ascending=[False, True], na_position="last", kind="mergesort"
+        ).reset_index(drop=True)
+
+    def series(self, spec, bucket="week"):
+        """Per day or week of the window: mean Breteau index of the surveys, and case and spray totals.
+
+        No rows when the window is empty, e.g. a date range outside the selected year.
+        """
+        keys = self.key_space.of_neighborhoods(spec.neighborhoods)
+        first, stop = self._window(spec)
+        edges = bucket_edges(first, stop, bucket) if first < stop else np.array([first], dtype=np.int64)
+        mosquito = self.tables["mosquito"]
+        ranges = mosquito.ranges(keys, first, stop)
+        breteau, surveys = mosquito.bucketed("breteau_index", *ranges, edges)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            breteau = np.where(surveys > 0, breteau / surveys, np.nan)
+        cases = self.tables["cases"]
+        spraying = self.tables["spraying"]
+        dates = edges.astype("datetime64[D]").astype("datetime64[ns]")
+        return pd.DataFrame({
+            "date": dates[:-1],
+            "date_end": dates[1:],
+            "breteau_index": breteau,
+            "surveys": surveys.astype(np.int64),
+            "cases": cases.bucketed("cases", *cases.ranges(keys, first, stop), edges)[0],
+            "spray_count": spraying.bucketed("spray_count", *spraying.ranges(keys, first, stop), edges)[0],
+        })
@@ -0,0 +1,357 @@
+from dataclasses import dataclass
+
+import branca
+import folium
+import folium.elements
+import numpy as np
+import pandas as pd
+import streamlit_folium
+from branca.element import MacroElement
+from folium import plugins
+from folium.plugins import HeatMap
+from jinja2 import Template
+
+from spatial import heatmap_points
+
+DEFAULT_CENTER = [23.12303, 119.9416977]
+DEFAULT_ZOOM = 10
+# ~1 m, finer than the float32 coordinates the data is loaded with
+COORDINATE_DECIMALS = 5
+# Browser-synced maps of the dashboard share one group
+MAP_SYNC_GROUP = "dengue-maps"
+
+# Builds each marker in the browser from a [lat, lon, popup] row
+SPRAYING_MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'tint', prefix: 'fa', markerColor: 'blue'});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2]);
+    return marker;
+}
+"""
+
+
+def create_spraying_markers(data):
+    """Create a client-side clustered marker layer for spraying locations with custom icons"""
+    sites = data[["latitude", "longitude", "spray_count", "date"]].dropna(subset=["latitude", "longitude"])
+    popup_text = (
+        "Spraying Count: " + sites["spray_count"].astype(str)
+        + "<br>Date: " + sites["date"].astype(str)
+    )
+    # float32 coordinates would otherwise serialize with float64 noise digits
+    rows = pd.DataFrame({
+        "latitude": sites["latitude"].astype(float).round(COORDINATE_DECIMALS),
+        "longitude": sites["longitude"].astype(float).round(COORDINATE_DECIMALS),
+        "popup": popup_text,
+    })
+    return plugins.FastMarkerCluster(
+        rows.values.tolist(),
+        callback=SPRAYING_MARKER_CALLBACK,
+        name="Spraying Sites",
+    )
+
+
+class BrowserMapSync(MacroElement):
+    """Keeps the maps of a sync group on one view in the browser, without the server.
+
+    Each map posts its view on a BroadcastChannel when it moves and follows the
+    views posted by the others. The channel is scoped to the browser tab, and a map
+    rendered later starts from the group's last view.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var storage = window.sessionStorage;
+            var tab = storage.getItem("{{ this.group }}-tab");
+            if (!tab) {
+                tab = Math.random().toString(36).slice(2);
+                storage.setItem("{{ this.group }}-tab", tab);
+            }
+            var viewKey = "{{ this.group }}-view-" + tab;
+            var channel = new BroadcastChannel("{{ this.group }}-" + tab);
+            var followed = null;
+
+            function sameView(a, b) {
+                return a && b && a.zoom === b.zoom
+                    && Math.abs(a.lat - b.lat) < 1e-9 && Math.abs(a.lng - b.lng) < 1e-9;
+            }
+            function follow(view) {
+                followed = view;
+                map.setView([view.lat, view.lng], view.zoom, {animate: false});
+            }
+
+            map.on("moveend", function () {
+                var center = map.getCenter();
+                var view = {lat: center.lat, lng: center.lng, zoom: map.getZoom()};
+                // Moves made to follow another map are not posted back
+                if (sameView(view, followed)) {
+                    return;
+                }
+                storage.setItem(viewKey, JSON.stringify(view));
+                channel.postMessage(view);
+            });
+            channel.onmessage = function (event) {
+                follow(event.data);
+            };
+
+            var saved = storage.getItem(viewKey);
+            if (saved) {
+                follow(JSON.parse(saved));
+            }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, group=MAP_SYNC_GROUP):
+        super().__init__()
+        self._name = "BrowserMapSync"
+        self.group = group
+
+
+def create_heatmap_map(data, map_type="cases", radius=25, include_spray_markers=False, spray_data=None, is_effect_analysis=False, location=DEFAULT_CENTER, zoom=DEFAULT_ZOOM, sync_group=None):
+    m = folium.Map(
+        location=location,
+        zoom_start=zoom,
+        control_scale=True,
+    )
+
+    if map_type == "cases":
+        # Effect-analysis maps split their 7-day window into two colored periods
+        if is_effect_analysis and not data.empty:
+            # Two colors: one for first 3 days, one for next 4 days
+            first_color = '#ff0000'  # Red for first 3 days
+            second_color = '#0000ff'  # Blue for next 4 days
+            
+            dates = sorted(data["diagnosis_date"].dt.date.unique())
+            mid_point = dates[3] if len(dates) > 3 else dates[-1]
+            
+            # First 3 days
+            first_period = data[data["diagnosis_date"].dt.date < mid_point]
+            if not first_period.empty:
+                heat_data = heatmap_points(first_period, "cases", zoom)
+                rgb = tuple(int(first_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+                HeatMap(
+                    heat_data,
+                    radius=radius,
+                    gradient={
+                        0.4: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.2)", 
+                        0.65: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.5)", 
+                        0.9: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.8)"
+                    },
+                    min_opacity=0.2,
+                    max_opacity=0.8,
+                    name="First 3 Days"
+                ).add_to(m)
+            
+            # Next 4 days
+            second_period = data[data["diagnosis_date"].dt.date >= mid_point]
+            if not second_period.empty:
+                heat_data = heatmap_points(second_period, "cases", zoom)
+                rgb = tuple(int(second_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+                HeatMap(
+                    heat_data,
+                    radius=radius,
+                    gradient={
+                        0.4: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.2)", 
+                        0.65: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.5)", 
+                        0.9: f"rgba({rgb[0]},{rgb[1]},{rgb[2]},0.8)"
+                    },
+                    min_opacity=0.2,
+                    max_opacity=0.8,
+                    name="Next 4 Days"
+                ).add_to(m)
+            
+            folium.LayerControl().add_to(m)
+        else:
+            # Single color (blue) heatmap with proper gradient for density
+            heat_data = heatmap_points(data, "cases", zoom)
+            HeatMap(
+                heat_data,
+                radius=radius,
+                gradient={0.4: "rgba(0,0,255,0.2)", 0.65: "rgba(0,0,255,0.5)", 0.9: "rgba(0,0,255,0.8)"},
+                min_opacity=0.2,
+                max_opacity=0.8,
+            ).add_to(m)
+
+    elif map_type == "spraying":
+        # Single color (blue) heatmap for spraying data with proper gradient
+        heat_data = heatmap_points(data, "spray_count", zoom)
+        HeatMap(
+            heat_data,
+            radius=radius,
+            gradient={0.4: "rgba(0,0,255,0.2)", 0.65: "rgba(0,0,255,0.5)", 0.9: "rgba(0,0,255,0.8)"},
+            min_opacity=0.2,
+            max_opacity=0.8,
+        ).add_to(m)
+
+    if include_spray_markers and spray_data is not None:
+        create_spraying_markers(spray_data).add_to(m)
+
+    # Maps of one sync group pan and zoom together in the browser
+    if sync_group is not None:
+        BrowserMapSync(sync_group).add_to(m)
+
+    return m
+
+
+def create_tile_map(tile_url, zooms, bounds=None, error_tile_url=None, location=DEFAULT_CENTER, zoom=DEFAULT_ZOOM, sync_group=None):
+    """A map showing a pre-rendered heatmap tile pyramid (see tiles.py) over the base map.
+
+    Zoom levels outside `zooms` scale the nearest rendered level.
+    """
+    m = folium.Map(
+        location=location,
+        zoom_start=zoom,
+        control_scale=True,
+    )
+    folium.TileLayer(
+        tiles=tile_url,
+        attr="Pre-rendered heatmap",
+        name="Heatmap",
+        overlay=True,
+        control=False,
+        min_native_zoom=min(zooms),
+        max_native_zoom=max(zooms),
+        bounds=bounds,
+        error_tile_url=error_tile_url,
+    ).add_to(m)
+
+    if sync_group is not None:
+        BrowserMapSync(sync_group).add_to(m)
+
+    return m
+
+
+class TimelapseHeatMap(plugins.HeatMapWithTime):
+    """HeatMapWithTime with bounds over its points; folium's reads each frame as one point"""
+
+    def _get_self_bounds(self):
+        points = np.array([point[:2] for frame in self.data for point in frame], dtype=float).reshape(-1, 2)
+        if not len(points):
+            return [[None, None], [None, None]]
+        return [points.min(axis=0).tolist(), points.max(axis=0).tolist()]
+
+
+def create_timelapse_map(frames, labels, radius=25, location=DEFAULT_CENTER, zoom=DEFAULT_ZOOM):
+    """A map that plays precomputed heatmap frames in the browser, one per label"""
+    m = folium.Map(
+        location=location,
+        zoom_start=zoom,
+        control_scale=True,
+    )
+    TimelapseHeatMap(
+        frames,
+        index=labels,
+        radius=radius,
+        gradient={0.4: "rgba(0,0,255,0.2)", 0.65: "rgba(0,0,255,0.5)", 0.9: "rgba(0,0,255,0.8)"},
+        min_opacity=0.2,
+        max_opacity=0.8,
+        auto_play=True,
+        max_speed=10,
+        name="Cases Time-Lapse",
+    ).add_to(m)
+    return m
+
+
+def rendered_size(m):
+    """Size in bytes of the map's rendered HTML document"""
+    return len(m.get_root().render().encode("utf-8"))
+
+
+# ========================================== Rendered Maps ==========================================
+@dataclass(frozen=True)
+class RenderedMap:
+    """The Leaflet script, HTML and assets st_folium sends for one map, rendered once.
+
+    Plain strings, so one instance is cached and shown by every session at once;
+    the folium map it came from is not kept. Built with streamlit_folium's private
+    helpers, so its version is pinned; tests/test_maps.py fails if an upgrade
+    changes what st_folium sends.
+    """
+    script: str
+    html: str
+    element_id: str
+    bounds: dict
+    zoom: int | None
+    css_links: tuple
+    js_links: tuple
+
+    @property
+    def nbytes(self):
+        return len(self.script) + len(self.html)
+
+
+def _assets(element):
+    """CSS and JS links of every element under `element`, in st_folium's order"""
+    css_links, js_links = [], []
+    stack = [element]
+    while stack:
+        elem = stack.pop()
+        if isinstance(elem, branca.colormap.ColorMap):
+            js_links.insert(0, "https://cdnjs.cloudflare.com/ajax/libs/d3/3.5.5/d3.min.js")
+            js_links.insert(0, "https://d3js.org/d3.v4.min.js")
+        if isinstance(elem, (branca.colormap.ColorMap, folium.elements.JSCSSMixin)):
+            css_links.extend(href for _, href in getattr(elem, "default_css", []))
+            js_links.extend(src for _, src in getattr(elem, "default_js", []))
+        stack.extend(reversed(list(getattr(elem, "_children", {}).values())))
+    return tuple(css_links), tuple(js_links)
+
+
+def render_map(m):
+    """Render a folium map into what `st_folium(m)` would send; `m` is consumed (its ids are rewritten)"""
+    m.render()
+    script = streamlit_folium._get_map_string(m)
+    css_links, js_links = _assets(m)
+    try:
+        south_west, north_east = m.get_bounds()
+    except AttributeError:
+        south_west = north_east = [None, None]
+    return RenderedMap(
+        script=script,
+        html=streamlit_folium._get_siblings(m),
+        element_id=streamlit_folium.get_full_id(m),
+        bounds={
+            "_southWest": {"lat": south_west[0], "lng": south_west[1]},
+            "_northEast": {"lat": north_east[0], "lng": north_east[1]},
+        },
+        zoom=m.options.get("zoom"),
+        css_links=css_links,
+        js_links=js_links,
+    )
+
+
+def show_rendered_map(rendered, key=None, height=700, width=500, returned_objects=None):
+    """Display a `RenderedMap` through the st_folium component and return what the map reports back"""
+    defaults = {
+        "last_clicked": None,
+        "last_object_clicked": None,
+        "last_object_clicked_tooltip": None,
+        "last_object_clicked_popup": None,
+        "all_drawings": None,
+        "last_active_drawing": None,
+        "bounds": rendered.bounds,
+        "zoom": rendered.zoom,
+        "last_circle_radius": None,
+        "last_circle_polygon": None,
+        "selected_layers": None,
+    }
+    return streamlit_folium._component_func(
+        script=rendered.script,
+        html=rendered.html,
+        id=rendered.element_id,
+        key=streamlit_folium.generate_js_hash(rendered.script, key, False),
+        height=height,
+        width=width,
+        returned_objects=returned_objects,
+        default={k: v for k, v in defaults.items() if returned_objects is None or k in returned_objects},
+        zoom=None,
+        center=None,
+        feature_group=None,
+        return_on_hover=False,
+        layer_control=None,
+        pixelated=False,
+        css_links=list(rendered.css_links),
+        js_links=list(rendered.js_links),
+    )
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Sessions share one log file; appends are serialized so JSON lines never interleave
+_log_lock = threading.Lock()
+
+
+class StageTiming:
+    """Wall time, row counts and payload size of one named stage"""
+
+    def __init__(self, name, rows_in=None, measure_payloads=False):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.payload_bytes = None
+        self.seconds = None
+        self.details = {}
+        self.measure_payloads = measure_payloads
+
+    def payload(self, size):
+        """Record the bytes sent to the browser; `size` may be a callable, only run when payloads are measured"""
+        if callable(size):
+            if not self.measure_payloads:
+                return
+            size = size()
+        self.payload_bytes = size
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "ms": None if self.seconds is None else round(self.seconds * 1000, 3),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "payload_bytes": self.payload_bytes,
+            **self.details,
+        }
+
+
+class RerunProfiler:
+    """Times the named stages of one script rerun and appends them to a JSONL log.
+
+    Create one at the top of the script and call `finish()` at the end, or
+    before anything that ends the rerun early, such as `st.rerun()`. Payload
+    sizes that cost a serialization are only measured with `measure_payloads`.
+    `scope` names what reran: "app" for the whole script, else the fragment.
+    """
+
+    def __init__(self, session_id=None, log_path=None, measure_payloads=False, scope="app"):
+        self.session_id = session_id
+        self.log_path = log_path
+        self.measure_payloads = measure_payloads
+        self.scope = scope
+        self.finished = False
+        self.record = None
+        self.created = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.stages = []
+        self.context = {}
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        timing = StageTiming(name, rows_in, self.measure_payloads)
+        started = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.perf_counter() - started
+            self.stages.append(timing)
+
+    def rows(self):
+        return [timing.as_dict() for timing in self.stages]
+
+    def finish(self):
+        """The rerun's record; appended to the log when one is configured, on the first call only"""
+        if self.finished:
+            return self.record
+        record = {
+            "time": self.created.isoformat(timespec="milliseconds"),
+            "session": self.session_id,
+            "scope": self.scope,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "context": self.context,
+            "stages": self.rows(),
+        }
+        self.finished = True
+        self.record = record
+        if self.log_path:
+            append_jsonl(self.log_path, record)
+        return record
+
+
+def append_jsonl(path, record):
+    """Append one JSON line; a log that cannot be written never breaks the app"""
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError:
+        pass
@@ -0,0 +1,177 @@
+"""One query API for the dashboard's filters.
+
+`FilterSpec` is the sidebar state normalized to inclusive day windows, so
+equivalent selections (a specific date and a one-day range, the same
+neighborhoods picked in another order) compare and hash equal. `run_query`
+turns a spec into the filtered frames and their aggregates, and `QueryEngine`
+caches those results for every session. `RawCaseIndex` answers the same specs
+from the per-case export, aggregating the cases heatmap on every request.
+"""
+from dataclasses import dataclass
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from aggregates import top_totals
+from caching import LRUCache
+from filters import clip_to_year, filter_cases, filter_spraying, selected_neighborhood_list
+from indexes import DateIndex, day_window
+from spatial import PointGrid
+
+
+def _inclusive_dates(start, end):
+    """First and last date of a timestamp window, read the way `DateIndex.slice` reads it"""
+    first, stop = day_window(start, end)
+    return np.datetime64(first, "D").astype(date), np.datetime64(stop - 1, "D").astype(date)
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """Normalized filters: inclusive date windows, an ROC year and a neighborhood set"""
+    start: date
+    end: date
+    year: int | None = None
+    spraying_start: date | None = None
+    spraying_end: date | None = None
+    neighborhoods: tuple | None = None
+
+    @classmethod
+    def from_sidebar(cls, selected_year, date_filter_mode, start_date, end_date,
+                     spraying_date_filter_mode="Date Range", spraying_start_date=None, spraying_end_date=None,
+                     selected_neighborhoods=("All",), filter_by_neighborhood=False):
+        """Spec for the sidebar's raw widget values"""
+        if date_filter_mode == "Specific Date":
+            end_date = start_date
+        start, end = _inclusive_dates(start_date, end_date)
+
+        # Without spraying dates every spraying row is shown
+        spraying_start = spraying_end = None
+        if spraying_start_date and spraying_end_date:
+            if spraying_date_filter_mode != "Date Range":
+                spraying_end_date = spraying_start_date
+            spraying_start, spraying_end = _inclusive_dates(spraying_start_date, spraying_end_date)
+
+        neighborhoods = selected_neighborhood_list(selected_neighborhoods, filter_by_neighborhood)
+        return cls(
+            start=start,
+            end=end,
+            year=None if selected_year == "Total" else int(selected_year),
+            spraying_start=spraying_start,
+            spraying_end=spraying_end,
+            neighborhoods=None if neighborhoods is None else tuple(sorted(set(neighborhoods))),
+        )
+
+    @property
+    def selected_year(self):
+        """The year as the sidebar spells it"""
+        return "Total" if self.year is None else self.year
+
+
+@dataclass(frozen=True)
+class QueryResult:
+    """Filtered frames and aggregates of one spec; shared between sessions, so read-only"""
+    spec: FilterSpec
+    cases: pd.DataFrame
+    spraying: pd.DataFrame
+    neighborhood_totals: pd.Series
+
+    def top_neighborhoods(self, n=20, ascending=False):
+        return top_totals(self.neighborhood_totals, "neighborhood", n, ascending)
+
+    @property
+    def nbytes(self):
+        return int(
+            self.cases.memory_usage().sum()
+            + self.spraying.memory_usage().sum()
+            + self.neighborhood_totals.memory_usage()
+        )
+
+
+def run_query(spec, cases_index, spraying_index, cases_cube):
+    """Filter the date-indexed frames and aggregate the cases cube for one spec"""
+    cases = filter_cases(cases_index, spec.selected_year, "Date Range", spec.start, spec.end, spec.neighborhoods)
+    spraying = filter_spraying(
+        spraying_index, "Date Range", spec.spraying_start, spec.spraying_end, spec.neighborhoods
+    )
+    chart_start, chart_end = clip_to_year(spec.start, spec.end, spec.selected_year)
+    totals = cases_cube.totals(chart_start, chart_end, spec.neighborhoods)
+    return QueryResult(spec, cases, spraying, totals)
+
+
+def filter_frame(data, spec, date_column="diagnosis_date"):
+    """Rows of an unindexed cases frame matching a spec, in their original order"""
+    days = pd.to_datetime(data[date_column], errors="coerce").to_numpy().astype("datetime64[D]")
+    mask = (days >= np.datetime64(spec.start)) & (days <= np.datetime64(spec.end))
+    if spec.year is not None:
+        mask &= data["year"].to_numpy() == spec.year
+    if spec.neighborhoods is not None:
+        mask &= data["neighborhood"].isin(spec.neighborhoods).to_numpy()
+    return data[mask]
+
+
+class QueryEngine:
+    """Runs specs against one set of indexes, caching results across sessions.
+
+    Popular windows are computed once and shared; entries expire after `ttl`
+    seconds and the least recently used are evicted past `max_entries` or
+    `max_bytes`.
+    """
+
+    def __init__(self, cases_index, spraying_index, cases_cube, max_entries=128, max_bytes=256 * 1024 * 1024, ttl=10 * 60):
+        self.cases_index = cases_index
+        self.spraying_index = spraying_index
+        self.cases_cube = cases_cube
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, sizeof=lambda r: r.nbytes)
+
+    def run(self, spec):
+        return self.cache.get_or_create(
+            spec, lambda: run_query(spec, self.cases_index, self.spraying_index, self.cases_cube)
+        )
+
+
+class RawCaseIndex:
+    """Per-case rows whose heatmap is aggregated per spec instead of read from a rollup.
+
+    The rows are sorted by date, so a spec's window is one slice of the precomputed
+    grid cells; the year, neighborhoods and viewport are masks over that slice and the
+    counting is bincounts (see `spatial.PointGrid`), so a request stays linear in the
+    rows of its window.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.index = DateIndex(frame, "diagnosis_date")
+        self.grid = PointGrid(frame["latitude"].to_numpy(), frame["longitude"].to_numpy())
+        self.years = frame["year"].to_numpy()
+        neighborhoods = frame["neighborhood"].astype("category")
+        self.neighborhood_names = neighborhoods.cat.categories
+        self.neighborhood_codes = neighborhoods.cat.codes.to_numpy()
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _mask(self, spec, lo, hi):
+        """Rows `[lo, hi)` of the window matching the spec's year and neighborhoods, or None for all"""
+        mask = None
+        if spec.year is not None:
+            same_year = self.years[lo:hi] == spec.year
+            if not same_year.all():
+                mask = same_year
+        if spec.neighborhoods is not None:
+            codes = self.neighborhood_names.get_indexer(list(spec.neighborhoods))
+            # Code -1 (no neighborhood) reads the extra last slot, which stays False
+            allowed = np.zeros(len(self.neighborhood_names) + 1, dtype=bool)
+            allowed[codes[codes >= 0]] = True
+            in_neighborhoods = allowed[self.neighborhood_codes[lo:hi]]
+            mask = in_neighborhoods if mask is None else mask & in_neighborhoods
+        return mask
+
+    def heatmap(self, spec, zoom, box=None):
+        """Cases per grid cell at `zoom` for a spec, as a latitude/longitude/cases frame.
+
+        `box` is an optional (south, west, north, east) viewport to aggregate.
+        """
+        lo, hi = self.index.positions(*clip_to_year(spec.start, spec.end, spec.selected_year))
+        lat, lon, cases = self.grid.aggregate(lo, hi, zoom, self._mask(spec, lo, hi), box)
+        return pd.DataFrame({"latitude": lat, "longitude": lon, "cases": cases})
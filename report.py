@@ -0,0 +1,323 @@
+"""Render static dashboard reports for a grid of filters, in parallel.
+
+Every combination of year, date window and neighborhood set becomes one report
+directory holding the cases and spraying heatmaps, the neighborhood and
+timeline charts and the spray effect table, built with the dashboard's own map
+and chart builders. The CSVs are loaded and the indexes and cubes built once,
+in the parent process; the reports are rendered by a process pool whose
+workers inherit them when the platform can fork:
+
+    python report.py --output reports
+    python report.py --years 104 112 --windows all 2015-08-01:2015-10-31 --neighborhoods All "<name>,<name>" --png
+"""
+import argparse
+import hashlib
+import html
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+
+import pandas as pd
+
+from aggregates import choose_bucket, spray_effect_table
+from charts import neighborhood_bar_chart, timeline_chart
+from dataset import DATA_DIR, load_cube, load_data, load_timeline
+from filters import clip_to_year, drop_incomplete
+from indexes import DateIndex
+from maps import DEFAULT_ZOOM, create_heatmap_map
+from query import FilterSpec, run_query
+from tiles import LAYERS, heatmap_image
+
+REPORTS_DIR = "reports"
+INDEX_NAME = "index.html"
+# Altair exports PNGs through vl-convert; without it the charts are HTML only
+CHART_PNG = importlib.util.find_spec("vl_convert") is not None
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+iframe {{ border: 1px solid #ddd; width: 100%; }}
+.maps {{ display: grid; grid-template-columns: 1fr 1fr; gap: 1em; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ddd; padding: 0.2em 0.6em; text-align: right; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+# ========================================== Shared Data ==========================================
+class ReportContext:
+    """The indexes and cubes every report reads, built once and shared with the workers"""
+
+    def __init__(self, data_dir=DATA_DIR):
+        data, dengue_spraying = load_data(data_dir)
+        self.cases_index = DateIndex(data, "diagnosis_date")
+        self.spraying_index = DateIndex(dengue_spraying, "date")
+        cubes = {}
+        self.cases_cube = load_cube("neighborhood", "day", "cases", data_dir, cubes=cubes)
+        self.spraying_cube = load_cube("neighborhood", "day", "spraying", data_dir, cubes=cubes)
+        self.spray_effects = spray_effect_table(self.cases_cube, self.spraying_cube)
+        self.cases_timeline = load_timeline("cases", data_dir, cubes=cubes)
+        self.spraying_timeline = load_timeline("spraying", data_dir, cubes=cubes)
+        self.years = sorted(int(y) for y in data["year"].dropna().unique())
+        self.neighborhoods = set(data["neighborhood"].dropna().unique())
+        self.min_date = min(self.cases_index.min_date, self.spraying_index.min_date)
+        self.max_date = max(self.cases_index.max_date, self.spraying_index.max_date)
+
+
+# Set in the parent before the pool starts, so forked workers inherit it
+_context = None
+
+
+def _init_worker(data_dir):
+    global _context
+    if _context is None:
+        # Spawned workers (no fork on this platform) load their own copy
+        _context = ReportContext(data_dir)
+
+
+def _render(job):
+    return render_report(_context, *job)
+
+
+# ========================================== Jobs ==========================================
+def parse_window(text):
+    """"all" or "YYYY-MM-DD:YYYY-MM-DD" as a (start, end) pair; None ends are open"""
+    if text == "all":
+        return None, None
+    start, _, end = text.partition(":")
+    return date.fromisoformat(start), date.fromisoformat(end or start)
+
+
+def parse_neighborhoods(text):
+    """"All" or comma-separated neighborhood names, as the sidebar's selection"""
+    return ["All"] if text == "All" else [name.strip() for name in text.split(",") if name.strip()]
+
+
+def build_jobs(context, years, windows, neighborhood_sets):
+    """A filter spec per (year, window, neighborhood set), skipping windows outside their year.
+
+    Cases and spraying share each window, clipped to the year.
+    """
+    specs = []
+    for year in years:
+        for window_start, window_end in windows:
+            start, end = clip_to_year(window_start or context.min_date, window_end or context.max_date, year)
+            if start > end:
+                continue
+            for selection in neighborhood_sets:
+                specs.append(FilterSpec.from_sidebar(
+                    year, "Date Range", start, end, "Date Range", start, end, selection, filter_by_neighborhood=True,
+                ))
+    return specs
+
+
+def report_name(spec):
+    """Directory name of a spec's report, e.g. "104_20150101-20151231_all" """
+    if spec.neighborhoods is None:
+        area = "all"
+    else:
+        digest = hashlib.sha1("\n".join(spec.neighborhoods).encode("utf-8")).hexdigest()[:8]
+        area = f"{len(spec.neighborhoods)}n-{digest}"
+    return f"{spec.selected_year}_{spec.start:%Y%m%d}-{spec.end:%Y%m%d}_{area}"
+
+
+def report_title(spec):
+    year = "All years" if spec.year is None else f"Year {spec.year}"
+    area = "all neighborhoods" if spec.neighborhoods is None else ", ".join(spec.neighborhoods)
+    return f"{year}, {spec.start} to {spec.end}, {area}"
+
+
+# ========================================== Rendering ==========================================
+def _frame(path, height):
+    return f'<iframe src="{html.escape(path)}" height="{height}"></iframe>'
+
+
+def _save_heatmap(frame, map_type, name, out_dir, radius, zoom, png, **options):
+    """Save a heatmap map as HTML (and PNG); returns the markup showing it"""
+    if frame.empty:
+        return f"<p>No {map_type} data for this report.</p>"
+    create_heatmap_map(frame, map_type=map_type, radius=radius, zoom=zoom, **options).save(os.path.join(out_dir, f"{name}.html"))
+    if png:
+        # Two levels finer than the map opens at, so the still image keeps street-level detail
+        weights = frame[LAYERS[map_type]["weight_column"]]
+        image, _ = heatmap_image(frame["latitude"], frame["longitude"], weights, radius, zoom + 2)
+        if image is not None:
+            image.save(os.path.join(out_dir, f"{name}.png"))
+    return _frame(f"{name}.html", 500)
+
+
+def _save_chart(chart, name, out_dir, png):
+    chart.save(os.path.join(out_dir, f"{name}.html"))
+    if png and CHART_PNG:
+        chart.save(os.path.join(out_dir, f"{name}.png"))
+    return _frame(f"{name}.html", 480 if name == "neighborhoods" else 900)
+
+
+def render_report(context, spec, out_dir, radius=25, zoom=DEFAULT_ZOOM, n_neighborhoods=20, png=False, spray_dates=()):
+    """Write one spec's report into `out_dir/<report_name>`; returns a summary of it"""
+    started = time.perf_counter()
+    name = report_name(spec)
+    report_dir = os.path.join(out_dir, name)
+    os.makedirs(report_dir, exist_ok=True)
+
+    result = run_query(spec, context.cases_index, context.spraying_index, context.cases_cube)
+    cases = drop_incomplete(result.cases, ["latitude", "longitude", "cases"])
+    spraying = drop_incomplete(result.spraying, ["latitude", "longitude", "spray_count"])
+    chart_start, chart_end = clip_to_year(spec.start, spec.end, spec.selected_year)
+
+    body = [
+        f"<p>{int(cases['cases'].sum())} cases, {int(spraying['spray_count'].sum())} sprays.</p>",
+        '<div class="maps"><div><h2>Dengue Fever Cases Heatmap</h2>',
+        _save_heatmap(cases, "cases", "cases_map", report_dir, radius, zoom, png),
+        "</div><div><h2>Dengue Spraying Heatmap</h2>",
+        _save_heatmap(spraying, "spraying", "spraying_map", report_dir, radius, zoom, png),
+        "</div></div>",
+        "<h2>Dengue Fever Cases by Neighborhood</h2>",
+        _save_chart(neighborhood_bar_chart(result.top_neighborhoods(n=n_neighborhoods)), "neighborhoods", report_dir, png),
+    ]
+
+    bucket = choose_bucket(chart_start, chart_end)
+    chart = timeline_chart(
+        context.spraying_timeline.bucketed(chart_start, chart_end, bucket),
+        context.cases_timeline.bucketed(chart_start, chart_end, bucket),
+        bucket,
+    )
+    body += [f"<h2>Timeline ({bucket} totals)</h2>", _save_chart(chart, "timeline", report_dir, png)]
+
+    # City-wide, as in the dashboard's table
+    effects = context.spray_effects
+    spray_days = effects["spray_date"].dt.normalize()
+    effects = effects[(spray_days >= pd.Timestamp(chart_start)) & (spray_days <= pd.Timestamp(chart_end))]
+    body += ["<h2>Spraying Effect (cases 7 days before and after)</h2>", effects.to_html(index=False, float_format="%.1f")]
+
+    for spray_date in spray_dates:
+        if not chart_start <= pd.Timestamp(spray_date) <= chart_end:
+            continue
+        sites = context.spraying_index.on(spray_date)
+        if spec.neighborhoods is not None:
+            sites = sites[sites["neighborhood"].isin(spec.neighborhoods)]
+        sites = drop_incomplete(sites, ["latitude", "longitude", "spray_count"])
+        body.append(f'<h2>Spraying on {spray_date}</h2><div class="maps">')
+        for label, first in [("before", pd.Timestamp(spray_date) - pd.Timedelta(days=7)), ("after", pd.Timestamp(spray_date))]:
+            window = context.cases_index.slice(first, first + pd.Timedelta(days=6))
+            body += [
+                f"<div><h3>7 days {label}</h3>",
+                _save_heatmap(
+                    window, "cases", f"spray_{spray_date:%Y%m%d}_{label}", report_dir, radius, zoom, png,
+                    is_effect_analysis=True, include_spray_markers=True, spray_data=sites,
+                ),
+                f"<p>{int(window['cases'].sum())} cases</p></div>",
+            ]
+        body.append("</div>")
+
+    title = report_title(spec)
+    with open(os.path.join(report_dir, INDEX_NAME), "w", encoding="utf-8") as f:
+        f.write(PAGE.format(title=html.escape(title), body="\n".join(body)))
+    return {
+        "name": name,
+        "title": title,
+        "cases": int(cases["cases"].sum()),
+        "spray_count": int(spraying["spray_count"].sum()),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def write_index(summaries, out_dir):
+    """A page linking every report, with its totals"""
+    rows = "\n".join(
+        f'<tr><td style="text-align: left"><a href="{html.escape(s["name"])}/{INDEX_NAME}">{html.escape(s["title"])}</a></td>'
+        f'<td>{s["cases"]}</td><td>{s["spray_count"]}</td></tr>'
+        for s in summaries
+    )
+    generated = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    body = (
+        f"<p>Generated {generated}.</p>"
+        f"<table><tr><th>Report</th><th>Cases</th><th>Sprays</th></tr>\n{rows}\n</table>"
+    )
+    with open(os.path.join(out_dir, INDEX_NAME), "w", encoding="utf-8") as f:
+        f.write(PAGE.format(title="Dengue Fever Reports", body=body))
+
+
+# ========================================== Entry Point ==========================================
+def run(specs, out_dir, data_dir=DATA_DIR, workers=None, radius=25, zoom=DEFAULT_ZOOM, n_neighborhoods=20, png=False, spray_dates=()):
+    """Render every spec across `workers` processes (all cores by default); returns the summaries"""
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(spec, out_dir, radius, zoom, n_neighborhoods, png, tuple(spray_dates)) for spec in specs]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if workers == 1:
+        summaries = [_render(job) for job in jobs]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork" if "fork" in methods else "spawn"),
+            initializer=_init_worker,
+            initargs=(data_dir,),
+        )
+        with pool:
+            summaries = list(pool.map(_render, jobs))
+    write_index(summaries, out_dir)
+    return summaries
+
+
+def main(argv=None):
+    global _context
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=DATA_DIR, help="directory holding the dashboard CSVs")
+    parser.add_argument("--output", default=REPORTS_DIR, help="directory the reports are written to")
+    parser.add_argument("--years", nargs="+", help='ROC years, or "Total"; every year and "Total" by default')
+    parser.add_argument("--windows", nargs="+", default=["all"], help='"all" or START:END dates (YYYY-MM-DD), clipped to each year')
+    parser.add_argument("--neighborhoods", nargs="+", default=["All"], help='"All" or comma-separated neighborhood names, one set per argument')
+    parser.add_argument("--spray-dates", nargs="+", type=date.fromisoformat, default=[], help="add before/after maps for these spray dates")
+    parser.add_argument("--radius", type=int, default=25, help="heatmap radius in pixels")
+    parser.add_argument("--zoom", type=int, default=DEFAULT_ZOOM, help="zoom level of the maps")
+    parser.add_argument("--top", type=int, default=20, help="neighborhoods in the bar chart")
+    parser.add_argument("--png", action="store_true", help="also write PNGs of the heatmaps and charts")
+    parser.add_argument("--workers", type=int, help="worker processes; all cores by default")
+    args = parser.parse_args(argv)
+    if args.png and not CHART_PNG:
+        print("vl-convert-python is not installed: only the heatmaps get PNGs", file=sys.stderr)
+
+    try:
+        windows = [parse_window(w) for w in args.windows]
+    except ValueError as e:
+        parser.error(f"invalid window: {e}")
+
+    started = time.perf_counter()
+    _context = ReportContext(args.data)
+    neighborhood_sets = [parse_neighborhoods(n) for n in args.neighborhoods]
+    unknown = {name for names in neighborhood_sets for name in names if name != "All"} - _context.neighborhoods
+    if unknown:
+        parser.error(f"unknown neighborhoods: {', '.join(sorted(unknown))}")
+    years = args.years or ["Total"] + [str(y) for y in _context.years]
+    years = ["Total" if y == "Total" else int(y) for y in years]
+    specs = build_jobs(_context, years, windows, neighborhood_sets)
+    print(f"Loaded the data in {time.perf_counter() - started:.1f} s; rendering {len(specs)} reports", file=sys.stderr)
+
+    summaries = run(
+        specs, args.output, args.data, args.workers,
+        radius=args.radius, zoom=args.zoom, n_neighborhoods=args.top, png=args.png, spray_dates=args.spray_dates,
+    )
+    print(
+        f"Wrote {len(summaries)} reports to {args.output} in {time.perf_counter() - started:.1f} s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import os
+
+import pandas as pd
+
+# Coordinates in the case exports carry 3 decimals (~100 m), which is the location grain
+LOCATION_DECIMALS = 3
+
+# Resolution levels from finest to coarsest
+SPATIAL_LEVELS = ["location", "neighborhood", "area", "city"]
+TEMPORAL_LEVELS = ["day", "week", "month"]
+
+# Per-row tables the rollups are counted from: their date column, the name of
+# the count column, and the decimals locations are rounded to (None keeps them).
+# Spray sites are exact meeting points, so they are not rounded.
+ROLLUP_SOURCES = {
+    "cases": {"date_column": "diagnosis_date", "value_column": "cases", "location_decimals": LOCATION_DECIMALS},
+    "spraying": {"date_column": "date", "value_column": "spray_count", "location_decimals": None},
+}
+
+ROLLUPS = {
+    "location_day": {
+        "dataset": "cases",
+        "file": "dengue_fever_cases_by_location_day.csv",
+        "spatial": "location",
+        "temporal": "day",
+        "keys": ["administrative_area_code", "neighborhood", "latitude", "longitude", "diagnosis_date"],
+        "date_column": "diagnosis_date",
+        "category_column": "neighborhood",
+        "value_column": "cases",
+        "numeric_columns": ["latitude", "longitude"],
+    },
+    "neighborhood_day": {
+        "dataset": "cases",
+        "file": "dengue_fever_cases_by_neighborhood_day.csv",
+        "spatial": "neighborhood",
+        "temporal": "day",
+        "keys": ["administrative_area_code", "neighborhood", "diagnosis_date"],
+        "date_column": "diagnosis_date",
+        "category_column": "neighborhood",
+        "value_column": "cases",
+        "numeric_columns": [],
+    },
+    "area_week": {
+        "dataset": "cases",
+        "file": "dengue_fever_cases_by_area_week.csv",
+        "spatial": "area",
+        "temporal": "week",
+        "keys": ["administrative_area_code", "week_start"],
+        "date_column": "week_start",
+        "category_column": "administrative_area_code",
+        "value_column": "cases",
+        "numeric_columns": [],
+    },
+    "spraying_site_day": {
+        "dataset": "spraying",
+        "file": "dengue_spraying_by_site_day.csv",
+        "spatial": "location",
+        "temporal": "day",
+        "keys": ["administrative_area_code", "neighborhood", "meeting_location", "latitude", "longitude", "date"],
+        "date_column": "date",
+        "category_column": "neighborhood",
+        "value_column": "spray_count",
+        "numeric_columns": ["latitude", "longitude"],
+    },
+    "spraying_neighborhood_day": {
+        "dataset": "spraying",
+        "file": "dengue_spraying_by_neighborhood_day.csv",
+        "spatial": "neighborhood",
+        "temporal": "day",
+        "keys": ["administrative_area_code", "neighborhood", "date"],
+        "date_column": "date",
+        "category_column": "neighborhood",
+        "value_column": "spray_count",
+        "numeric_columns": [],
+    },
+    "spraying_area_week": {
+        "dataset": "spraying",
+        "file": "dengue_spraying_by_area_week.csv",
+        "spatial": "area",
+        "temporal": "week",
+        "keys": ["administrative_area_code", "week_start"],
+        "date_column": "week_start",
+        "category_column": "administrative_area_code",
+        "value_column": "spray_count",
+        "numeric_columns": [],
+    },
+}
+
+
+def week_start(dates):
+    """Monday of the week each date falls in"""
+    return dates - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+
+
+def build_rollups(frame, dataset="cases"):
+    """Row counts keyed at every rollup resolution of `dataset` from its per-row table"""
+    source = ROLLUP_SOURCES[dataset]
+    frame = frame.copy()
+    frame[source["date_column"]] = pd.to_datetime(frame[source["date_column"]], errors="coerce")
+    frame = frame.dropna(subset=[source["date_column"]])
+    for col in ["latitude", "longitude"]:
+        frame[col] = pd.to_numeric(frame[col], errors="coerce")
+        if source["location_decimals"] is not None:
+            frame[col] = frame[col].round(source["location_decimals"])
+    frame["week_start"] = week_start(frame[source["date_column"]])
+
+    rollups = {}
+    for name, spec in ROLLUPS.items():
+        if spec["dataset"] != dataset:
+            continue
+        rollup = (
+            frame.groupby(spec["keys"], dropna=False, sort=False)
+            .size()
+            .rename(spec["value_column"])
+            .reset_index()
+        )
+        rollups[name] = _finish_rollup(rollup, spec)
+    return rollups
+
+
+def merge_rollups(parts, dataset="cases"):
+    """Add up rollups of `dataset` counted over separate slices of its rows (e.g. one per year)"""
+    rollups = {}
+    for name, spec in ROLLUPS.items():
+        if spec["dataset"] != dataset:
+            continue
+        # Weeks that straddle a new year are counted in both years' slices
+        rollup = pd.concat([part[name] for part in parts], ignore_index=True)
+        rollup[spec["date_column"]] = pd.to_datetime(rollup[spec["date_column"]], format="%Y/%m/%d")
+        rollup = (
+            rollup.groupby(spec["keys"], dropna=False, sort=False)[spec["value_column"]]
+            .sum()
+            .reset_index()
+        )
+        rollups[name] = _finish_rollup(rollup, spec)
+    return rollups
+
+
+def _finish_rollup(rollup, spec):
+    # ROC year of each row, then rows in date order with the date written the way the source CSVs write it
+    date_column = spec["date_column"]
+    rollup["year"] = rollup[date_column].dt.year - 1911
+    rollup = rollup.sort_values([date_column] + [k for k in spec["keys"] if k != date_column], kind="mergesort")
+    rollup[date_column] = rollup[date_column].dt.strftime("%Y/%m/%d")
+    return rollup.reset_index(drop=True)
+
+
+def read_rollups(directory, dataset="cases"):
+    return {
+        name: pd.read_csv(os.path.join(directory, spec["file"]))
+        for name, spec in ROLLUPS.items()
+        if spec["dataset"] == dataset
+    }
+
+
+def save_rollups(rollups, output_dir):
+    for name, rollup in rollups.items():
+        rollup.to_csv(os.path.join(output_dir, ROLLUPS[name]["file"]), index=False, encoding="utf-8")
+
+
+def write_rollups(frame, output_dir, dataset="cases"):
+    save_rollups(build_rollups(frame, dataset), output_dir)
+
+
+def resolves_temporal(level, temporal):
+    """Whether rows at `level` add up exactly into `temporal` buckets; weeks straddle months"""
+    return level == temporal or level == "day"
+
+
+def select_rollup(spatial="city", temporal="day", dataset="cases"):
+    """Name of the coarsest rollup of `dataset` that still resolves the requested spatial and temporal level"""
+    s = SPATIAL_LEVELS.index(spatial)
+    TEMPORAL_LEVELS.index(temporal)  # unknown levels raise, as unknown spatial ones do
+    candidates = [
+        name for name, spec in ROLLUPS.items()
+        if spec["dataset"] == dataset
+        and SPATIAL_LEVELS.index(spec["spatial"]) <= s
+        and resolves_temporal(spec["temporal"], temporal)
+    ]
+    if not candidates:
+        raise ValueError(f"No {dataset} rollup resolves {spatial} x {temporal}")
+    return max(
+        candidates,
+        key=lambda name: (
+            SPATIAL_LEVELS.index(ROLLUPS[name]["spatial"]) + TEMPORAL_LEVELS.index(ROLLUPS[name]["temporal"])
+        ),
+    )
@@ -0,0 +1,172 @@
+"""Read-only datasets shared by every session, reloaded when the CSVs change.
+
+A `DatasetSnapshot` holds the loaded frames with everything built from them
+(date indexes, cubes, spatial indexes, the query engine), fully prepared
+before anyone sees it. Nothing mutates a snapshot after `build`, so sessions
+read it concurrently without locks. `SnapshotStore` polls `data/` from a
+background thread; when the CSVs change it builds a new snapshot next to the
+old one and swaps it in with a single assignment. A rerun reads `current`
+once and keeps using that snapshot until it ends, so a reload never changes
+the data under a running session.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from aggregates import DailyCube, Timeline
+from data_cache import CACHE_DIR
+from dataset import CASES_FILE, DATA_DIR, MOSQUITO_FILE, load_cube, load_data, load_timeline
+from indexes import DateIndex
+from query import QueryEngine
+from rollups import ROLLUPS
+from spatial import GridIndex
+
+# Every CSV the dashboard reads, including the lazily loaded per-case export and
+# the mosquito surveys, whose first appearance counts as a change too
+WATCHED_FILES = [ROLLUPS[name]["file"] for name in ROLLUPS] + [CASES_FILE, MOSQUITO_FILE]
+
+
+def data_signature(data_dir=DATA_DIR, files=WATCHED_FILES):
+    """(name, mtime, size) of each watched file that exists; changes whenever one is rewritten"""
+    signature = []
+    for name in files:
+        try:
+            stat = os.stat(os.path.join(data_dir, name))
+        except OSError:
+            continue
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def signature_version(signature):
+    """Short, stable id of a data signature, for cache keys"""
+    return hashlib.sha256(json.dumps(signature).encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class DatasetSnapshot:
+    """Frames and indexes of one version of the data; shared between sessions, so read-only.
+
+    The index and cube arrays are marked non-writeable, so an accidental write
+    raises instead of corrupting every session. The frames cannot be locked the
+    same way: callers must not modify them or the slices the indexes return
+    from them, and must take a `.copy()` before adding or changing columns.
+    """
+    version: str
+    signature: tuple
+    data_dir: str
+    cases: pd.DataFrame
+    spraying: pd.DataFrame
+    cases_index: DateIndex
+    spraying_index: DateIndex
+    cases_cube: DailyCube
+    spraying_cube: DailyCube
+    cases_timeline: Timeline
+    spraying_timeline: Timeline
+    cases_spatial_index: GridIndex
+    spraying_spatial_index: GridIndex
+    queries: QueryEngine
+    loaded_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @classmethod
+    def build(cls, data_dir=DATA_DIR, cache_dir=CACHE_DIR):
+        """Load the CSVs and build everything the dashboard reads from them"""
+        # Taken first: a file rewritten during the load makes the next poll differ and reload again
+        signature = data_signature(data_dir)
+        cases, spraying = load_data(data_dir, cache_dir)
+        cases_index, spraying_index = DateIndex(cases, "diagnosis_date"), DateIndex(spraying, "date")
+        # Neighborhood rankings and correlations only need neighborhood x day; the
+        # city-wide timelines read each bucket from the coarsest rollup that resolves it
+        cubes = {}
+        cases_cube = load_cube("neighborhood", "day", "cases", data_dir, cache_dir, cubes)
+        return cls(
+            version=signature_version(signature),
+            signature=signature,
+            data_dir=data_dir,
+            cases=cases,
+            spraying=spraying,
+            cases_index=cases_index,
+            spraying_index=spraying_index,
+            cases_cube=cases_cube,
+            spraying_cube=load_cube("neighborhood", "day", "spraying", data_dir, cache_dir, cubes),
+            cases_timeline=load_timeline("cases", data_dir, cache_dir, cubes),
+            spraying_timeline=load_timeline("spraying", data_dir, cache_dir, cubes),
+            cases_spatial_index=GridIndex(cases),
+            spraying_spatial_index=GridIndex(spraying),
+            queries=QueryEngine(cases_index, spraying_index, cases_cube),
+        )
+
+
+class SnapshotStore:
+    """The current snapshot, replaced by a rebuilt one when the watched CSVs change.
+
+    `check` compares the files' signature with the current snapshot's and only
+    reloads once it has held still for one poll, so files still being written
+    are not read. A failed reload keeps the current snapshot and is reported in
+    `error` until a later version loads.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, cache_dir=CACHE_DIR, interval=5.0):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.interval = interval
+        self.current = DatasetSnapshot.build(data_dir, cache_dir)
+        self.error = None
+        self.reloads = 0
+        self._pending = None
+        self._failed = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """Poll once; True if a new snapshot was swapped in"""
+        signature = data_signature(self.data_dir)
+        if signature == self.current.signature or signature == self._failed:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        self._pending = None
+        try:
+            snapshot = DatasetSnapshot.build(self.data_dir, self.cache_dir)
+        except Exception as e:
+            self._failed = signature
+            self.error = f"{type(e).__name__}: {e}"
+            return False
+        # One assignment: a rerun sees either the old snapshot or the new one, never a mix
+        self.current = snapshot
+        self.error = None
+        self._failed = None
+        self.reloads += 1
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Start polling in a daemon thread; no-op if already running"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="dataset-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self):
+        return {
+            "version": self.current.version,
+            "loaded_at": self.current.loaded_at.isoformat(timespec="seconds"),
+            "reloads": self.reloads,
+            "error": self.error,
+        }
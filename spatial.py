@@ -0,0 +1,282 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from indexes import read_only
+
+EARTH_RADIUS_M = 6_371_000
+
+# Grid cells are kept well under the heatmap blur radius so binning is not visible
+CELL_PIXELS = 4
+
+
+def grid_cell_size(zoom, cell_pixels=CELL_PIXELS):
+    """Degrees covered by a grid cell of `cell_pixels` screen pixels at a Leaflet zoom level"""
+    return 360.0 / (256 * 2 ** float(zoom)) * cell_pixels
+
+
+def _aggregate_cells(lat, lon, weights, cell_size, groups=None):
+    """Weighted centroid and total weight of every non-empty (group, cell) pair.
+
+    Cells come back ordered by group, and the group of each is returned as well.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(lat) == 0:
+        return lat, lon, weights, np.zeros(0, dtype=np.int64)
+
+    ix = np.floor(lon / cell_size).astype(np.int64)
+    iy = np.floor(lat / cell_size).astype(np.int64)
+    ix -= ix.min()
+    iy -= iy.min()
+    keys, inverse = np.unique(iy * (int(ix.max()) + 1) + ix, return_inverse=True)
+    n_cells = len(keys)
+    if groups is not None:
+        # Dense cell numbers keep group * n_cells + cell small whatever the coordinate spread
+        keys, inverse = np.unique(np.asarray(groups, dtype=np.int64) * n_cells + inverse, return_inverse=True)
+
+    total = np.bincount(inverse, weights=weights, minlength=len(keys))
+    count = np.bincount(inverse, minlength=len(keys))
+    # Cells whose weights sum to zero fall back to the plain mean position
+    denom = np.where(total != 0, total, count)
+    w = np.where(total[inverse] != 0, weights, 1.0)
+    cell_lat = np.bincount(inverse, weights=lat * w, minlength=len(keys)) / denom
+    cell_lon = np.bincount(inverse, weights=lon * w, minlength=len(keys)) / denom
+    return cell_lat, cell_lon, total, keys // n_cells
+
+
+def aggregate_to_grid(lat, lon, weights, cell_size):
+    """Bin points into a regular lat/lon grid.
+
+    Returns `(lat, lon, weight)` arrays with one point per non-empty cell, placed at
+    the weighted centroid of the points that fell into it.
+    """
+    return _aggregate_cells(lat, lon, weights, cell_size)[:3]
+
+
+def heatmap_points(df, weight_column, zoom, precision=5):
+    """Grid-aggregated `[lat, lon, weight]` rows for a folium HeatMap at the given zoom"""
+    points = df[["latitude", "longitude", weight_column]].dropna()
+    lat, lon, weight = aggregate_to_grid(
+        points["latitude"].to_numpy(),
+        points["longitude"].to_numpy(),
+        points[weight_column].to_numpy(),
+        grid_cell_size(zoom),
+    )
+    return np.column_stack([lat.round(precision), lon.round(precision), weight]).tolist()
+
+
+def heatmap_frames(df, weight_column, date_column, edges, zoom, precision=5):
+    """Grid-aggregated HeatMapWithTime frames, one per `[edges[i], edges[i + 1])` day-number bucket.
+
+    All frames are binned in one pass over (frame, cell) pairs. Weights are scaled
+    by the heaviest cell of any frame into the (0, 1] range the layer expects.
+    """
+    points = df[["latitude", "longitude", weight_column, date_column]].dropna()
+    days = points[date_column].to_numpy().astype("datetime64[D]").astype(np.int64)
+    frame = np.searchsorted(edges, days, side="right") - 1
+    inside = (frame >= 0) & (frame < len(edges) - 1)
+
+    lat, lon, weight, frame = _aggregate_cells(
+        points["latitude"].to_numpy()[inside],
+        points["longitude"].to_numpy()[inside],
+        points[weight_column].to_numpy()[inside],
+        grid_cell_size(zoom),
+        frame[inside],
+    )
+    if len(weight) and weight.max() > 0:
+        weight = weight / weight.max()
+    rows = np.column_stack([lat.round(precision), lon.round(precision), weight.round(4)]).tolist()
+    bounds = np.searchsorted(frame, np.arange(len(edges)))
+    return [rows[bounds[i]:bounds[i + 1]] for i in range(len(edges) - 1)]
+
+
+class PointGrid:
+    """Cell coordinates of every point at `max_zoom`, for bincount heatmaps at any coarser zoom.
+
+    Cells are counted from a multiple of the zoom-0 cell, so shifting the coordinates
+    right by `max_zoom - zoom` bits gives exactly the cells `aggregate_to_grid` uses at
+    that zoom. Aggregating a range of points is then shifts and bincounts, without the
+    sort a groupby or `np.unique` needs. Each point weighs 1; points without valid
+    coordinates are never counted.
+    """
+
+    def __init__(self, lat, lon, max_zoom=18):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.max_zoom = max_zoom
+        valid = (
+            np.isfinite(self.lat) & np.isfinite(self.lon) & (np.abs(self.lat) <= 90) & (np.abs(self.lon) <= 180)
+        )
+
+        self.cell_size = grid_cell_size(max_zoom)
+        top = grid_cell_size(0)
+        self.lat0 = np.floor(self.lat[valid].min() / top) * top if valid.any() else 0.0
+        self.lon0 = np.floor(self.lon[valid].min() / top) * top if valid.any() else 0.0
+        # int32 holds the whole globe at zoom 18; invalid points are marked -1
+        self.x = np.full(len(self.lat), -1, dtype=np.int32)
+        self.y = np.full(len(self.lat), -1, dtype=np.int32)
+        self.x[valid] = np.floor((self.lon[valid] - self.lon0) / self.cell_size)
+        self.y[valid] = np.floor((self.lat[valid] - self.lat0) / self.cell_size)
+
+    def __len__(self):
+        return len(self.x)
+
+    def _box_cells(self, box):
+        south, west, north, east = box
+        x0, x1 = np.floor((np.array([west, east]) - self.lon0) / self.cell_size)
+        y0, y1 = np.floor((np.array([south, north]) - self.lat0) / self.cell_size)
+        return x0, y0, x1, y1
+
+    def aggregate(self, lo, hi, zoom, mask=None, box=None):
+        """Centroid and point count of each non-empty cell at `zoom` over the points `[lo, hi)`.
+
+        `mask` (over those points) and `box`, a (south, west, north, east) tuple, narrow
+        the points further. Returns `(lat, lon, weight)` like `aggregate_to_grid`.
+        """
+        x, y = self.x[lo:hi], self.y[lo:hi]
+        keep = x >= 0
+        if mask is not None:
+            keep &= mask
+        if box is not None:
+            x0, y0, x1, y1 = self._box_cells(box)
+            keep &= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        lat, lon = self.lat[lo:hi], self.lon[lo:hi]
+        if not keep.all():
+            x, y, lat, lon = x[keep], y[keep], lat[keep], lon[keep]
+        if not len(x):
+            return lat, lon, np.zeros(0)
+
+        shift = self.max_zoom - min(max(int(zoom), 0), self.max_zoom)
+        cx, cy = x >> shift, y >> shift
+        cx -= cx.min()
+        cy -= cy.min()
+        nx = int(cx.max()) + 1
+        cells = cy.astype(np.int64) * nx + cx
+        span = nx * (int(cy.max()) + 1)
+
+        # A dense bincount over every cell in the span is cheapest while the span stays
+        # near the number of points; wide sparse spans are renumbered by hashing, not sorting
+        if span > max(1 << 16, min(1 << 22, 8 * len(cells))):
+            cells, uniques = pd.factorize(cells)
+            span = len(uniques)
+        count = np.bincount(cells, minlength=span)
+        occupied = np.flatnonzero(count)
+        count = count[occupied]
+        cell_lat = np.bincount(cells, weights=lat, minlength=span)[occupied] / count
+        cell_lon = np.bincount(cells, weights=lon, minlength=span)[occupied] / count
+        return cell_lat, cell_lon, count.astype(np.float64)
+
+
+def _core_extent(values):
+    """Span of the bulk of the values: the interquartile range padded by three times its width"""
+    if not len(values):
+        return 0.0, 0.0
+    lo, hi = np.quantile(values, [0.25, 0.75])
+    pad = max(3 * (hi - lo), 1e-6)
+    return max(values.min(), lo - pad), min(values.max(), hi + pad)
+
+
+class GridIndex:
+    """Rows of a frame bucketed by a coarse lat/lon grid for bounding-box queries.
+
+    The grid spans the bulk of the points (outliers are clamped into the edge
+    cells), and the rows of each cell are stored contiguously so a query only
+    touches the cells overlapping the box.
+    """
+
+    def __init__(self, frame, cell_size=0.01, max_cells=1_000_000):
+        lat = frame["latitude"].to_numpy(dtype=np.float64)
+        lon = frame["longitude"].to_numpy(dtype=np.float64)
+        positions = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        lat, lon = lat[positions], lon[positions]
+
+        self.lat0, lat1 = _core_extent(lat)
+        self.lon0, lon1 = _core_extent(lon)
+        while ((lat1 - self.lat0) / cell_size + 1) * ((lon1 - self.lon0) / cell_size + 1) > max_cells:
+            cell_size *= 2
+        self.cell_size = cell_size
+        self.nx = int((lon1 - self.lon0) // cell_size) + 1
+        self.ny = int((lat1 - self.lat0) // cell_size) + 1
+
+        key = self._cell_y(lat) * self.nx + self._cell_x(lon)
+        order = np.argsort(key, kind="stable")
+        self.positions = read_only(positions[order])
+        self.lat = read_only(lat[order])
+        self.lon = read_only(lon[order])
+        self.starts = read_only(np.searchsorted(key[order], np.arange(self.nx * self.ny + 1)))
+
+    def _cell_x(self, lon):
+        return np.clip(np.floor((lon - self.lon0) / self.cell_size), 0, self.nx - 1).astype(np.int64)
+
+    def _cell_y(self, lat):
+        return np.clip(np.floor((lat - self.lat0) / self.cell_size), 0, self.ny - 1).astype(np.int64)
+
+    def query(self, south, west, north, east):
+        """Sorted row positions of the points inside the box"""
+        if not len(self.positions) or south > north or west > east:
+            return np.empty(0, dtype=np.int64)
+        x0, x1 = self._cell_x(np.array([west, east]))
+        y0, y1 = self._cell_y(np.array([south, north]))
+        rows = np.arange(y0, y1 + 1) * self.nx
+        lo = self.starts[rows + x0]
+        hi = self.starts[rows + x1 + 1]
+
+        # Concatenate the per-row cell runs [lo, hi) without a Python loop
+        lengths = hi - lo
+        run_starts = np.cumsum(lengths) - lengths
+        candidates = np.repeat(lo - run_starts, lengths) + np.arange(lengths.sum())
+
+        inside = (
+            (self.lat[candidates] >= south) & (self.lat[candidates] <= north)
+            & (self.lon[candidates] >= west) & (self.lon[candidates] <= east)
+        )
+        return np.sort(self.positions[candidates[inside]])
+
+
+class CaseLocationTree:
+    """Haversine BallTree over the distinct locations of a date-sorted case frame.
+
+    Neighbor queries for many sites run as one batched `query_radius` call, and
+    window totals per location come from a bincount over the rows of a date slice.
+    """
+
+    def __init__(self, frame, weight_column="cases"):
+        lat = frame["latitude"].to_numpy(dtype=np.float64)
+        lon = frame["longitude"].to_numpy(dtype=np.float64)
+        valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+
+        self.locations, inverse = np.unique(np.column_stack([lat[valid], lon[valid]]), axis=0, return_inverse=True)
+        self.location_of_row = np.full(len(frame), -1, dtype=np.int64)
+        self.location_of_row[valid] = inverse.ravel()
+        self.weights = frame[weight_column].to_numpy(dtype=np.float64, na_value=0.0)
+        self.tree = BallTree(np.radians(self.locations), metric="haversine")
+
+    def neighbors(self, lat, lon, radius_m):
+        """Per site, the ids of the case locations within `radius_m` metres"""
+        sites = np.radians(np.column_stack([lat, lon]).astype(np.float64))
+        valid = np.isfinite(sites).all(axis=1) & (np.abs(np.degrees(sites[:, 0])) <= 90)
+        result = np.empty(len(sites), dtype=object)
+        result[:] = [np.empty(0, dtype=np.int64)] * len(sites)
+        if valid.any():
+            result[valid] = self.tree.query_radius(sites[valid], r=radius_m / EARTH_RADIUS_M)
+        return result
+
+    def location_totals(self, lo, hi):
+        """Total weight per location over the rows `[lo, hi)` of the frame"""
+        loc = self.location_of_row[lo:hi]
+        valid = loc >= 0
+        return np.bincount(loc[valid], weights=self.weights[lo:hi][valid], minlength=len(self.locations))
+
+    def totals_near(self, neighbors, lo, hi):
+        """Window totals near each site, and near any of them (each location counted once)"""
+        totals = self.location_totals(lo, hi)
+        lengths = np.array([len(n) for n in neighbors], dtype=np.int64)
+        flat = np.concatenate(list(neighbors)) if len(neighbors) else np.empty(0, dtype=np.int64)
+        per_site = np.zeros(len(neighbors))
+        if len(flat):
+            starts = np.cumsum(lengths) - lengths
+            nonempty = lengths > 0
+            per_site[nonempty] = np.add.reduceat(totals[flat], starts[nonempty])
+        return per_site, totals[np.unique(flat)].sum()
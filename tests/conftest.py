@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+AREAS = [67000340, 67000350]
+NEIGHBORHOODS = ["East", "North", "West"]
+
+
+def random_rows(rng, n, first="2023-12-18", last="2024-02-11"):
+    """`n` rows spread over a date range, two areas and three neighborhoods, a few without a neighborhood"""
+    days = pd.date_range(first, last, freq="D")
+    neighborhoods = rng.choice(np.array(NEIGHBORHOODS + [None], dtype=object), n, p=[0.3, 0.3, 0.3, 0.1])
+    return pd.DataFrame({
+        "administrative_area_code": rng.choice(AREAS, n),
+        "neighborhood": neighborhoods,
+        "date": rng.choice(days, n),
+    })
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(7)
+
+
+@pytest.fixture
+def cases(rng):
+    frame = random_rows(rng, 400).rename(columns={"date": "diagnosis_date"})
+    # Area codes as the case exports spell them
+    frame["administrative_area_code"] = frame["administrative_area_code"].astype(str)
+    frame["cases"] = rng.integers(1, 4, len(frame))
+    return frame.sort_values("diagnosis_date", kind="mergesort").reset_index(drop=True)
+
+
+@pytest.fixture
+def spraying(rng):
+    frame = random_rows(rng, 120, first="2023-12-25", last="2024-01-31")
+    frame["meeting_location"] = rng.choice(["Temple", "School", "Park"], len(frame))
+    frame["spray_count"] = rng.integers(1, 3, len(frame))
+    return frame.sort_values("date", kind="mergesort").reset_index(drop=True)
+
+
+@pytest.fixture
+def mosquito(rng):
+    frame = random_rows(rng, 200)
+    # Surveys read area codes as floats, and leave some indexes blank
+    frame["administrative_area_code"] = frame["administrative_area_code"].astype(float)
+    frame["breteau_index"] = np.where(rng.random(len(frame)) < 0.15, np.nan, rng.integers(0, 20, len(frame)))
+    frame["container_index"] = rng.random(len(frame)) * 30
+    return frame
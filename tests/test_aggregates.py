@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import DailyCube, spray_case_correlations, spray_effect_table
+from dataset import load_timeline
+from indexes import DateIndex
+from rollups import write_rollups
+
+# Inclusive windows: inside the data, one day, all of it, reversed, before it, after it, and straddling its start
+WINDOWS = [
+    ("2024-01-01", "2024-01-14"),
+    ("2024-01-10", "2024-01-10"),
+    ("2023-11-01", "2024-03-31"),
+    ("2024-01-20", "2024-01-05"),
+    ("2022-01-01", "2022-12-31"),
+    ("2025-01-01", "2025-02-01"),
+    ("2023-12-10", "2024-01-02"),
+]
+
+# Bucket of each date, as a groupby key
+BUCKET_LABELS = [
+    ("day", lambda d: d),
+    ("week", lambda d: d - pd.to_timedelta(d.dt.dayofweek, unit="D")),
+    ("month", lambda d: d.dt.to_period("M").dt.start_time),
+]
+
+
+def in_window(frame, date_column, start, end):
+    dates = frame[date_column]
+    return frame[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+
+
+@pytest.fixture
+def cases_cube(cases):
+    return DailyCube(DateIndex(cases, "diagnosis_date"), "neighborhood", "cases")
+
+
+@pytest.fixture
+def spraying_cube(spraying):
+    return DailyCube(DateIndex(spraying, "date"), "neighborhood", "spray_count")
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_totals_match_groupby(cases, cases_cube, start, end):
+    expected = in_window(cases, "diagnosis_date", start, end).groupby("neighborhood")["cases"].sum()
+    totals = cases_cube.totals(start, end)
+    pd.testing.assert_series_equal(
+        totals.sort_index(), expected.sort_index(), check_names=False, check_dtype=False, check_index_type=False
+    )
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_daily_matches_groupby(cases, cases_cube, start, end):
+    # Rows without a neighborhood still count towards the day
+    expected = in_window(cases, "diagnosis_date", start, end).groupby("diagnosis_date")["cases"].sum()
+    daily = cases_cube.daily(start, end).set_index("diagnosis_date")["cases"]
+    np.testing.assert_array_equal(daily.index.to_numpy(), expected.index.to_numpy())
+    np.testing.assert_array_equal(daily.to_numpy(), expected.to_numpy())
+
+
+@pytest.mark.parametrize("bucket, label", BUCKET_LABELS)
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_bucketed_matches_groupby(cases, cases_cube, bucket, label, start, end):
+    rows = in_window(cases, "diagnosis_date", start, end)
+    expected = rows.groupby(label(rows["diagnosis_date"]))["cases"].sum()
+    bucketed = cases_cube.bucketed(start, end, bucket)
+    np.testing.assert_array_equal(bucketed["diagnosis_date"].to_numpy(), expected.index.to_numpy())
+    np.testing.assert_array_equal(bucketed["cases"].to_numpy(), expected.to_numpy())
+    assert (bucketed["diagnosis_date_end"] > bucketed["diagnosis_date"]).all()
+
+
+def test_spray_effect_table_matches_per_date_sums(cases, spraying, cases_cube, spraying_cube):
+    table = spray_effect_table(cases_cube, spraying_cube, days=7)
+    sprays = spraying.groupby("date")["spray_count"].sum()
+    assert table["spray_date"].tolist() == sprays.index.tolist()
+    assert table["spray_count"].tolist() == sprays.tolist()
+    for row in table.itertuples():
+        day = pd.Timestamp(row.spray_date)
+        before = in_window(cases, "diagnosis_date", day - pd.Timedelta(days=7), day - pd.Timedelta(days=1))
+        after = in_window(cases, "diagnosis_date", day, day + pd.Timedelta(days=6))
+        assert row.cases_before == before["cases"].sum()
+        assert row.cases_after == after["cases"].sum()
+        assert row.change == row.cases_before - row.cases_after
+
+
+def daily_matrix(frame, date_column, value_column, days, names):
+    """Day x neighborhood totals over `days`, zero where nothing happened"""
+    table = frame.pivot_table(index=date_column, columns="neighborhood", values=value_column, aggfunc="sum")
+    return table.reindex(index=days, columns=names).fillna(0).to_numpy(dtype=np.float64)
+
+
+def test_spray_case_correlations_match_direct_pearson(cases, spraying, cases_cube, spraying_cube):
+    start, end, max_lag = "2023-12-18", "2024-02-11", 10
+    curves, ranking = spray_case_correlations(cases_cube, spraying_cube, start, end, max_lag=max_lag)
+    names = list(curves.columns)
+    assert sorted(names) == sorted(set(cases["neighborhood"].dropna()) & set(spraying["neighborhood"].dropna()))
+
+    days = pd.date_range(start, end, freq="D")
+    sprays = daily_matrix(spraying, "date", "spray_count", days, names)
+    counts = daily_matrix(cases, "diagnosis_date", "cases", days, names)
+    x, y = sprays - sprays.mean(axis=0), counts - counts.mean(axis=0)
+    scale = np.sqrt((x ** 2).sum(axis=0) * (y ** 2).sum(axis=0))
+    for lag in range(-max_lag, max_lag + 1):
+        # Cases `lag` days after spraying
+        if lag >= 0:
+            expected = (x[: len(days) - lag] * y[lag:]).sum(axis=0) / scale
+        else:
+            expected = (x[-lag:] * y[: len(days) + lag]).sum(axis=0) / scale
+        np.testing.assert_allclose(curves.loc[lag].to_numpy(), expected, atol=1e-12)
+
+    ranking = ranking.set_index("neighborhood")
+    np.testing.assert_array_equal(ranking.loc[names, "spray_count"].to_numpy(), sprays.sum(axis=0))
+    np.testing.assert_array_equal(ranking.loc[names, "cases"].to_numpy(), counts.sum(axis=0))
+    assert ranking["response_corr"].is_monotonic_increasing
+    assert ranking["response_lag"].between(1, max_lag).all()
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2024-01-20", "2024-01-05"),
+    ("2022-01-01", "2022-12-31"),
+    ("2025-01-01", "2025-02-01"),
+    ("2024-01-10", "2024-01-10"),
+])
+def test_spray_case_correlations_empty_windows(cases_cube, spraying_cube, start, end):
+    curves, ranking = spray_case_correlations(cases_cube, spraying_cube, start, end)
+    assert curves.empty
+    assert ranking.empty or "response_corr" not in ranking
+
+
+@pytest.fixture
+def timeline_rows(cases, tmp_path):
+    rows = cases.assign(latitude=23.0, longitude=120.2)
+    write_rollups(rows.assign(diagnosis_date=rows["diagnosis_date"].dt.strftime("%Y/%m/%d")), str(tmp_path))
+    return rows
+
+
+@pytest.mark.parametrize("bucket, label", BUCKET_LABELS)
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_timeline_reads_whole_buckets_from_the_rollups(timeline_rows, tmp_path, bucket, label, start, end):
+    timeline = load_timeline("cases", str(tmp_path), str(tmp_path / "cache"))
+    bucketed = timeline.bucketed(start, end, bucket)
+    first, last = pd.Timestamp(start), pd.Timestamp(end)
+    if bucket == "week":
+        # Week totals come from the area-week rollup, so a window counts its first and last weeks whole
+        first -= pd.Timedelta(days=first.dayofweek)
+        last += pd.Timedelta(days=6 - last.dayofweek)
+    rows = in_window(timeline_rows, "diagnosis_date", first, last)
+    expected = rows.groupby(label(rows["diagnosis_date"])).size()
+    np.testing.assert_array_equal(bucketed["diagnosis_date"].to_numpy(), expected.index.to_numpy())
+    np.testing.assert_array_equal(bucketed["cases"].to_numpy(), expected.to_numpy())
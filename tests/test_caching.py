@@ -0,0 +1,59 @@
+import caching
+from caching import LRUCache
+
+
+def test_evicts_least_recently_used_past_max_entries():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_until_within_the_byte_budget():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    cache.put("c", "zzzzzz")
+    assert cache.get("a") is None and cache.get("b") == "yyyy" and cache.get("c") == "zzzzzz"
+    assert cache.stats()["bytes"] == 10
+
+
+def test_never_stores_a_value_over_the_byte_budget():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    assert cache.put("big", "y" * 11) == "y" * 11
+    assert cache.get("big") is None
+    assert cache.get("a") == "xxxx"
+
+
+def test_replacing_an_entry_recounts_its_size():
+    cache = LRUCache(max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    cache.put("a", "xxxxxxxx")
+    assert cache.stats()["bytes"] == 8
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(caching.time, "monotonic", lambda: now[0])
+    cache = LRUCache(ttl=5)
+    cache.put("a", 1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    now[0] += 0.1
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["expirations"], stats["hits"], stats["misses"]) == (0, 1, 1, 1)
+
+
+def test_get_or_create_builds_once_per_key():
+    cache = LRUCache(max_entries=4)
+    calls = []
+    for _ in range(3):
+        assert cache.get_or_create("a", lambda: calls.append(1) or "value") == "value"
+    assert len(calls) == 1
+    assert cache.stats()["hit_rate"] == 2 / 3
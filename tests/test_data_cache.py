@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_cache
+from data_cache import read_csv_snapshot
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "cases.csv"
+    path.write_text("diagnosis_date,latitude,neighborhood\n2024/01/02,23.1,East\n2024/01/03,x,West\n", encoding="utf-8")
+    return str(path)
+
+
+def read(csv_path, cache_dir):
+    return read_csv_snapshot(
+        csv_path, date_columns=["diagnosis_date"], numeric_columns=["latitude"], cache_dir=str(cache_dir)
+    )
+
+
+def no_parse(*args, **kwargs):
+    raise AssertionError("the CSV was parsed again")
+
+
+def test_parses_dates_and_numbers(csv_path, tmp_path):
+    frame = read(csv_path, tmp_path / "cache")
+    assert frame["diagnosis_date"].tolist() == [pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-03")]
+    assert frame["latitude"].iloc[0] == 23.1
+    assert pd.isna(frame["latitude"].iloc[1])
+    assert any(name.endswith(".parquet") for name in os.listdir(tmp_path / "cache"))
+
+
+def test_reads_the_snapshot_while_the_file_is_unchanged(csv_path, tmp_path, monkeypatch):
+    first = read(csv_path, tmp_path / "cache")
+    monkeypatch.setattr(data_cache, "_parse_csv", no_parse)
+    pd.testing.assert_frame_equal(read(csv_path, tmp_path / "cache"), first)
+
+
+def test_keeps_the_snapshot_when_only_the_mtime_moved(csv_path, tmp_path, monkeypatch):
+    first = read(csv_path, tmp_path / "cache")
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    monkeypatch.setattr(data_cache, "_parse_csv", no_parse)
+    pd.testing.assert_frame_equal(read(csv_path, tmp_path / "cache"), first)
+    # The new mtime was recorded, so the next read does not hash the file again
+    monkeypatch.setattr(data_cache, "file_digest", no_parse)
+    read(csv_path, tmp_path / "cache")
+
+
+def test_rebuilds_when_the_content_changes(csv_path, tmp_path):
+    read(csv_path, tmp_path / "cache")
+    stat = os.stat(csv_path)
+    # Same size, so only the hash tells the new content from a touched file
+    with open(csv_path, "r+", encoding="utf-8") as f:
+        text = f.read()
+        f.seek(0)
+        f.write(text.replace("East", "Sout"))
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert read(csv_path, tmp_path / "cache")["neighborhood"].tolist() == ["Sout", "West"]
+
+
+def test_same_named_csvs_in_different_directories_get_their_own_snapshots(csv_path, tmp_path):
+    other = tmp_path / "other" / "cases.csv"
+    other.parent.mkdir()
+    other.write_text("diagnosis_date,latitude,neighborhood\n2024/02/01,22.9,North\n", encoding="utf-8")
+    read(csv_path, tmp_path / "cache")
+    assert read(str(other), tmp_path / "cache")["neighborhood"].tolist() == ["North"]
+    assert read(csv_path, tmp_path / "cache")["neighborhood"].tolist() == ["East", "West"]
+
+
+def test_writes_through_unique_temporary_files(csv_path, tmp_path, monkeypatch):
+    moved = []
+    replace = os.replace
+
+    def record(src, dst):
+        moved.append((src, dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(data_cache.os, "replace", record)
+    read(csv_path, tmp_path / "cache")
+    read_csv_snapshot(csv_path, usecols=["neighborhood"], cache_dir=str(tmp_path / "cache"))
+    sources = [src for src, _ in moved]
+    assert len(moved) == 4 and len(set(sources)) == 4
+    assert all(src != dst + ".tmp" for src, dst in moved)
+    assert not [name for name in os.listdir(tmp_path / "cache") if name.endswith(".tmp")]
+
+
+def test_a_failed_write_leaves_no_temporary_file(csv_path, tmp_path, monkeypatch):
+    def fail(self, path, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", fail)
+    assert read(csv_path, tmp_path / "cache")["neighborhood"].tolist() == ["East", "West"]
+    assert os.listdir(tmp_path / "cache") == []
@@ -0,0 +1,151 @@
+import os
+
+import pandas as pd
+import pytest
+
+import etl
+from etl import DATASETS, combine_partitions, partition_path, update_partitions
+from rollups import ROLLUPS, build_rollups
+
+
+def write_source(source_dir, roc_year, dates, name=None):
+    """One yearly cases export with the source's Chinese headers"""
+    path = os.path.join(source_dir, name or f"{roc_year}年登革熱病例.csv")
+    pd.DataFrame({
+        "確診日": dates,
+        "行政區域代碼": ["67000340"] * len(dates),
+        "里別": ["East"] * len(dates),
+        "道路名稱": ["Road"] * len(dates),
+        "經度座標": [120.2] * len(dates),
+        "緯度座標": [23.0] * len(dates),
+    }).to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    path = tmp_path / "source" / DATASETS["cases"]["directory"]
+    path.mkdir(parents=True)
+    write_source(path, 112, ["20230105", "20230620"])
+    write_source(path, 113, ["20240102"])
+    return str(path)
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """Years extracted by `update_partitions`, in order"""
+    years = []
+    extract_file = etl.extract_file
+
+    def recording(path, spec):
+        years.append(etl.roc_year_from_filename(os.path.basename(path)))
+        return extract_file(path, spec)
+
+    monkeypatch.setattr(etl, "extract_file", recording)
+    return years
+
+
+def test_extracts_every_year_on_the_first_run(source_dir, tmp_path, extracted):
+    partition_dir = str(tmp_path / "partitions")
+    digests, changed = update_partitions(source_dir, partition_dir, DATASETS["cases"], {})
+    assert changed and sorted(extracted) == ["112", "113"]
+    assert set(digests) == set(os.listdir(source_dir))
+    partition = pd.read_csv(partition_path(partition_dir, "112"))
+    assert partition["diagnosis_date"].tolist() == ["2023/01/05", "2023/06/20"]
+    assert (partition["year"] == 112).all()
+
+
+def test_only_changed_years_are_extracted_again(source_dir, tmp_path, extracted):
+    partition_dir = str(tmp_path / "partitions")
+    digests, _ = update_partitions(source_dir, partition_dir, DATASETS["cases"], {})
+    extracted.clear()
+
+    assert update_partitions(source_dir, partition_dir, DATASETS["cases"], digests) == (digests, set())
+    assert extracted == []
+
+    write_source(source_dir, 113, ["20240102", "20240103"])
+    digests, changed = update_partitions(source_dir, partition_dir, DATASETS["cases"], digests)
+    assert changed == {"113"} and extracted == ["113"]
+    assert len(pd.read_csv(partition_path(partition_dir, "113"))) == 2
+
+    extracted.clear()
+    update_partitions(source_dir, partition_dir, DATASETS["cases"], digests, force=True)
+    assert sorted(extracted) == ["112", "113"]
+
+
+def test_a_removed_year_drops_its_partition(source_dir, tmp_path):
+    partition_dir = str(tmp_path / "partitions")
+    digests, _ = update_partitions(source_dir, partition_dir, DATASETS["cases"], {})
+    os.remove(os.path.join(source_dir, "112年登革熱病例.csv"))
+    digests, changed = update_partitions(source_dir, partition_dir, DATASETS["cases"], digests)
+    assert changed == {"112"}
+    assert not os.path.exists(partition_path(partition_dir, "112"))
+
+
+def test_files_of_one_year_share_its_partition(source_dir, tmp_path):
+    partition_dir = str(tmp_path / "partitions")
+    write_source(source_dir, 113, ["20241201"], name="113年登革熱病例_補登.csv")
+    update_partitions(source_dir, partition_dir, DATASETS["cases"], {})
+    assert len(pd.read_csv(partition_path(partition_dir, "113"))) == 2
+
+
+def test_combine_partitions_streams_years_in_order(source_dir, tmp_path):
+    partition_dir = str(tmp_path / "partitions")
+    write_source(source_dir, 104, ["20151231"])
+    update_partitions(source_dir, partition_dir, DATASETS["cases"], {})
+    output = str(tmp_path / "cases.csv")
+    combine_partitions(partition_dir, output, chunk_size=1)
+    assert pd.read_csv(output)["year"].tolist() == [104, 112, 112, 113]
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Years whose rollups `update_rollups` counted, in order"""
+    years = []
+    write_rollups = etl.write_rollups
+
+    def recording(frame, output_dir, dataset="cases"):
+        years.append(os.path.basename(output_dir)[len("year="):-len(".tmp")])
+        return write_rollups(frame, output_dir, dataset)
+
+    monkeypatch.setattr(etl, "write_rollups", recording)
+    return years
+
+
+def assert_rollups_match_a_full_build(output_dir):
+    full = build_rollups(pd.read_csv(os.path.join(output_dir, DATASETS["cases"]["output"])), "cases")
+    for name, expected in full.items():
+        written = pd.read_csv(os.path.join(output_dir, ROLLUPS[name]["file"]))
+        pd.testing.assert_frame_equal(written, expected, check_dtype=False)
+
+
+def test_run_recounts_only_the_changed_years_rollups(source_dir, tmp_path, counted):
+    output_dir = str(tmp_path / "data")
+    write_source(source_dir, 114, ["20250102"])
+    assert etl.run(os.path.dirname(source_dir), output_dir)
+    assert sorted(counted) == ["112", "113", "114"]
+    assert_rollups_match_a_full_build(output_dir)
+
+    counted.clear()
+    assert not etl.run(os.path.dirname(source_dir), output_dir)
+    assert counted == []
+
+    # 2024/12/31 and 2025/01/02 share the week of 2024/12/30, so its total adds up both years' counts
+    write_source(source_dir, 113, ["20240102", "20240103", "20241231"])
+    assert etl.run(os.path.dirname(source_dir), output_dir)
+    assert counted == ["113"]
+    assert_rollups_match_a_full_build(output_dir)
+    weeks = pd.read_csv(os.path.join(output_dir, ROLLUPS["area_week"]["file"])).set_index("week_start")["cases"]
+    assert weeks["2024/12/30"] == 2
+
+
+def test_run_drops_a_removed_years_counts(source_dir, tmp_path, counted):
+    output_dir = str(tmp_path / "data")
+    etl.run(os.path.dirname(source_dir), output_dir)
+    counted.clear()
+    os.remove(os.path.join(source_dir, "112年登革熱病例.csv"))
+    etl.run(os.path.dirname(source_dir), output_dir)
+    assert counted == []
+    assert_rollups_match_a_full_build(output_dir)
+    days = pd.read_csv(os.path.join(output_dir, ROLLUPS["neighborhood_day"]["file"]))
+    assert days["diagnosis_date"].tolist() == ["2024/01/02"]
@@ -0,0 +1,143 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indexes import day_window
+from joins import KeyedDays, KeySpace, NeighborhoodJoin
+from query import FilterSpec
+
+# Inclusive windows: inside the data, one day, all of it, reversed, before it, after it, and straddling its start
+WINDOWS = [
+    (date(2024, 1, 1), date(2024, 1, 14)),
+    (date(2024, 1, 10), date(2024, 1, 10)),
+    (date(2023, 11, 1), date(2024, 3, 31)),
+    (date(2024, 1, 20), date(2024, 1, 5)),
+    (date(2022, 1, 1), date(2022, 12, 31)),
+    (date(2025, 1, 1), date(2025, 2, 1)),
+    (date(2023, 12, 10), date(2024, 1, 2)),
+]
+
+
+def keyed(frame):
+    """The frame with its (area, neighborhood) key as the join spells it, rows without one dropped"""
+    frame = frame.dropna(subset=["administrative_area_code", "neighborhood"]).copy()
+    frame["area"] = frame["administrative_area_code"].astype(float).astype(int).astype(str)
+    return frame
+
+
+def in_window(frame, date_column, start, end, neighborhoods=None):
+    dates = frame[date_column]
+    rows = frame[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+    return rows if neighborhoods is None else rows[rows["neighborhood"].isin(neighborhoods)]
+
+
+def test_key_space_matches_every_spelling_of_a_code():
+    key_space = KeySpace()
+    ids = key_space.encode([67000340, "67000340.0", " 67000340 ", 67000350, None], ["East", "East", "East", "East", "East"])
+    assert ids[0] == ids[1] == ids[2]
+    assert ids[3] != ids[0]
+    assert ids[4] == -1
+    # Later datasets reuse the ids of keys already seen
+    assert key_space.encode([67000350.0], ["East"]).tolist() == [ids[3]]
+    assert key_space.encode([67000340], [np.nan]).tolist() == [-1]
+    assert len(key_space) == 2
+
+
+def test_key_space_of_neighborhoods():
+    key_space = KeySpace()
+    key_space.encode([1, 2, 1], ["East", "East", "West"])
+    assert key_space.of_neighborhoods(["East"]).tolist() == [0, 1]
+    assert key_space.of_neighborhoods(["South"]).tolist() == []
+    assert key_space.of_neighborhoods().tolist() == [0, 1, 2]
+
+
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_keyed_days_totals_match_groupby(mosquito, start, end):
+    key_space = KeySpace()
+    ids = key_space.encode(mosquito["administrative_area_code"], mosquito["neighborhood"])
+    table = KeyedDays(mosquito, "date", ids, ["breteau_index"])
+    keys = key_space.of_neighborhoods()
+    lo, hi = table.ranges(keys, *day_window(start, end))
+    total, count = table.totals("breteau_index", lo, hi)
+
+    rows = in_window(keyed(mosquito), "date", start, end)
+    grouped = rows.groupby(["area", "neighborhood"])["breteau_index"]
+    by_key = dict(zip(key_space.keys, zip(hi - lo, total, count)))
+    for key, (n, key_total, key_count) in by_key.items():
+        assert n == grouped.size().get(key, 0)
+        assert key_total == grouped.sum().get(key, 0)
+        assert key_count == grouped.count().get(key, 0)
+
+
+def test_keyed_days_ranges_are_empty_when_reversed(mosquito):
+    ids = KeySpace().encode(mosquito["administrative_area_code"], mosquito["neighborhood"])
+    table = KeyedDays(mosquito, "date", ids, ["breteau_index"])
+    first, stop = day_window("2024-01-20", "2024-01-05")
+    lo, hi = table.ranges(np.unique(ids[ids >= 0]), first, stop)
+    assert (hi == lo).all()
+
+
+@pytest.fixture
+def join(mosquito, cases, spraying):
+    return NeighborhoodJoin(mosquito, cases, spraying)
+
+
+def spec_for(start, end, year=None, neighborhoods=None):
+    return FilterSpec(start=start, end=end, year=year, neighborhoods=neighborhoods)
+
+
+def expected_neighborhoods(mosquito, cases, spraying, start, end, neighborhoods=None):
+    """The per-neighborhood join as plain groupbys over the window"""
+    surveys = in_window(keyed(mosquito), "date", start, end, neighborhoods).groupby(["area", "neighborhood"])
+    table = surveys[["breteau_index", "container_index"]].mean()
+    table.insert(0, "surveys", surveys.size())
+    for frame, date_column, column in [(cases, "diagnosis_date", "cases"), (spraying, "date", "spray_count")]:
+        totals = in_window(keyed(frame), date_column, start, end, neighborhoods).groupby(["area", "neighborhood"])[column].sum()
+        table[column] = totals.reindex(table.index, fill_value=0)
+    return table.sort_index()
+
+
+@pytest.mark.parametrize("neighborhoods", [None, ("East", "West")])
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_neighborhoods_match_groupby(join, mosquito, cases, spraying, start, end, neighborhoods):
+    table = join.neighborhoods(spec_for(start, end, neighborhoods=neighborhoods))
+    expected = expected_neighborhoods(mosquito, cases, spraying, start, end, neighborhoods)
+    table = table.set_index(["administrative_area_code", "neighborhood"]).sort_index()
+    assert table.index.tolist() == expected.index.tolist()
+    for column in ["surveys", "breteau_index", "container_index", "cases", "spray_count"]:
+        np.testing.assert_allclose(table[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float))
+    if len(table):
+        ranked = join.neighborhoods(spec_for(start, end, neighborhoods=neighborhoods))["breteau_index"].dropna()
+        assert ranked.is_monotonic_decreasing
+
+
+def test_neighborhoods_window_outside_the_year_is_empty(join):
+    # ROC year 113 is 2024, so a window in December 2023 has nothing left
+    assert join.neighborhoods(spec_for(date(2023, 12, 18), date(2023, 12, 31), year=113)).empty
+
+
+@pytest.mark.parametrize("bucket, label", [
+    ("day", lambda d: d),
+    ("week", lambda d: d - pd.to_timedelta(d.dt.dayofweek, unit="D")),
+])
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_series_matches_groupby(join, mosquito, cases, spraying, bucket, label, start, end):
+    series = join.series(spec_for(start, end), bucket).set_index("date")
+    if start > end:
+        assert series.empty
+        return
+    surveys = in_window(keyed(mosquito), "date", start, end)
+    surveys = surveys.groupby(label(surveys["date"]))["breteau_index"]
+    np.testing.assert_array_equal(series["surveys"].to_numpy(), surveys.count().reindex(series.index, fill_value=0))
+    np.testing.assert_allclose(series["breteau_index"].to_numpy(), surveys.mean().reindex(series.index).to_numpy())
+    for frame, date_column, column in [(cases, "diagnosis_date", "cases"), (spraying, "date", "spray_count")]:
+        rows = in_window(keyed(frame), date_column, start, end)
+        totals = rows.groupby(label(rows[date_column]))[column].sum()
+        assert series[column].sum() == totals.sum()
+        np.testing.assert_array_equal(series[column].to_numpy(), totals.reindex(series.index, fill_value=0))
+
+
+def test_series_window_outside_the_year_is_empty(join):
+    assert join.series(spec_for(date(2023, 12, 18), date(2023, 12, 31), year=113)).empty
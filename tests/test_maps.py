@@ -0,0 +1,61 @@
+"""`render_map` and `show_rendered_map` reproduce what `st_folium` sends to its component.
+
+They call streamlit_folium's private helpers (pinned in requirements.txt), so these
+tests fail on an upgrade that renames them or changes what st_folium sends.
+"""
+import pandas as pd
+import pytest
+import streamlit_folium
+
+from maps import create_heatmap_map, create_tile_map, create_timelapse_map, render_map, show_rendered_map
+
+PRIVATE_NAMES = ["_component_func", "_get_map_string", "_get_siblings", "get_full_id", "generate_js_hash"]
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Keyword arguments of every call to the st_folium component"""
+    calls = []
+    monkeypatch.setattr(streamlit_folium, "_component_func", lambda **kwargs: calls.append(kwargs))
+    return calls
+
+
+def small_frames():
+    cases = pd.DataFrame({
+        "latitude": [22.99, 23.0, 23.01], "longitude": [120.2, 120.21, 120.22], "cases": [1, 2, 3],
+        "diagnosis_date": pd.to_datetime(["2024-01-01", "2024-01-02", "2024-01-03"]),
+    })
+    spraying = pd.DataFrame({
+        "latitude": [23.0], "longitude": [120.2], "spray_count": [2], "meeting_location": ["Temple"],
+        "date": pd.to_datetime(["2024-01-02"]), "neighborhood": ["East"],
+    })
+    return cases, spraying
+
+
+MAPS = {
+    "heatmap": lambda: create_heatmap_map(small_frames()[0], "cases", radius=20, sync_group="maps"),
+    "markers": lambda: create_heatmap_map(
+        small_frames()[1], "spraying", include_spray_markers=True, spray_data=small_frames()[1]
+    ),
+    "tiles": lambda: create_tile_map("/tiles/{z}/{x}/{y}.png", [10, 11], bounds=[[22.9, 120.1], [23.1, 120.3]]),
+    "timelapse": lambda: create_timelapse_map([[[23.0, 120.2, 1.0]], [[23.01, 120.21, 2.0]]], ["Jan", "Feb"]),
+}
+
+
+def test_private_helpers_exist():
+    missing = [name for name in PRIVATE_NAMES if not hasattr(streamlit_folium, name)]
+    assert not missing, f"streamlit_folium no longer has {missing}; render_map needs updating"
+
+
+@pytest.mark.parametrize("returned_objects", [None, []])
+@pytest.mark.parametrize("name", sorted(MAPS))
+def test_rendered_maps_send_what_st_folium_sends(sent, name, returned_objects):
+    streamlit_folium.st_folium(MAPS[name](), key="map", returned_objects=returned_objects)
+    show_rendered_map(render_map(MAPS[name]()), key="map", returned_objects=returned_objects)
+    assert len(sent) == 2
+    assert sent[1] == sent[0]
+
+
+def test_rendered_size_counts_the_script_and_html():
+    rendered = render_map(MAPS["heatmap"]())
+    assert rendered.nbytes == len(rendered.script) + len(rendered.html) > 0
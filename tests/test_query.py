@@ -0,0 +1,102 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from query import FilterSpec, RawCaseIndex, filter_frame
+from spatial import aggregate_to_grid, grid_cell_size
+
+
+def sidebar(**kwargs):
+    args = {"selected_year": "Total", "date_filter_mode": "Date Range",
+            "start_date": date(2024, 1, 1), "end_date": date(2024, 1, 31)}
+    args.update(kwargs)
+    return FilterSpec.from_sidebar(**args)
+
+
+def test_a_specific_date_is_a_one_day_range():
+    specific = sidebar(date_filter_mode="Specific Date", start_date=date(2024, 1, 5), end_date=date(2024, 3, 1))
+    one_day = sidebar(start_date=date(2024, 1, 5), end_date=date(2024, 1, 5))
+    assert specific == one_day
+    assert hash(specific) == hash(one_day)
+    assert (specific.start, specific.end) == (date(2024, 1, 5), date(2024, 1, 5))
+
+
+def test_a_start_part_way_through_a_day_skips_that_day():
+    spec = sidebar(start_date=pd.Timestamp("2024-01-01 12:00"), end_date=pd.Timestamp("2024-01-31 08:00"))
+    assert (spec.start, spec.end) == (date(2024, 1, 2), date(2024, 1, 31))
+
+
+def test_neighborhoods_are_normalized():
+    spec = sidebar(selected_neighborhoods=["West", "East", "West"], filter_by_neighborhood=True)
+    assert spec.neighborhoods == ("East", "West")
+    assert sidebar(selected_neighborhoods=["West", "All"], filter_by_neighborhood=True).neighborhoods is None
+    assert sidebar(selected_neighborhoods=["West"], filter_by_neighborhood=False).neighborhoods is None
+
+
+def test_year_and_spraying_window():
+    spec = sidebar(selected_year="113")
+    assert (spec.year, spec.selected_year) == (113, 113)
+    assert sidebar().selected_year == "Total"
+    assert (sidebar().spraying_start, sidebar().spraying_end) == (None, None)
+    spec = sidebar(spraying_date_filter_mode="Specific Date",
+                   spraying_start_date=date(2024, 1, 3), spraying_end_date=date(2024, 1, 9))
+    assert (spec.spraying_start, spec.spraying_end) == (date(2024, 1, 3), date(2024, 1, 3))
+
+
+@pytest.fixture
+def raw_cases(cases):
+    frame = cases.copy()
+    frame["year"] = frame["diagnosis_date"].dt.year - 1911
+    frame["latitude"] = 23.0 + (frame.index % 13) * 0.003
+    frame["longitude"] = 120.2 + (frame.index % 11) * 0.003
+    return frame
+
+
+@pytest.mark.parametrize("spec", [
+    FilterSpec(start=date(2024, 1, 1), end=date(2024, 1, 14)),
+    FilterSpec(start=date(2023, 12, 1), end=date(2024, 2, 28), year=113),
+    FilterSpec(start=date(2023, 12, 1), end=date(2024, 2, 28), neighborhoods=("East", "South")),
+    FilterSpec(start=date(2024, 1, 20), end=date(2024, 1, 5)),
+    FilterSpec(start=date(2025, 1, 1), end=date(2025, 1, 31)),
+])
+def test_filter_frame_matches_a_mask(raw_cases, spec):
+    shuffled = raw_cases.sample(frac=1, random_state=3)
+    days = shuffled["diagnosis_date"].dt.date
+    mask = (days >= spec.start) & (days <= spec.end)
+    if spec.year is not None:
+        mask &= shuffled["year"] == spec.year
+    if spec.neighborhoods is not None:
+        mask &= shuffled["neighborhood"].isin(spec.neighborhoods)
+    filtered = filter_frame(shuffled, spec)
+    assert filtered.index.tolist() == shuffled.index[mask.to_numpy()].tolist()
+
+
+@pytest.mark.parametrize("zoom", [8, 12, 16])
+@pytest.mark.parametrize("spec", [
+    FilterSpec(start=date(2024, 1, 1), end=date(2024, 1, 14)),
+    FilterSpec(start=date(2023, 12, 1), end=date(2024, 2, 28), year=113, neighborhoods=("East", "West")),
+    FilterSpec(start=date(2024, 1, 20), end=date(2024, 1, 5)),
+    FilterSpec(start=date(2022, 1, 1), end=date(2022, 12, 31)),
+])
+def test_raw_case_heatmap_matches_the_grid_of_the_filtered_rows(raw_cases, spec, zoom):
+    heatmap = RawCaseIndex(raw_cases).heatmap(spec, zoom)
+    rows = filter_frame(raw_cases, spec)
+    lat, lon, weight = aggregate_to_grid(rows["latitude"], rows["longitude"], np.ones(len(rows)), grid_cell_size(zoom))
+    order = np.lexsort((heatmap["longitude"], heatmap["latitude"]))
+    expected = np.lexsort((lon, lat))
+    np.testing.assert_allclose(heatmap["latitude"].to_numpy()[order], lat[expected])
+    np.testing.assert_allclose(heatmap["longitude"].to_numpy()[order], lon[expected])
+    np.testing.assert_array_equal(heatmap["cases"].to_numpy()[order], weight[expected])
+
+
+def test_raw_case_heatmap_viewport(raw_cases):
+    index = RawCaseIndex(raw_cases)
+    spec = FilterSpec(start=date(2023, 12, 1), end=date(2024, 2, 28))
+    everything = index.heatmap(spec, 12)
+    assert index.heatmap(spec, 12, box=(-90, -180, 90, 180)).equals(everything)
+    assert index.heatmap(spec, 12, box=(10.0, 100.0, 11.0, 101.0)).empty
+    # Only the points of the cells inside the box
+    inside = index.heatmap(spec, 12, box=(22.99, 120.19, 23.0135, 120.2165))
+    assert 0 < inside["cases"].sum() < everything["cases"].sum()
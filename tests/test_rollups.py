@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+from rollups import ROLLUPS, build_rollups, merge_rollups, select_rollup, week_start
+
+
+def per_row_table(frame, date_column):
+    """A fixture frame as the combined CSVs spell it: text dates, some unparseable"""
+    frame = frame.copy()
+    frame["latitude"] = 23.0 + frame.index % 7 * 0.00041
+    frame["longitude"] = 120.2 + frame.index % 5 * 0.00037
+    frame[date_column] = frame[date_column].dt.strftime("%Y/%m/%d")
+    frame.loc[3::50, date_column] = "not a date"
+    return frame
+
+
+def rows_of(frame, spec):
+    """Sorted (keys..., count) tuples, missing keys spelled "" so they sort"""
+    columns = spec["keys"] + [spec["value_column"]]
+    return sorted(tuple("" if pd.isna(v) else str(v) for v in row) for row in frame[columns].to_numpy(dtype=object))
+
+
+@pytest.mark.parametrize("dataset, date_column", [("cases", "diagnosis_date"), ("spraying", "date")])
+def test_rollups_match_groupby(cases, spraying, dataset, date_column):
+    source = per_row_table(cases if dataset == "cases" else spraying, date_column)
+    rollups = build_rollups(source, dataset)
+    assert set(rollups) == {name for name, spec in ROLLUPS.items() if spec["dataset"] == dataset}
+
+    rows = source.assign(**{date_column: pd.to_datetime(source[date_column], errors="coerce")})
+    rows = rows.dropna(subset=[date_column])
+    if dataset == "cases":
+        rows[["latitude", "longitude"]] = rows[["latitude", "longitude"]].round(3)
+    rows["week_start"] = week_start(rows[date_column])
+    for name, rollup in rollups.items():
+        spec = ROLLUPS[name]
+        expected = rows.groupby(spec["keys"], dropna=False).size().reset_index(name=spec["value_column"])
+        actual = rollup.assign(**{spec["date_column"]: pd.to_datetime(rollup[spec["date_column"]])})
+        assert actual[spec["value_column"]].sum() == len(rows)
+        assert rows_of(actual, spec) == rows_of(expected, spec)
+        assert (rollup["year"] == pd.to_datetime(rollup[spec["date_column"]]).dt.year - 1911).all()
+
+
+
+@pytest.mark.parametrize("dataset, date_column", [("cases", "diagnosis_date"), ("spraying", "date")])
+def test_merged_slices_match_one_build(cases, spraying, dataset, date_column):
+    source = per_row_table(cases if dataset == "cases" else spraying, date_column)
+    # Slices cut mid-week, as year partitions are
+    cut = source.index % 3
+    merged = merge_rollups([build_rollups(source[cut == i], dataset) for i in range(3)], dataset)
+    for name, expected in build_rollups(source, dataset).items():
+        pd.testing.assert_frame_equal(merged[name], expected, check_dtype=False)
+@pytest.mark.parametrize("spatial, temporal, dataset, expected", [
+    ("location", "day", "cases", "location_day"),
+    ("neighborhood", "day", "cases", "neighborhood_day"),
+    ("city", "day", "cases", "neighborhood_day"),
+    ("area", "week", "cases", "area_week"),
+    ("city", "week", "cases", "area_week"),
+    # Weeks straddle months, so months come from a day rollup
+    ("city", "month", "cases", "neighborhood_day"),
+    ("neighborhood", "week", "cases", "neighborhood_day"),
+    ("location", "day", "spraying", "spraying_site_day"),
+    ("city", "day", "spraying", "spraying_neighborhood_day"),
+    ("city", "week", "spraying", "spraying_area_week"),
+    ("city", "month", "spraying", "spraying_neighborhood_day"),
+])
+def test_select_rollup_picks_the_coarsest_that_resolves(spatial, temporal, dataset, expected):
+    assert select_rollup(spatial, temporal, dataset) == expected
+
+
+@pytest.mark.parametrize("args", [("street", "day"), ("city", "year"), ("city", "day", "mosquito")])
+def test_select_rollup_rejects_unknown_levels(args):
+    with pytest.raises(ValueError):
+        select_rollup(*args)
@@ -0,0 +1,77 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import snapshot
+from snapshot import SnapshotStore, data_signature
+
+WATCHED = snapshot.WATCHED_FILES[0]
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Snapshots built so far; a build raises while `fail` is set"""
+    built = SimpleNamespace(snapshots=[], fail=False)
+
+    def build(data_dir, cache_dir):
+        if built.fail:
+            raise OSError("truncated file")
+        built.snapshots.append(SimpleNamespace(signature=data_signature(data_dir), version=len(built.snapshots)))
+        return built.snapshots[-1]
+
+    monkeypatch.setattr(snapshot.DatasetSnapshot, "build", staticmethod(build))
+    return built
+
+
+def touch(data_dir, text):
+    path = os.path.join(data_dir, WATCHED)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    stat = os.stat(path)
+    # Distinct mtimes even on coarse-grained filesystems
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + len(text) * 10**9))
+
+
+def test_signature_covers_only_watched_files(tmp_path):
+    assert data_signature(str(tmp_path)) == ()
+    touch(str(tmp_path), "a")
+    (tmp_path / "notes.txt").write_text("ignored")
+    assert [name for name, _, _ in data_signature(str(tmp_path))] == [WATCHED]
+
+
+def test_reloads_once_the_files_hold_still(tmp_path, builds):
+    touch(str(tmp_path), "a")
+    store = SnapshotStore(str(tmp_path), str(tmp_path / "cache"))
+    first = store.current
+    assert not store.check()
+
+    touch(str(tmp_path), "ab")
+    # The first poll only notes the change; a file still being written would change again
+    assert not store.check() and store.current is first
+    touch(str(tmp_path), "abc")
+    assert not store.check() and store.current is first
+    assert store.check()
+    assert store.current is builds.snapshots[-1] and store.current is not first
+    assert store.reloads == 1
+    assert not store.check()
+
+
+def test_a_failed_reload_keeps_the_current_snapshot(tmp_path, builds):
+    touch(str(tmp_path), "a")
+    store = SnapshotStore(str(tmp_path), str(tmp_path / "cache"))
+    first = store.current
+    builds.fail = True
+    touch(str(tmp_path), "ab")
+    store.check()
+    assert not store.check()
+    assert store.current is first and "truncated file" in store.error
+    # The same files are not retried on every poll
+    assert not store.check() and not store.check()
+    assert len(builds.snapshots) == 1
+
+    builds.fail = False
+    touch(str(tmp_path), "abc")
+    store.check()
+    assert store.check()
+    assert store.error is None and store.current is builds.snapshots[-1]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from spatial import GridIndex
+from utils import update_heatmap_data
+
+
+@pytest.fixture
+def points(rng):
+    n = 2000
+    frame = pd.DataFrame({
+        "latitude": rng.normal(23.0, 0.05, n),
+        "longitude": rng.normal(120.2, 0.05, n),
+    })
+    # Outliers far from the bulk, and rows without coordinates
+    frame.loc[:4, "latitude"] = [0.0, 25.0, 23.0, np.nan, 23.0]
+    frame.loc[:4, "longitude"] = [0.0, 121.0, np.nan, 120.2, 150.0]
+    return frame
+
+
+def brute_force(frame, south, west, north, east):
+    lat, lon = frame["latitude"].to_numpy(), frame["longitude"].to_numpy()
+    return np.flatnonzero((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east))
+
+
+BOXES = [
+    (22.98, 120.18, 23.02, 120.22),
+    (22.0, 119.0, 24.0, 121.0),
+    (-1.0, -1.0, 1.0, 1.0),
+    (24.9, 120.9, 25.1, 121.1),
+    (23.02, 120.18, 22.98, 120.22),
+    (30.0, 130.0, 31.0, 131.0),
+    (-90.0, -180.0, 90.0, 180.0),
+]
+
+
+@pytest.mark.parametrize("box", BOXES)
+def test_grid_index_query_matches_brute_force(points, box):
+    np.testing.assert_array_equal(GridIndex(points).query(*box), brute_force(points, *box))
+
+
+def test_grid_index_over_no_points():
+    empty = pd.DataFrame({"latitude": [np.nan], "longitude": [np.nan]})
+    assert len(GridIndex(empty).query(-90, -180, 90, 180)) == 0
+
+
+def bounds_of(south, west, north, east):
+    return {"_southWest": {"lat": south, "lng": west}, "_northEast": {"lat": north, "lng": east}}
+
+
+@pytest.mark.parametrize("box", BOXES[:4])
+@pytest.mark.parametrize("subset", ["all", "sorted", "shuffled"])
+def test_update_heatmap_data_with_index_matches_the_scan(points, rng, box, subset):
+    index = GridIndex(points)
+    data = points
+    if subset == "sorted":
+        data = points.iloc[np.sort(rng.choice(len(points), 700, replace=False))]
+    elif subset == "shuffled":
+        data = points.iloc[rng.permutation(len(points))[:700]]
+    bounds = bounds_of(*box)
+    expected = update_heatmap_data(data, bounds)
+    culled = update_heatmap_data(data, bounds, index)
+    assert sorted(culled.index) == sorted(expected.index)
+
+
+def test_update_heatmap_data_without_bounds_keeps_everything(points):
+    assert update_heatmap_data(points, None, GridIndex(points)) is points
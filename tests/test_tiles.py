@@ -0,0 +1,109 @@
+import os
+from datetime import date
+
+import pytest
+
+import tiles
+from tiles import tile_period, tile_url
+
+LAYER = {
+    "first_day": "2015-01-06",
+    "last_day": "2024-08-30",
+    "bounds": [[22.9, 120.1], [23.2, 120.4]],
+    "periods": ["all", "2015", "2016", "2024", "2015-01", "2015-08", "2024-08"],
+}
+MANIFEST = {"radii": [10, 25, 40], "zooms": [10, 11], "layers": {"cases": LAYER}}
+
+
+@pytest.mark.parametrize("start, end, period", [
+    (None, None, "all"),
+    (date(2010, 1, 1), date(2030, 12, 31), "all"),
+    (date(2016, 1, 1), date(2016, 12, 31), "2016"),
+    # Years and months at the ends of the data start or stop with it
+    (date(2015, 1, 6), date(2015, 12, 31), "2015"),
+    (date(2015, 1, 1), date(2015, 12, 31), "2015"),
+    (date(2024, 1, 1), date(2024, 8, 30), "2024"),
+    (date(2015, 8, 1), date(2015, 8, 31), "2015-08"),
+    (date(2024, 8, 1), date(2024, 8, 31), "2024-08"),
+    (date(2015, 1, 1), date(2015, 1, 31), "2015-01"),
+])
+def test_tile_period_of_whole_periods(start, end, period):
+    assert tile_period(LAYER, start, end) == period
+
+
+@pytest.mark.parametrize("start, end", [
+    (date(2016, 1, 1), date(2016, 12, 30)),
+    (date(2015, 8, 2), date(2015, 8, 31)),
+    (date(2015, 8, 1), date(2015, 9, 30)),
+    # Periods that were not rendered
+    (date(2017, 1, 1), date(2017, 12, 31)),
+    (date(2016, 3, 1), date(2016, 3, 31)),
+    # Windows with nothing in them
+    (date(2016, 5, 1), date(2016, 4, 1)),
+    (date(2030, 1, 1), date(2030, 12, 31)),
+])
+def test_tile_period_of_other_windows_is_none(start, end):
+    assert tile_period(LAYER, start, end) is None
+
+
+def test_tile_period_without_tiles():
+    assert tile_period(None, date(2016, 1, 1), date(2016, 12, 31)) is None
+
+
+@pytest.mark.parametrize("radius, preset", [(5, 10), (17, 10), (18, 25), (25, 25), (33, 40), (80, 40)])
+def test_tile_url_uses_the_nearest_preset_radius(radius, preset):
+    url, chosen = tile_url(MANIFEST, "cases", "2016", radius, url_root="/tiles")
+    assert chosen == preset
+    assert url == f"/tiles/cases/2016/r{preset}/{{z}}/{{x}}/{{y}}.png"
+
+
+@pytest.fixture
+def render_frames(monkeypatch, cases, spraying):
+    cases = cases.assign(latitude=23.0 + cases.index % 7 * 0.01, longitude=120.2 + cases.index % 5 * 0.01)
+    spraying = spraying.assign(latitude=23.0, longitude=120.2)
+    monkeypatch.setattr(tiles, "load_data", lambda data_dir: (cases, spraying))
+
+
+def render_small(out_dir):
+    return tiles.render(out_dir=str(out_dir), radii=[10], zooms=[10], kinds=["all"])
+
+
+def layer_dirs(out_dir):
+    return sorted(entry for entry in os.listdir(out_dir) if os.path.isdir(out_dir / entry))
+
+
+def test_render_serves_each_run_from_new_directories(render_frames, tmp_path):
+    first = render_small(tmp_path)
+    assert tiles.load_manifest(str(tmp_path)) == first
+    paths = [tiles.layer_path(first, name) for name in tiles.LAYERS]
+    assert layer_dirs(tmp_path) == sorted(paths)
+    url, _ = tile_url(first, "cases", "all", 10)
+    assert f"/{paths[0]}/all/r10/" in url
+
+    second = render_small(tmp_path)
+    newer = [tiles.layer_path(second, name) for name in tiles.LAYERS]
+    # The previous run stays for dashboards still holding its manifest
+    assert layer_dirs(tmp_path) == sorted(paths + newer)
+    third = render_small(tmp_path)
+    assert layer_dirs(tmp_path) == sorted(newer + [tiles.layer_path(third, name) for name in tiles.LAYERS])
+
+
+def test_a_failed_render_keeps_the_served_tiles(render_frames, tmp_path, monkeypatch):
+    served = render_small(tmp_path)
+    before = layer_dirs(tmp_path)
+    render_layer = tiles.render_layer
+
+    def failing(frame, name, *args):
+        if name == "spraying":
+            raise RuntimeError("disk full")
+        return render_layer(frame, name, *args)
+
+    monkeypatch.setattr(tiles, "render_layer", failing)
+    with pytest.raises(RuntimeError):
+        render_small(tmp_path)
+    assert tiles.load_manifest(str(tmp_path)) == served
+    assert layer_dirs(tmp_path) == before
+
+
+def test_manifests_without_paths_keep_layers_under_their_names():
+    assert tiles.layer_path(MANIFEST, "cases") == "cases"
@@ -0,0 +1,363 @@
+"""Render the cases and spraying heatmaps offline into XYZ tile pyramids.
+
+Point weights are binned per map pixel and smoothed with a Gaussian kernel,
+one layer per dataset, period (the whole history, each year and each month)
+and preset radius. The dashboard shows the layers through a folium TileLayer
+served from Streamlit's static folder, so a full-history view costs the same
+as a single week:
+
+    python tiles.py
+    python tiles.py --periods all year --radii 10 25 40 --zooms 8 9 10 11 12 13
+"""
+import argparse
+import calendar
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from dataset import DATA_DIR, load_data
+
+TILES_DIR = os.path.join("static", "tiles")
+# Where Streamlit serves the static folder (server.enableStaticServing)
+TILES_URL = "/app/static/tiles"
+MANIFEST_NAME = "manifest.json"
+EMPTY_TILE = "empty.png"
+
+TILE_SIZE = 256
+# Web Mercator stops at this latitude
+MAX_LATITUDE = 85.05112878
+DEFAULT_RADII = [10, 25, 40]
+DEFAULT_ZOOMS = list(range(8, 14))
+PERIOD_KINDS = ["all", "year", "month"]
+
+LAYERS = {
+    "cases": {"weight_column": "cases", "date_column": "diagnosis_date"},
+    "spraying": {"weight_column": "spray_count", "date_column": "date"},
+}
+
+# The dashboard's heatmap gradient: blue, more opaque where denser. A density of 1
+# is the peak of one unit-weight point, and below MIN_DENSITY pixels stay clear.
+GRADIENT_STOPS = [(0.0, 0.2), (0.4, 0.2), (0.65, 0.5), (0.9, 0.8), (1.0, 0.8)]
+MIN_DENSITY = 0.02
+
+
+# ========================================== Rendering ==========================================
+def pixel_coordinates(lat, lon, zoom):
+    """Global Web Mercator pixel coordinates of points at a zoom level"""
+    scale = TILE_SIZE * 2.0 ** zoom
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0 * scale
+    sin = np.sin(np.radians(np.asarray(lat, dtype=np.float64)))
+    y = (0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)) * scale
+    return x, y
+
+
+def kernel_margin(radius):
+    """Pixels a point's kernel reaches past its own: four standard deviations.
+
+    Dense clusters sum many tails, so a shorter cut would show as square edges.
+    """
+    return int(np.ceil(2 * radius))
+
+
+def gaussian_band(radius):
+    """Band matrix smoothing one axis of a padded tile with a Gaussian of sigma `radius / 2`.
+
+    Shaped (TILE_SIZE, TILE_SIZE + 2 * margin): it maps the padded grid back to the tile.
+    """
+    margin = kernel_margin(radius)
+    offsets = np.arange(TILE_SIZE + 2 * margin)[None, :] - margin - np.arange(TILE_SIZE)[:, None]
+    band = np.exp(-0.5 * (offsets / (radius / 2)) ** 2)
+    band[np.abs(offsets) > margin] = 0.0
+    return band.astype(np.float32)
+
+
+def density_tiles(x, y, weights, radius, batch=64):
+    """Smoothed density of every tile the points reach, as `((tx, ty), density)` pairs.
+
+    Each point is binned into the padded pixel grid of every tile within a kernel
+    margin of it, and each batch of grids is smoothed with two band matrix products.
+    Like Leaflet.heat's cells, a pixel holds a weight of at most 1, so a single
+    heavy location does not flood its whole kernel.
+    """
+    margin = kernel_margin(radius)
+    padded = TILE_SIZE + 2 * margin
+    px = np.floor(x).astype(np.int64)
+    py = np.floor(y).astype(np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    # The margin is under a tile, so a point reaches at most two tiles per axis
+    tiles, cells, values = [], [], []
+    for dx in (0, 1):
+        for dy in (0, 1):
+            tx = (px - margin) // TILE_SIZE + dx
+            ty = (py - margin) // TILE_SIZE + dy
+            local_x = px - tx * TILE_SIZE + margin
+            local_y = py - ty * TILE_SIZE + margin
+            inside = (local_x >= 0) & (local_x < padded) & (local_y >= 0) & (local_y < padded)
+            tiles.append(np.column_stack([tx[inside], ty[inside]]))
+            cells.append(local_y[inside] * padded + local_x[inside])
+            values.append(weights[inside])
+    tiles, cells, values = np.concatenate(tiles), np.concatenate(cells), np.concatenate(values)
+    if not len(cells):
+        return
+
+    keys, tile_of = np.unique(tiles, axis=0, return_inverse=True)
+    tile_of = tile_of.ravel()
+    order = np.argsort(tile_of, kind="stable")
+    tile_of, cells, values = tile_of[order], cells[order], values[order]
+    starts = np.searchsorted(tile_of, np.arange(len(keys) + 1))
+
+    band = gaussian_band(radius)
+    for first in range(0, len(keys), batch):
+        last = min(first + batch, len(keys))
+        lo, hi = starts[first], starts[last]
+        grids = np.bincount(
+            (tile_of[lo:hi] - first) * padded * padded + cells[lo:hi],
+            weights=values[lo:hi],
+            minlength=(last - first) * padded * padded,
+        ).clip(max=1.0).astype(np.float32).reshape(last - first, padded, padded)
+        smoothed = band @ grids @ band.T
+        for i in range(last - first):
+            yield tuple(int(v) for v in keys[first + i]), smoothed[i]
+
+
+def _alpha_table():
+    levels = np.arange(256) / 255
+    stops, alphas = zip(*GRADIENT_STOPS)
+    table = np.round(np.interp(levels, stops, alphas) * 255).astype(np.uint8)
+    table[levels < MIN_DENSITY] = 0
+    return table
+
+
+ALPHA_TABLE = _alpha_table()
+
+
+def colorize(density):
+    """RGBA pixels of a density tile in the dashboard's gradient"""
+    level = np.round(np.clip(density, 0.0, 1.0) * 255).astype(np.uint8)
+    rgba = np.zeros(density.shape + (4,), dtype=np.uint8)
+    rgba[..., 2] = 255
+    rgba[..., 3] = ALPHA_TABLE[level]
+    return rgba
+
+
+def write_tiles(x, y, weights, radius, out_dir):
+    """Write the visible tiles of one zoom level as `out_dir/{x}/{y}.png`; returns how many"""
+    written = 0
+    for (tx, ty), density in density_tiles(x, y, weights, radius):
+        rgba = colorize(density)
+        if not rgba[..., 3].any():
+            continue
+        tile_dir = os.path.join(out_dir, str(tx))
+        os.makedirs(tile_dir, exist_ok=True)
+        Image.fromarray(rgba).save(os.path.join(tile_dir, f"{ty}.png"))
+        written += 1
+    return written
+
+
+def heatmap_image(lat, lon, weights, radius, zoom, max_tiles=8):
+    """A heatmap as one white-backed image: its tiles stitched over the bulk of the points.
+
+    The zoom is lowered until the bulk fits in `max_tiles` tiles per side; outlying
+    points are cut off at the edges. Returns the image and the zoom it was drawn at.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= MAX_LATITUDE) & (np.abs(lon) <= 180) & (weights > 0)
+    lat, lon, weights = lat[valid], lon[valid], weights[valid]
+    if not len(lat):
+        return None, zoom
+
+    margin = kernel_margin(radius)
+    while True:
+        x, y = pixel_coordinates(lat, lon, zoom)
+        (x0, x1), (y0, y1) = np.quantile(x, [0.005, 0.995]), np.quantile(y, [0.005, 0.995])
+        tx0, tx1 = int((x0 - margin) // TILE_SIZE), int((x1 + margin) // TILE_SIZE)
+        ty0, ty1 = int((y0 - margin) // TILE_SIZE), int((y1 + margin) // TILE_SIZE)
+        if max(tx1 - tx0, ty1 - ty0) < max_tiles or zoom == 0:
+            break
+        zoom -= 1
+
+    # Only points whose kernel reaches the stitched tiles are binned
+    near = (
+        (x >= tx0 * TILE_SIZE - margin) & (x < (tx1 + 1) * TILE_SIZE + margin)
+        & (y >= ty0 * TILE_SIZE - margin) & (y < (ty1 + 1) * TILE_SIZE + margin)
+    )
+    canvas = np.zeros(((ty1 - ty0 + 1) * TILE_SIZE, (tx1 - tx0 + 1) * TILE_SIZE), dtype=np.float32)
+    for (tx, ty), density in density_tiles(x[near], y[near], weights[near], radius):
+        if tx0 <= tx <= tx1 and ty0 <= ty <= ty1:
+            row, col = (ty - ty0) * TILE_SIZE, (tx - tx0) * TILE_SIZE
+            canvas[row : row + TILE_SIZE, col : col + TILE_SIZE] = density
+    heat = Image.fromarray(colorize(canvas))
+    return Image.alpha_composite(Image.new("RGBA", heat.size, "white"), heat), zoom
+
+
+# ========================================== Layers ==========================================
+def period_masks(dates, kinds=PERIOD_KINDS):
+    """`(key, mask)` of every period of the dates: "all", each year ("2015") and each month ("2015-08")"""
+    if "all" in kinds:
+        yield "all", np.ones(len(dates), dtype=bool)
+    if "year" in kinds:
+        years = dates.dt.year.to_numpy()
+        for year in np.unique(years):
+            yield str(year), years == year
+    if "month" in kinds:
+        months = dates.dt.strftime("%Y-%m").to_numpy()
+        for month in np.unique(months):
+            yield month, months == month
+
+
+def render_layer(frame, name, out_dir, path, radii, zooms, kinds):
+    """Render one dataset's pyramids under the new directory `out_dir/path`; returns its manifest entry"""
+    spec = LAYERS[name]
+    lat = frame["latitude"].to_numpy(dtype=np.float64)
+    lon = frame["longitude"].to_numpy(dtype=np.float64)
+    weights = frame[spec["weight_column"]].to_numpy(dtype=np.float64, na_value=0.0)
+    dates = frame[spec["date_column"]]
+    valid = (
+        np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= MAX_LATITUDE) & (np.abs(lon) <= 180)
+        & (weights > 0) & dates.notna().to_numpy()
+    )
+    lat, lon, weights, dates = lat[valid], lon[valid], weights[valid], dates[valid].reset_index(drop=True)
+
+    layer_dir = os.path.join(out_dir, path)
+    layer = {
+        "path": path,
+        "first_day": dates.min().date().isoformat(),
+        "last_day": dates.max().date().isoformat(),
+        "bounds": [[float(lat.min()), float(lon.min())], [float(lat.max()), float(lon.max())]],
+        "periods": [],
+    }
+    for key, mask in period_masks(dates, kinds):
+        started = time.perf_counter()
+        written = 0
+        for zoom in zooms:
+            x, y = pixel_coordinates(lat[mask], lon[mask], zoom)
+            for radius in radii:
+                written += write_tiles(x, y, weights[mask], radius, os.path.join(layer_dir, key, f"r{radius}", str(zoom)))
+        layer["periods"].append(key)
+        print(f"{name} {key}: {written} tiles in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    return layer
+
+
+def layer_path(manifest, name):
+    """Directory of a manifest layer under the tiles root; older manifests kept it at the layer's name"""
+    return manifest["layers"][name].get("path", name)
+
+
+def prune_layers(out_dir, keep):
+    """Remove the layer directories of earlier renders, except those in `keep`"""
+    for entry in os.listdir(out_dir):
+        if entry.partition("-")[0] in LAYERS and entry not in keep and os.path.isdir(os.path.join(out_dir, entry)):
+            shutil.rmtree(os.path.join(out_dir, entry), ignore_errors=True)
+
+
+def render(data_dir=DATA_DIR, out_dir=TILES_DIR, radii=DEFAULT_RADII, zooms=DEFAULT_ZOOMS, kinds=PERIOD_KINDS):
+    """Render every layer and write the manifest the dashboard reads.
+
+    Each run renders into new `<layer>-<timestamp>` directories next to the
+    ones being served, and the manifest swap switches the dashboard over in one
+    step; a failed run leaves the served tiles and manifest untouched. The
+    previous run's directories are kept for dashboards still holding its
+    manifest, and older ones removed.
+    """
+    cases, spraying = load_data(data_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    Image.new("RGBA", (1, 1)).save(os.path.join(out_dir, EMPTY_TILE))
+    previous = load_manifest(out_dir)
+    generated_at = datetime.now(timezone.utc)
+    stamp = generated_at.strftime("%Y%m%dT%H%M%S%fZ")
+    paths = {name: f"{name}-{stamp}" for name in LAYERS}
+    try:
+        manifest = {
+            "generated_at": generated_at.isoformat(timespec="seconds"),
+            "radii": sorted(radii),
+            "zooms": sorted(zooms),
+            "layers": {
+                "cases": render_layer(cases, "cases", out_dir, paths["cases"], radii, zooms, kinds),
+                "spraying": render_layer(spraying, "spraying", out_dir, paths["spraying"], radii, zooms, kinds),
+            },
+        }
+    except BaseException:
+        for path in paths.values():
+            shutil.rmtree(os.path.join(out_dir, path), ignore_errors=True)
+        raise
+    # Written last and swapped in, so the dashboard never reads a half-rendered manifest
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+    keep = set(paths.values())
+    if previous is not None:
+        keep |= {layer_path(previous, name) for name in previous.get("layers", {})}
+    prune_layers(out_dir, keep)
+    return manifest
+
+
+# ========================================== Lookup ==========================================
+def load_manifest(tiles_dir=TILES_DIR):
+    """The manifest of the rendered tiles, or None when none were rendered"""
+    try:
+        with open(os.path.join(tiles_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def tile_period(layer, start=None, end=None):
+    """The period of a manifest layer showing exactly the inclusive date window, or None.
+
+    The window is clipped to the layer's data first, so "Total" over every date
+    is the whole history and a year's window may start or end with the data.
+    """
+    if layer is None:
+        return None
+    first, last = date.fromisoformat(layer["first_day"]), date.fromisoformat(layer["last_day"])
+    start = first if start is None else max(pd.Timestamp(start).date(), first)
+    end = last if end is None else min(pd.Timestamp(end).date(), last)
+    if start > end:
+        return None
+
+    month_end = date(start.year, start.month, calendar.monthrange(start.year, start.month)[1])
+    candidates = [
+        ("all", first, last),
+        (str(start.year), date(start.year, 1, 1), date(start.year, 12, 31)),
+        (f"{start.year}-{start.month:02d}", date(start.year, start.month, 1), month_end),
+    ]
+    for key, period_start, period_end in candidates:
+        if key in layer["periods"] and (max(period_start, first), min(period_end, last)) == (start, end):
+            return key
+    return None
+
+
+def tile_url(manifest, name, period, radius, url_root=TILES_URL):
+    """XYZ URL template of a layer at the preset radius nearest `radius`, and that radius"""
+    preset = min(manifest["radii"], key=lambda r: (abs(r - radius), r))
+    return f"{url_root}/{layer_path(manifest, name)}/{period}/r{preset}/{{z}}/{{x}}/{{y}}.png", preset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=DATA_DIR, help="directory holding the dashboard CSVs")
+    parser.add_argument("--output", default=TILES_DIR, help="directory the tiles and manifest are written to")
+    parser.add_argument("--radii", type=int, nargs="+", default=DEFAULT_RADII, help="heatmap radii in pixels")
+    parser.add_argument("--zooms", type=int, nargs="+", default=DEFAULT_ZOOMS, help="zoom levels to render")
+    parser.add_argument("--periods", nargs="+", choices=PERIOD_KINDS, default=PERIOD_KINDS, help="periods to render")
+    args = parser.parse_args(argv)
+    if kernel_margin(max(args.radii)) >= TILE_SIZE:
+        parser.error(f"radii must stay under {TILE_SIZE // 2} pixels")
+    render(args.data, args.output, args.radii, args.zooms, args.periods)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
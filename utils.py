@@ -1,19 +1,53 @@
-import pandas as pd
+import numpy as np
 
-def update_heatmap_data(data, bounds):
-    if bounds:
-        sw_lat = bounds['_southWest']['lat']
-        sw_lng = bounds['_southWest']['lng']
-        ne_lat = bounds['_northEast']['lat']
-        ne_lng = bounds['_northEast']['lng']
-        data = data[(data['latitude'] >= sw_lat) & (data['latitude'] <= ne_lat) &
-                    (data['longitude'] >= sw_lng) & (data['longitude'] <= ne_lng)]
-    return data
+from query import FilterSpec, filter_frame
+
+def bounds_box(bounds, margin=0.0):
+    """(south, west, north, east) of st_folium bounds, padded by a fraction of their span"""
+    sw_lat = bounds['_southWest']['lat']
+    sw_lng = bounds['_southWest']['lng']
+    ne_lat = bounds['_northEast']['lat']
+    ne_lng = bounds['_northEast']['lng']
+    lat_pad = (ne_lat - sw_lat) * margin
+    lng_pad = (ne_lng - sw_lng) * margin
+    return sw_lat - lat_pad, sw_lng - lng_pad, ne_lat + lat_pad, ne_lng + lng_pad
+
+def recenter_bounds(bounds, bounds_zoom, center, zoom):
+    """Move st_folium bounds reported at one view to the same screen size at another center/zoom"""
+    scale = 2.0 ** (bounds_zoom - zoom)
+    half_lat = (bounds['_northEast']['lat'] - bounds['_southWest']['lat']) * scale / 2
+    half_lng = (bounds['_northEast']['lng'] - bounds['_southWest']['lng']) * scale / 2
+    return {
+        '_southWest': {'lat': center[0] - half_lat, 'lng': center[1] - half_lng},
+        '_northEast': {'lat': center[0] + half_lat, 'lng': center[1] + half_lng},
+    }
+
+def update_heatmap_data(data, bounds, index=None, margin=0.5):
+    """Keep the rows inside the map bounds (plus a margin).
+
+    With a `spatial.GridIndex` built over the full frame, `data` may be any
+    subset of that frame that still carries its positional index labels.
+    """
+    if not bounds:
+        return data
+    south, west, north, east = bounds_box(bounds, margin)
+    if index is None:
+        return data[(data['latitude'] >= south) & (data['latitude'] <= north) &
+                    (data['longitude'] >= west) & (data['longitude'] <= east)]
+
+    positions = index.query(south, west, north, east)
+    labels = data.index.to_numpy()
+    if not data.index.is_monotonic_increasing:
+        return data[data.index.isin(positions)]
+    # Both sides are sorted, so matching the hits against the subset is a binary search
+    loc = np.searchsorted(labels, positions)
+    found = loc < len(labels)
+    loc, positions = loc[found], positions[found]
+    return data.iloc[loc[labels[loc] == positions]]
 
 def filter_data(data, selected_year, selected_date_range, selected_neighborhoods):
-    filtered_data = data[data['year'] == selected_year] if selected_year != 'Total' else data
-    filtered_data = filtered_data[(pd.to_datetime(filtered_data['diagnosis_date']) >= selected_date_range[0]) & 
-                                  (pd.to_datetime(filtered_data['diagnosis_date']) <= selected_date_range[1])]
-    if 'All' not in selected_neighborhoods:
-        filtered_data = filtered_data[filtered_data['neighborhood'].isin(selected_neighborhoods)]
-    return filtered_data
+    spec = FilterSpec.from_sidebar(
+        selected_year, 'Date Range', selected_date_range[0], selected_date_range[1],
+        selected_neighborhoods=selected_neighborhoods, filter_by_neighborhood=True,
+    )
+    return filter_frame(data, spec)